@@ -0,0 +1,40 @@
+"""create outbox table
+
+Revision ID: 3f9c2a7d1b64
+Revises: 8d80b06128f0
+Create Date: 2026-10-18 09:12:31.406215
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f9c2a7d1b64"
+down_revision: Union[str, None] = "8d80b06128f0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Order events waiting to be relayed to RabbitMQ, rows are deleted
+    # once the broker confirms them
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.Integer(), nullable=False, autoincrement=True),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_outbox")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("outbox")
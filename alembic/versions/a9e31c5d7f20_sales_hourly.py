@@ -0,0 +1,37 @@
+"""sales hourly rollups
+
+Revision ID: a9e31c5d7f20
+Revises: f7d2a9c81e35
+Create Date: 2026-10-18 20:14:05.903117
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a9e31c5d7f20"
+down_revision: Union[str, None] = "f7d2a9c81e35"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by new orders, backfill the existing ones with
+    # `python -m app.sales`
+    op.create_table(
+        "sales_hourly",
+        sa.Column("hour", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("category", sa.Integer(), nullable=True),
+        sa.Column("units", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("hour", "item_id", name=op.f("pk_sales_hourly")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("sales_hourly")
@@ -0,0 +1,51 @@
+"""add lookup indexes
+
+Revision ID: b71e4c09d2a5
+Revises: 3f9c2a7d1b64
+Create Date: 2026-10-18 14:02:47.118930
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b71e4c09d2a5"
+down_revision: Union[str, None] = "3f9c2a7d1b64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently so existing tables keep taking writes
+    with op.get_context().autocommit_block():
+        # Order lookups by cart id (update_order, bulk update)
+        op.create_index(
+            op.f("ix_order_mongo_id"),
+            "order",
+            ["mongo_id"],
+            postgresql_concurrently=True,
+        )
+
+        # Orders by status (kitchen queue)
+        op.create_index(
+            op.f("ix_order_status"),
+            "order",
+            ["status"],
+            postgresql_concurrently=True,
+        )
+
+        # Menu listing by category, ordered by id
+        op.create_index(
+            op.f("ix_items_category"),
+            "items",
+            ["category", "id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_items_category"), table_name="items")
+    op.drop_index(op.f("ix_order_status"), table_name="order")
+    op.drop_index(op.f("ix_order_mongo_id"), table_name="order")
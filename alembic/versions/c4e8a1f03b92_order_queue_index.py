@@ -0,0 +1,41 @@
+"""order queue index
+
+Revision ID: c4e8a1f03b92
+Revises: b71e4c09d2a5
+Create Date: 2026-10-18 16:21:05.402117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e8a1f03b92"
+down_revision: Union[str, None] = "b71e4c09d2a5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently so existing tables keep taking writes
+    with op.get_context().autocommit_block():
+        # Kitchen queue: orders of a status ordered by id (keyset pages)
+        op.create_index(
+            op.f("ix_order_status_id"),
+            "order",
+            ["status", "id"],
+            postgresql_concurrently=True,
+        )
+
+        # Covered by the leading column of the new index
+        op.drop_index(
+            op.f("ix_order_status"),
+            table_name="order",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.create_index(op.f("ix_order_status"), "order", ["status"])
+    op.drop_index(op.f("ix_order_status_id"), table_name="order")
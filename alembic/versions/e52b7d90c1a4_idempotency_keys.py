@@ -0,0 +1,65 @@
+"""idempotency keys
+
+Revision ID: e52b7d90c1a4
+Revises: c4e8a1f03b92
+Create Date: 2026-10-18 17:48:12.905331
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e52b7d90c1a4"
+down_revision: Union[str, None] = "c4e8a1f03b92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Stored responses of requests sent with an Idempotency-Key, the
+    # status and response are empty while the first request runs
+    op.create_table(
+        "idempotency_key",
+        sa.Column("scope", sa.String(length=40), nullable=False),
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=True),
+        sa.Column("response", sa.Text(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.PrimaryKeyConstraint("scope", "key", name=op.f("pk_idempotency_key")),
+    )
+
+    # One order per cart. Fails if retries already created duplicates,
+    # find them with:
+    #   SELECT mongo_id FROM "order" GROUP BY mongo_id HAVING count(*) > 1
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_order_mongo_id_unique",
+            "order",
+            ["mongo_id"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            op.f("ix_order_mongo_id"),
+            table_name="order",
+            postgresql_concurrently=True,
+        )
+        op.execute(
+            "ALTER INDEX ix_order_mongo_id_unique RENAME TO ix_order_mongo_id"
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_order_mongo_id"), table_name="order")
+    op.create_index(op.f("ix_order_mongo_id"), "order", ["mongo_id"])
+    op.drop_table("idempotency_key")
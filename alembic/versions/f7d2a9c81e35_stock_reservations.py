@@ -0,0 +1,48 @@
+"""stock reservations
+
+Revision ID: f7d2a9c81e35
+Revises: e52b7d90c1a4
+Create Date: 2026-10-18 19:02:37.518224
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f7d2a9c81e35"
+down_revision: Union[str, None] = "e52b7d90c1a4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Stock taken at checkout, deleted when the cart is ordered or given
+    # back once it expires
+    op.create_table(
+        "stock_reservation",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("items", sa.Text(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_stock_reservation")),
+    )
+    op.create_index(
+        op.f("ix_stock_reservation_created_at"),
+        "stock_reservation",
+        ["created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_stock_reservation_created_at"), table_name="stock_reservation"
+    )
+    op.drop_table("stock_reservation")
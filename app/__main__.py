@@ -0,0 +1,87 @@
+"""
+Production server.
+
+Runs the app on uvicorn with `workers_count` worker processes (one by
+default, 0 for one per available CPU), uvloop and httptools when they are
+installed and the listen backlog and keep-alive from settings.
+
+Workers are spawned, not forked: each one imports the app itself and opens
+its own database pools, MongoDB client and RabbitMQ connection. This process
+only binds the socket and supervises them.
+
+Usage::
+
+    python -m app
+"""
+
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+from . import config
+
+
+conf_settings = config.get_settings()
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    """
+    Worker processes to start.
+    """
+    if conf_settings.reload:
+        return 1
+
+    return conf_settings.workers_count or available_cpus()
+
+
+def server_options(workers: int) -> dict:
+    """
+    uvicorn options from settings.
+
+    :param workers: Worker processes.
+    """
+    return {
+        "host": conf_settings.host,
+        "port": conf_settings.port,
+        "workers": workers,
+        "reload": conf_settings.reload,
+        "loop": conf_settings.server_loop,
+        "http": conf_settings.server_http,
+        "backlog": conf_settings.server_backlog,
+        "timeout_keep_alive": conf_settings.server_keepalive,
+        "timeout_graceful_shutdown": conf_settings.server_graceful_timeout,
+        "proxy_headers": True,
+    }
+
+
+def main():
+    workers = worker_count()
+    metrics_dir = None
+
+    # Workers keep their own metrics, share them through files so any
+    # worker serving /metrics reports the whole server
+    if workers > 1 and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        metrics_dir = tempfile.mkdtemp(prefix="food-orders-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+    try:
+        uvicorn.run("app.main:app", **server_options(workers))
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
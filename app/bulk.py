@@ -0,0 +1,305 @@
+"""
+Streaming bulk import of customers and menu items.
+
+Usage::
+
+    python -m app.bulk customers customers.csv
+    python -m app.bulk items items.ndjson --format ndjson
+
+Records are validated with the same schemas as the register endpoints,
+categories are resolved from the lookup tables, and rows are written with
+one batched `executemany` INSERT per chunk, each chunk in its own
+transaction. Invalid records and rejected chunks are reported per line
+without stopping the import, rows registered concurrently are skipped and
+reported apart.
+"""
+
+import argparse
+import csv
+import json
+import sys
+from typing import Callable, Iterable, Iterator, NamedTuple, Tuple
+
+from loguru import logger
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import config, database
+from app.lookups import LookupRegistry
+from app.models.customer import Customer as CustomerModel
+from app.models.items import Items as ItemsModel
+from app.schemas.bulk import BulkFormatEnum, BulkKindEnum
+from app.schemas.customer import CustomerRegister
+from app.schemas.items import ItemRegister
+
+
+conf_settings = config.get_settings()
+
+# Errors kept in the report, the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class BulkTarget(NamedTuple):
+    schema: type[BaseModel]
+    model: type
+    to_row: Callable[[BaseModel, LookupRegistry], dict]
+    unique: str | None = None
+
+
+TARGETS = {
+    BulkKindEnum.customers: BulkTarget(
+        schema=CustomerRegister,
+        model=CustomerModel,
+        to_row=lambda customer, lookups: customer.model_dump(),
+        unique="cpf",
+    ),
+    BulkKindEnum.items: BulkTarget(
+        schema=ItemRegister,
+        model=ItemsModel,
+        to_row=lambda item, lookups: {
+            **item.model_dump(),
+            "category": lookups.items_category.id_of(item.category),
+        },
+    ),
+}
+
+
+def iter_records(
+    lines: Iterable[str], fmt: BulkFormatEnum
+) -> Iterator[Tuple[int, dict | Exception]]:
+    """
+    Parse input lines into records.
+
+    :param lines: Input lines, CSV with a header row or NDJSON.
+    :param fmt: Input format.
+    :returns: (line number, record or parse error) pairs.
+    """
+    if fmt == BulkFormatEnum.csv:
+        reader = csv.DictReader(lines)
+        for record in reader:
+            if None in record:
+                yield reader.line_num, ValueError("Too many columns")
+            else:
+                # Short rows leave the missing columns out, not None
+                yield reader.line_num, {
+                    key: value for key, value in record.items() if value is not None
+                }
+        return
+
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as exc:
+            yield line_num, exc
+
+
+def _describe(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+def _skips_conflicts(db_session: Session, target: BulkTarget) -> bool:
+    return bool(target.unique) and db_session.get_bind().dialect.name in (
+        "postgresql",
+        "sqlite",
+    )
+
+
+def _insert_statement(db_session: Session, target: BulkTarget):
+    table = target.model.__table__
+
+    # Rows registered concurrently must not reject the whole chunk, the
+    # inserted ones are told apart by the returned keys
+    if _skips_conflicts(db_session, target):
+        dialect = db_session.get_bind().dialect.name
+        module = postgresql if dialect == "postgresql" else sqlite
+        return (
+            module.insert(table)
+            .on_conflict_do_nothing(index_elements=[target.unique])
+            .returning(table.c[target.unique])
+        )
+
+    return insert(table)
+
+
+class BulkImport:
+    """
+    Import a stream of records into one table.
+    """
+
+    def __init__(
+        self,
+        db_session: Session,
+        kind: BulkKindEnum,
+        lookups: LookupRegistry,
+        chunk_size: int = None,
+    ):
+        self.db_session = db_session
+        self.kind = kind
+        self.target = TARGETS[kind]
+        self.lookups = lookups
+        self.chunk_size = chunk_size or conf_settings.bulk_chunk_size
+        self.statement = _insert_statement(db_session, self.target)
+        self.skips_conflicts = _skips_conflicts(db_session, self.target)
+
+        self.received = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+
+    def _report_error(self, line: int, error: str):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def fail(self, line: int, error: str):
+        self.failed += 1
+        self._report_error(line, error)
+
+    def skip(self, line: int, error: str):
+        self.skipped += 1
+        self._report_error(line, error)
+
+    def run(self, records: Iterable[Tuple[int, dict | Exception]]) -> dict:
+        """
+        Validate and write every record.
+
+        :param records: (line number, record or parse error) pairs.
+        :returns: Import report.
+        """
+        self.lookups.ensure_loaded(self.db_session)
+        chunk = []
+
+        for line, record in records:
+            self.received += 1
+
+            if isinstance(record, Exception):
+                self.fail(line, f"Invalid record: {record}")
+                continue
+
+            try:
+                row = self.target.to_row(
+                    self.target.schema.model_validate(record), self.lookups
+                )
+            except ValidationError as exc:
+                self.fail(line, _describe(exc))
+                continue
+
+            chunk.append((line, row))
+            if len(chunk) >= self.chunk_size:
+                self.write(chunk)
+                chunk = []
+
+        if chunk:
+            self.write(chunk)
+
+        return self.report()
+
+    def write(self, chunk: list):
+        """
+        Insert a chunk of rows in a single transaction.
+
+        :param chunk: (line number, row) pairs.
+        """
+        if self.target.unique:
+            chunk = self._skip_duplicates(chunk)
+            if not chunk:
+                return
+
+        try:
+            result = self.db_session.execute(
+                self.statement, [row for _, row in chunk]
+            )
+            # Rows skipped by ON CONFLICT DO NOTHING return no key
+            inserted = set(result.scalars()) if self.skips_conflicts else None
+            self.db_session.commit()
+        except SQLAlchemyError as exc:
+            self.db_session.rollback()
+            error = str(getattr(exc, "orig", None) or exc).splitlines()[0]
+            for line, _ in chunk:
+                self.fail(line, f"Chunk rejected: {error}")
+            return
+
+        if inserted is None:
+            self.inserted += len(chunk)
+            return
+
+        unique = self.target.unique
+        for line, row in chunk:
+            if row[unique] in inserted:
+                self.inserted += 1
+            else:
+                self.skip(line, f"{unique} {row[unique]} registered concurrently")
+
+    def _skip_duplicates(self, chunk: list) -> list:
+        unique = self.target.unique
+        column = getattr(self.target.model, unique)
+        keys = [row[unique] for _, row in chunk]
+        existing = set(
+            self.db_session.scalars(select(column).where(column.in_(keys)))
+        )
+
+        rows = []
+        for line, row in chunk:
+            key = row[unique]
+            if key in existing:
+                self.fail(line, f"{unique} {key} already registered")
+                continue
+            existing.add(key)
+            rows.append((line, row))
+
+        return rows
+
+    def report(self) -> dict:
+        return {
+            "kind": self.kind,
+            "received": self.received,
+            "inserted": self.inserted,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("kind", choices=[kind.value for kind in BulkKindEnum])
+    parser.add_argument("path", help="input file, - for stdin")
+    parser.add_argument(
+        "--format", choices=[fmt.value for fmt in BulkFormatEnum], default="csv"
+    )
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    source = (
+        sys.stdin
+        if args.path == "-"
+        else open(args.path, newline="", encoding="utf-8")
+    )
+
+    with source, database.SessionLocal() as db_session:
+        report = BulkImport(
+            db_session,
+            BulkKindEnum(args.kind),
+            LookupRegistry(),
+            chunk_size=args.chunk_size,
+        ).run(iter_records(source, BulkFormatEnum(args.format)))
+
+    for error in report["errors"]:
+        logger.warning("Line {}: {}", error["line"], error["error"])
+
+    logger.info(
+        "{} {} imported, {} skipped, {} failed of {}",
+        report["inserted"],
+        args.kind,
+        report["skipped"],
+        report["failed"],
+        report["received"],
+    )
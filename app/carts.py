@@ -0,0 +1,281 @@
+"""
+Order carts.
+
+Checkout stores every cart in `orders_cart` with an `expires_at` date,
+and a TTL index deletes the carts that are never ordered once it passes.
+Creating the order reads the order fields of its cart, then clears
+`expires_at` and sets `ordered_at` once the order is committed, so a cart
+whose order failed still expires. `CartArchiver` later moves ordered carts
+to `orders_cart_archive`, so the hot collection only holds recent carts.
+Reads by id fall back to the archive.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from loguru import logger
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app import config
+from app.mongo import Mongo, write_concern
+
+
+conf_settings = config.get_settings()
+
+CART_INDEXES = [
+    IndexModel([("customer_id", ASCENDING)], name="customer_id"),
+    IndexModel([("created_at", ASCENDING)], name="created_at"),
+    # Unpaid carts are deleted by the server once `expires_at` is past
+    IndexModel(
+        [("expires_at", ASCENDING)], name="expires_at", expireAfterSeconds=0
+    ),
+    # Only ordered carts wait for the archive step
+    IndexModel(
+        [("ordered_at", ASCENDING)],
+        name="ordered_at",
+        partialFilterExpression={"ordered_at": {"$exists": True}},
+    ),
+]
+
+# Fields an order reads from its cart
+ORDER_FIELDS = {"customer_id": 1, "items": 1, "total": 1, "reservation_id": 1}
+
+DUPLICATE_KEY = 11000
+
+
+class CartRepository:
+    """
+    Order carts stored in the `orders_cart` collection.
+    """
+
+    def __init__(self, mongo: Mongo):
+        self.collection = mongo.db.get_collection(
+            "orders_cart", write_concern=write_concern()
+        )
+        self.archive = mongo.db.get_collection(
+            "orders_cart_archive", write_concern=write_concern()
+        )
+
+    async def ensure_indexes(self) -> list:
+        """
+        Create the cart indexes, a no-op when they already exist.
+        """
+        return await self.collection.create_indexes(CART_INDEXES)
+
+    async def create(self, cart: dict) -> str:
+        """
+        Store a new cart, deleted after `cart_ttl` seconds unless ordered.
+
+        :param cart: Cart document.
+        :returns: Cart id.
+        """
+        now = datetime.now(timezone.utc)
+        document = {
+            **cart,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=conf_settings.cart_ttl),
+        }
+        result = await self.collection.insert_one(document)
+
+        return str(result.inserted_id)
+
+    async def get(self, cart_id: str) -> dict | None:
+        """
+        Get a cart by id.
+
+        :param cart_id: Cart id.
+        :returns: Cart document, None when it does not exist.
+        """
+        try:
+            object_id = ObjectId(cart_id)
+        except (InvalidId, TypeError):
+            return None
+
+        return await self.collection.find_one({"_id": object_id})
+
+    async def get_order(self, cart_id: str) -> dict | None:
+        """
+        Get the fields an order needs from a cart, archived or not.
+
+        :param cart_id: Cart id.
+        :returns: Cart `ORDER_FIELDS`, None when it does not exist.
+        """
+        try:
+            object_id = ObjectId(cart_id)
+        except (InvalidId, TypeError):
+            return None
+
+        cart = await self.collection.find_one(
+            {"_id": object_id}, projection=ORDER_FIELDS
+        )
+        if cart is None:
+            cart = await self.archive.find_one(
+                {"_id": object_id}, projection=ORDER_FIELDS
+            )
+
+        return cart
+
+    async def mark_ordered(self, cart_id: str) -> bool:
+        """
+        Stop the expiry of a cart, once its order is committed.
+
+        :param cart_id: Cart id.
+        :returns: False when it is not in the hot collection.
+        """
+        try:
+            object_id = ObjectId(cart_id)
+        except (InvalidId, TypeError):
+            return False
+
+        result = await self.collection.update_one(
+            {"_id": object_id},
+            {
+                "$set": {"ordered_at": datetime.now(timezone.utc)},
+                "$unset": {"expires_at": ""},
+            },
+        )
+
+        return bool(result.matched_count)
+
+    async def get_many(self, cart_ids: list) -> dict:
+        """
+        Get the items of many carts in a single `$in` query, archived carts
+        with a second one.
+
+        :param cart_ids: Cart ids, invalid ones are skipped.
+        :returns: Cart documents (items only) by cart id.
+        """
+        object_ids = [
+            ObjectId(cart_id) for cart_id in cart_ids if ObjectId.is_valid(cart_id)
+        ]
+
+        if not object_ids:
+            return {}
+
+        cursor = self.collection.find({"_id": {"$in": object_ids}}, {"items": 1})
+        carts = {str(cart["_id"]): cart async for cart in cursor}
+
+        missing = [
+            object_id for object_id in object_ids if str(object_id) not in carts
+        ]
+        if missing:
+            cursor = self.archive.find({"_id": {"$in": missing}}, {"items": 1})
+            carts.update({str(cart["_id"]): cart async for cart in cursor})
+
+        return carts
+
+    async def archive_ordered(self, before: datetime, limit: int) -> int:
+        """
+        Move carts ordered before a date to the archive.
+
+        Carts are copied before being deleted, a batch interrupted in
+        between is copied again and its duplicates skipped.
+
+        :param before: Latest `ordered_at` to archive.
+        :param limit: Carts to move.
+        :returns: Number of archived carts.
+        """
+        cursor = self.collection.find({"ordered_at": {"$lt": before}}).limit(limit)
+        carts = [cart async for cart in cursor]
+
+        if not carts:
+            return 0
+
+        try:
+            await self.archive.insert_many(carts, ordered=False)
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+
+        await self.collection.delete_many(
+            {"_id": {"$in": [cart["_id"] for cart in carts]}}
+        )
+
+        return len(carts)
+
+
+class CartArchiver:
+    """
+    Move ordered carts to the archive collection, from an asyncio task of
+    the event loop owning the Motor client.
+
+    Workers may all run one: copies are idempotent.
+    """
+
+    def __init__(
+        self,
+        carts: CartRepository,
+        after: float = None,
+        interval: float = None,
+        batch_size: int = None,
+    ):
+        self.carts = carts
+        self.after = after or conf_settings.cart_archive_after
+        self.interval = interval or conf_settings.cart_archive_interval
+        self.batch_size = batch_size or conf_settings.cart_archive_batch_size
+
+        self.archived = 0
+        self.failures = 0
+
+        self._task = None
+
+    async def run_once(self) -> int:
+        """
+        Archive one batch of ordered carts.
+
+        :returns: Number of archived carts.
+        """
+        before = datetime.now(timezone.utc) - timedelta(seconds=self.after)
+        count = await self.carts.archive_ordered(before, self.batch_size)
+
+        self.archived += count
+        if count:
+            logger.info("[Carts] Archived {} ordered carts", count)
+
+        return count
+
+    def start(self):
+        """
+        Start the archiver task, on the running event loop.
+        """
+        if self._task and not self._task.done():
+            return
+
+        self._task = asyncio.get_running_loop().create_task(self.run_forever())
+
+    async def run_forever(self):
+        """
+        Archive ordered carts until `stop` is called.
+        """
+        while True:
+            try:
+                count = await self.run_once()
+            except PyMongoError as exc:
+                self.failures += 1
+                logger.warning("[Carts] Archive failed: {}", exc)
+                count = 0
+
+            if count < self.batch_size:
+                await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        """
+        Cancel the archiver task.
+        """
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """
+        Archiver counters.
+        """
+        return {
+            "running": bool(self._task and not self._task.done()),
+            "archived": self.archived,
+            "failures": self.failures,
+        }
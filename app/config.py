@@ -1,3 +1,6 @@
+from functools import lru_cache
+from typing import Dict
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from yarl import URL
 
@@ -13,22 +16,67 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
 
-    # quantity of workers for uvicorn
+    # quantity of workers for uvicorn, 0 starts one per available CPU.
+    # Each worker opens its own database pools, MongoDB client, RabbitMQ
+    # connection and background threads, so connections grow with it
     workers_count: int = 1
 
-    # Enable uvicorn reloading
+    # Enable uvicorn reloading (single worker)
     reload: bool = False
 
+    # `python -m app` server tuning: pending connections the listen socket
+    # queues, seconds idle keep-alive connections are held (longer than the
+    # load balancer's idle timeout, so it never reuses a closed socket) and
+    # seconds in-flight requests get on shutdown
+    server_backlog: int = 2048
+    server_keepalive: int = 75
+    server_graceful_timeout: int = 30
+
+    # "auto" uses uvloop and httptools when installed
+    server_loop: str = "auto"
+    server_http: str = "auto"
+
     # Current environment
     env: str = "dev"
     debug: bool = True
 
+    # Logging: "queued" hands records to a background writer thread (up to
+    # `log_queue_size` pending), "sync" writes them in the request.
+    # `log_debug_sampling` keeps the debug records of a share of the
+    # requests per route template, e.g. {"/order/update": 0.01}, other
+    # routes use `log_debug_sample_rate` (one request in ten by default,
+    # keeping every request's debug records costs about twice the overhead)
+    log_mode: str = "queued"
+    log_level: str = "DEBUG"
+    log_json: bool = True
+    log_file: str = "log_api.log"
+    log_rotation_mb: int = 100
+    log_queue_size: int = 10000
+    log_debug_sample_rate: float = 0.1
+    log_debug_sampling: Dict[str, float] = {}
+
     # Variables for RabbitMQ
     publish_queue: str = "food_orders"
     rabbit_host: str = "127.0.0.1"
     rabbit_user: str = "admin"
     rabbit_pass: str = "admin"
 
+    # "sync" publishes inside the request, "background" hands messages to
+    # a publisher thread with pooled channels and batched confirms
+    rabbit_publish_mode: str = "sync"
+    rabbit_publish_buffer: int = 10000
+    rabbit_enqueue_timeout: float = 1.0
+    rabbit_publisher_channels: int = 2
+    rabbit_confirm_window: int = 500
+    rabbit_reconnect_delay: float = 2.0
+
+    # Order events are written to the outbox table with the order and
+    # relayed to RabbitMQ by a background thread (or `python -m app.outbox`)
+    outbox_relay_enabled: bool = True
+    outbox_batch_size: int = 100
+    outbox_poll_interval: float = 1.0
+    outbox_confirm_timeout: float = 10.0
+
     # Variables for the database
     db_host: str = "localhost"
     db_port: int = 5432
@@ -37,6 +85,21 @@ class Settings(BaseSettings):
     db_base: str = "food"
     db_echo: bool = False
 
+    # Connection pool tuning (per worker process)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+
+    # Serve routers on an AsyncSession (asyncpg) instead of the
+    # blocking Session running on the threadpool
+    db_async: bool = False
+
+    # orjson for responses and broker payloads, routes returning a model
+    # they built skip the response_model validation
+    fast_json: bool = True
+
     @property
     def db_url(self) -> URL:
         """
@@ -53,12 +116,42 @@ class Settings(BaseSettings):
             path=f"/{self.db_base}",
         )
 
+    @property
+    def db_async_url(self) -> URL:
+        """
+        Assemble asyncpg database URL from settings.
+
+        :return: database URL.
+        """
+        return self.db_url.with_scheme("postgresql+asyncpg")
+
     mongo_host: str = "127.0.0.1"
     mongo_port: int = 27017
     mongo_user: str = "admin"
     mongo_pass: str = "admin"
     mongo_base: str = "food_orders"
 
+    # MongoDB client pool (per worker process), timeouts in milliseconds
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_wait_queue_timeout_ms: int = 2000
+    mongo_connect_timeout_ms: int = 5000
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: int = 10000
+
+    # Cart write concern, "w" is a node count or "majority"
+    mongo_write_concern: str = "1"
+    mongo_write_journal: bool = False
+
+    # Unpaid carts are deleted by a TTL index `cart_ttl` seconds after
+    # checkout; ordered carts move to `orders_cart_archive` once
+    # `cart_archive_after` seconds old, checked every archive interval
+    cart_ttl: float = 86400.0
+    cart_archive_enabled: bool = True
+    cart_archive_after: float = 86400.0
+    cart_archive_interval: float = 300.0
+    cart_archive_batch_size: int = 500
+
     @property
     def mongo_url(self) -> URL:
         return URL.build(
@@ -69,9 +162,72 @@ class Settings(BaseSettings):
             password=self.mongo_pass,
         )
 
+    # Customer identity cache (per worker process)
+    customer_cache_size: int = 10000
+    customer_cache_ttl: float = 300.0
+    customer_cache_negative_ttl: float = 5.0
+
+    # Order status streams (per worker process): events buffered per
+    # client before it is dropped, seconds between keep-alive comments.
+    # With `order_events_fanout` workers share their events through
+    # PostgreSQL LISTEN/NOTIFY, otherwise a stream only sees the changes
+    # made by its own worker
+    order_events_buffer: int = 100
+    order_events_heartbeat: float = 15.0
+    order_events_fanout: bool = True
+    order_events_fanout_buffer: int = 10000
+    order_events_reconnect_delay: float = 2.0
+
+    # Idempotency-Key responses are replayed for `idempotency_ttl` seconds,
+    # a claim whose request never finished is freed after the lock timeout
+    idempotency_ttl: float = 86400.0
+    idempotency_lock_timeout: float = 60.0
+
+    # Stock reserved at checkout is given back when the cart is not ordered
+    # within `stock_reservation_ttl` seconds, checked every release interval
+    stock_reservation_ttl: float = 900.0
+    stock_release_interval: float = 60.0
+    stock_release_batch_size: int = 100
+
+    # Orders per batch when `python -m app.sales` rebuilds the rollups
+    sales_rebuild_batch_size: int = 1000
+
+    # Kitchen order queue page size
+    order_queue_page_size: int = 50
+
+    # Rows per transaction of the bulk importer
+    bulk_chunk_size: int = 1000
+
     payment_service_url: str = "http://0.0.0.0:8001"
 
+    # Payment service client (shared connection pool)
+    payment_timeout: float = 5.0
+    payment_connect_timeout: float = 2.0
+    payment_max_connections: int = 100
+    payment_max_keepalive: int = 20
+    payment_keepalive_expiry: float = 30.0
+    payment_http2: bool = False
+    payment_retries: int = 2
+    payment_retry_backoff: float = 0.1
+    payment_breaker_threshold: int = 5
+    payment_breaker_reset: float = 30.0
+
+    # Seconds a menu snapshot is served before being rebuilt, bounds how
+    # stale other workers can be after an item write (0 disables expiry)
+    menu_cache_ttl: int = 300
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
     )
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    """
+    Config settings function.
+
+    Settings are read from the environment and `.env` once per process and
+    shared by every module.
+    """
+    return Settings()
@@ -0,0 +1,113 @@
+import collections
+import threading
+import time
+
+from app.schemas.customer import Customer
+
+# Returned by `CustomerCache.get` when the CPF is not cached
+MISSING = object()
+
+
+class CustomerCache:
+    """
+    LRU + TTL cache of customer identities by CPF.
+
+    Unknown CPFs are cached too (as `None`) for `negative_ttl` seconds, so
+    a kiosk retrying an unregistered CPF does not hit the database on every
+    attempt. Entries are per process: `register_customer` invalidates its
+    CPF locally and the TTLs bound how stale other workers can be.
+    """
+
+    def __init__(
+        self, maxsize: int = 10000, ttl: float = 300, negative_ttl: float = 5
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, cpf: str) -> Customer | None:
+        """
+        Get a cached customer.
+
+        :param cpf: Customer CPF.
+        :returns: Customer, None for a cached unknown CPF or `MISSING`.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(cpf)
+
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(cpf)
+
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+
+            return entry[1]
+
+    def put(self, cpf: str, customer: Customer | None):
+        """
+        Cache a customer, or the absence of one.
+
+        :param cpf: Customer CPF.
+        :param customer: Customer, None when not registered.
+        """
+        ttl = self.ttl if customer is not None else self.negative_ttl
+
+        with self._lock:
+            self._entries[cpf] = (time.monotonic() + ttl, customer)
+            self._entries.move_to_end(cpf)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, cpf: str):
+        """
+        Drop a CPF, called when it is registered.
+
+        :param cpf: Customer CPF.
+        """
+        with self._lock:
+            if self._entries.pop(cpf, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Cache size and hit/miss counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_ratio": (
+                    (self.hits + self.negative_hits) / lookups if lookups else 0.0
+                ),
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -1,27 +1,239 @@
+import threading
+import time
 from functools import lru_cache
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 # from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from . import config
+from .metrics import instrument_engine
+
+
+conf_settings = config.get_settings()
+
+SQLALCHEMY_DATABASE_URL = str(conf_settings.db_url)
+SQLALCHEMY_ASYNC_DATABASE_URL = str(conf_settings.db_async_url)
+
+
+class PoolStats:
+    """
+    Connection pool statistics.
+
+    Checkouts, checkins, new connections and invalidations are counted
+    through SQLAlchemy pool events registered on the engine. Wait times are
+    reported by the `Timed*Pool` classes below.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        engine.pool.stats = self
+
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, elapsed: float, timed_out: bool = False):
+        """
+        Record the time a caller waited for a pooled connection.
+
+        :param elapsed: Wait time in seconds.
+        :param timed_out: Whether the wait ended with a pool timeout.
+        """
+        with self._lock:
+            self.waits += 1
+            self.wait_total += elapsed
+            self.wait_max = max(self.wait_max, elapsed)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        """
+        Current pool state and counters.
+        """
+        pool = self.engine.pool
+
+        with self._lock:
+            result = {
+                "pool": pool.__class__.__name__,
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "waits": self.waits,
+                "wait_avg_ms": (
+                    self.wait_total / self.waits * 1000 if self.waits else 0.0
+                ),
+                "wait_max_ms": self.wait_max * 1000,
+            }
+
+        return result
+
+
+class _TimedPool:
+    """
+    Pool mixin timing how long `connect` waits for a connection.
+    """
+
+    stats = None
+
+    def connect(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.record_wait(time.perf_counter() - start, timed_out)
+
+    def recreate(self):
+        # `engine.dispose()` swaps the pool, keep reporting to the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options() -> dict:
+    """
+    Connection pool options from settings.
+    """
+    return {
+        "pool_size": conf_settings.db_pool_size,
+        "max_overflow": conf_settings.db_max_overflow,
+        "pool_timeout": conf_settings.db_pool_timeout,
+        "pool_recycle": conf_settings.db_pool_recycle,
+        "pool_pre_ping": conf_settings.db_pool_pre_ping,
+    }
+
+
+class _LazyBind:
+    """
+    Session factory mixin binding its engine on the first session.
+
+    Engines are built on first use, so importing the app opens no pool and
+    loads no driver.
+    """
+
+    def __init__(self, engine_factory, **kwargs):
+        super().__init__(**kwargs)
+        self.engine_factory = engine_factory
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self.engine_factory())
+        return super().__call__(**local_kw)
+
+
+class LazySessionmaker(_LazyBind, sessionmaker):
+    pass
+
+
+class LazyAsyncSessionmaker(_LazyBind, async_sessionmaker):
+    pass
 
 
 @lru_cache()
-def get_settings():
+def get_engine():
     """
-    Config settings function.
+    Sync engine of the process, built on first call.
     """
-    return config.Settings()
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=TimedQueuePool,
+        **pool_options(),
+        # connect_args={"check_same_thread": False}
+    )
+    PoolStats(engine)
+    instrument_engine(engine)
 
+    return engine
 
-conf_settings = get_settings()
 
-SQLALCHEMY_DATABASE_URL = str(conf_settings.db_url)
+@lru_cache()
+def get_async_engine():
+    """
+    Async engine of the process, built on first call.
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    # connect_args={"check_same_thread": False}
+    Only available when the async mode is enabled, so the sync deployment
+    does not need the asyncpg driver installed.
+    """
+    if not conf_settings.db_async:
+        return None
+
+    async_engine = create_async_engine(
+        SQLALCHEMY_ASYNC_DATABASE_URL,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        **pool_options(),
+    )
+    PoolStats(async_engine.sync_engine)
+    instrument_engine(async_engine.sync_engine)
+
+    return async_engine
+
+
+def opened_engines() -> list:
+    """
+    Engines built by this process, as sync engines.
+    """
+    engines = []
+
+    if get_engine.cache_info().currsize:
+        engines.append(get_engine())
+    if get_async_engine.cache_info().currsize and get_async_engine():
+        engines.append(get_async_engine().sync_engine)
+
+    return engines
+
+
+SessionLocal = LazySessionmaker(get_engine, autocommit=False, autoflush=False)
+AsyncSessionLocal = LazyAsyncSessionmaker(
+    get_async_engine, autocommit=False, autoflush=False, expire_on_commit=False
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
@@ -36,3 +248,12 @@ def get_db():
         yield db_session
     finally:
         db_session.close()
+
+
+# Dependency
+async def get_async_db():
+    """
+    Gets async database session.
+    """
+    async with AsyncSessionLocal() as db_session:
+        yield db_session
@@ -0,0 +1,377 @@
+"""
+Order event hub.
+
+Status changes are fanned out to every subscriber (SSE clients of
+``/order/events``) of this worker. Each subscriber has a bounded buffer: a
+client that can not keep up is dropped, publishing never waits on it.
+
+Workers share their events through PostgreSQL: `OrderEventFanout` sends
+each published event with ``NOTIFY order_events`` and hands the
+notifications of every worker to the local subscribers, so a stream sees
+the changes made by any worker. Without it (or while its connection is
+down) a stream only sees the changes of its own worker.
+"""
+
+import asyncio
+import json
+import queue
+import select
+import socket
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from loguru import logger
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import execute_batch
+
+from app import config, database
+from app.serialization import dumps
+
+
+conf_settings = config.get_settings()
+
+CHANNEL = "order_events"
+
+
+class Subscriber:
+    """
+    Event buffer of one client, bound to the event loop it subscribed on.
+    """
+
+    def __init__(self, loop, buffer: int, external_id=None, status=None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=buffer)
+        self.external_id = external_id
+        self.status = status
+        self.dropped = False
+
+    def wants(self, event: dict) -> bool:
+        if self.external_id and event["external_id"] != self.external_id:
+            return False
+        if self.status and event["status"] != self.status:
+            return False
+        return True
+
+    def _put(self, event: dict) -> bool:
+        """
+        Buffer an event, on the subscriber's loop.
+
+        :returns: False if the buffer was full and the subscriber dropped.
+        """
+        if self.dropped:
+            return False
+
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Make room for the end of stream marker
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+        return True
+
+    async def get(self) -> dict | None:
+        """
+        Next event, None once the subscriber was dropped.
+        """
+        return await self.queue.get()
+
+
+class OrderEventHub:
+    """
+    Broadcast order status changes to the subscribers of this process.
+
+    `publish` is thread-safe, threadpool routes call it directly. Events are
+    handed to each subscriber's event loop and never block the publisher.
+    While a `fanout` is attached, events go through it to every worker.
+    """
+
+    def __init__(self, buffer: int = 100):
+        self.buffer = buffer
+        self.fanout = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    @contextmanager
+    def subscribe(self, external_id: str = None, status: str = None):
+        """
+        Subscribe the running event loop to order events.
+
+        :param external_id: Only events of this order.
+        :param status: Only events to this status.
+        """
+        subscriber = Subscriber(
+            asyncio.get_running_loop(), self.buffer, external_id, status
+        )
+
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield subscriber
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    def publish(self, event: dict):
+        """
+        Send an event to every interested subscriber, of every worker while
+        a fanout is attached.
+
+        :param event: Order event, with `external_id` and `status`.
+        """
+        with self._lock:
+            self.published += 1
+
+        fanout = self.fanout
+        if fanout is not None:
+            fanout.send(event)
+        else:
+            self.deliver(event)
+
+    def deliver(self, event: dict):
+        """
+        Send an event to the interested subscribers of this process.
+
+        :param event: Order event, with `external_id` and `status`.
+        """
+        with self._lock:
+            subscribers = [
+                subscriber
+                for subscriber in self._subscribers
+                if subscriber.wants(event)
+            ]
+
+        for subscriber in subscribers:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+
+            if running is subscriber.loop:
+                self._deliver(subscriber, event)
+            else:
+                try:
+                    subscriber.loop.call_soon_threadsafe(
+                        self._deliver, subscriber, event
+                    )
+                except RuntimeError:
+                    # Loop closed, the subscription goes away with it
+                    pass
+
+    def _deliver(self, subscriber: Subscriber, event: dict):
+        delivered = subscriber._put(event)
+
+        with self._lock:
+            if delivered:
+                self.delivered += 1
+            elif subscriber in self._subscribers:
+                self.dropped += 1
+                self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        """
+        Hub counters.
+        """
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+            }
+
+
+class OrderEventFanout:
+    """
+    Share order events between the workers with PostgreSQL LISTEN/NOTIFY.
+
+    Once started, the hub's events are queued for the fanout thread, which
+    sends them with NOTIFY on its own connection (not a pooled one, it is
+    held for good) and delivers every notification of the channel, the
+    ones of this worker included, to the hub's subscribers. Events that
+    can not be sent are delivered to this worker only.
+    """
+
+    def __init__(
+        self,
+        hub: OrderEventHub,
+        dsn: str = None,
+        buffer: int = None,
+        heartbeat: float = None,
+        reconnect_delay: float = None,
+    ):
+        self.hub = hub
+        self.dsn = dsn or database.SQLALCHEMY_DATABASE_URL
+        self.heartbeat = heartbeat or conf_settings.order_events_heartbeat
+        self.reconnect_delay = (
+            reconnect_delay or conf_settings.order_events_reconnect_delay
+        )
+
+        self.connected = False
+        self.sent = 0
+        self.received = 0
+        self.failures = 0
+
+        self._outgoing = queue.Queue(
+            maxsize=buffer or conf_settings.order_events_fanout_buffer
+        )
+        self._thread = None
+        self._stopping = threading.Event()
+        self._wakeup, self._waker = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self._waker.setblocking(False)
+
+    def send(self, event: dict):
+        """
+        Queue an event for the other workers, never blocks.
+
+        :param event: Order event.
+        """
+        if not self.connected:
+            self.hub.deliver(event)
+            return
+
+        try:
+            self._outgoing.put_nowait(event)
+        except queue.Full:
+            self.failures += 1
+            self.hub.deliver(event)
+            return
+
+        try:
+            self._waker.send(b"\0")
+        except BlockingIOError:
+            # The thread has wake-ups pending already
+            pass
+
+    def start(self):
+        """
+        Attach to the hub and start the fanout thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self.hub.fanout = self
+        self._thread = threading.Thread(
+            target=self.run_forever, name="order-events-fanout", daemon=True
+        )
+        self._thread.start()
+
+    def run_forever(self):
+        """
+        Listen and send events until `stop` is called, reconnecting after
+        `reconnect_delay` when the connection fails.
+        """
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+            except psycopg2.Error as exc:
+                self.failures += 1
+                logger.warning("[Events] Fanout connection failed: {}", exc)
+                self._stopping.wait(self.reconnect_delay)
+
+    def _listen(self):
+        connection = psycopg2.connect(self.dsn)
+        try:
+            connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            self.connected = True
+            logger.info("[Events] Sharing order events between workers")
+
+            while not self._stopping.is_set():
+                readable, _, _ = select.select(
+                    [connection, self._wakeup], [], [], self.heartbeat
+                )
+                if not readable:
+                    # A dead connection is only noticed by using it
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+
+                self._send_pending(connection)
+                self._receive(connection)
+        finally:
+            self.connected = False
+            connection.close()
+            # Events queued meanwhile still reach this worker's streams
+            for event in self._pending():
+                self.hub.deliver(event)
+
+    def _pending(self) -> list:
+        try:
+            while True:
+                self._wakeup.recv(4096)
+        except BlockingIOError:
+            pass
+
+        events = []
+        try:
+            while True:
+                events.append(self._outgoing.get_nowait())
+        except queue.Empty:
+            return events
+
+    def _send_pending(self, connection):
+        events = self._pending()
+        if not events:
+            return
+
+        try:
+            with connection.cursor() as cursor:
+                execute_batch(
+                    cursor,
+                    "SELECT pg_notify(%s, %s)",
+                    [(CHANNEL, dumps(event)) for event in events],
+                )
+        except psycopg2.Error:
+            for event in events:
+                self.hub.deliver(event)
+            raise
+
+        self.sent += len(events)
+
+    def _receive(self, connection):
+        connection.poll()
+        while connection.notifies:
+            notification = connection.notifies.pop(0)
+            self.received += 1
+            self.hub.deliver(json.loads(notification.payload))
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Detach from the hub and stop the fanout thread.
+
+        :param timeout: Seconds to wait for the thread.
+        """
+        if self.hub.fanout is self:
+            self.hub.fanout = None
+
+        self._stopping.set()
+        try:
+            self._waker.send(b"\0")
+        except BlockingIOError:
+            pass
+
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """
+        Fanout counters.
+        """
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "connected": self.connected,
+            "sent": self.sent,
+            "received": self.received,
+            "failures": self.failures,
+        }
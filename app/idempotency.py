@@ -0,0 +1,225 @@
+"""
+Idempotency-Key support.
+
+A request carrying an ``Idempotency-Key`` header first claims the key in
+the `idempotency_key` table (an insert, so concurrent retries race on the
+primary key). The successful response is stored on the row and replayed
+for any retry with the same key and body; failed requests release the key
+so they can be retried. Keys expire after `idempotency_ttl` seconds, and a
+claim left behind by a crashed worker after `idempotency_lock_timeout`.
+"""
+
+import contextlib
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Response
+from pydantic import BaseModel
+from sqlalchemy import delete, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import config
+from app.models.idempotency import IdempotencyKey
+
+
+conf_settings = config.get_settings()
+
+
+class IdempotencyError(Exception):
+    """Key can not be used for this request (yet)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _expired(row: IdempotencyKey, seconds: float) -> bool:
+    created_at = row.created_at
+    # SQLite hands back naive UTC timestamps
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+
+    return created_at < datetime.now(timezone.utc) - timedelta(seconds=seconds)
+
+
+class IdempotentRequest:
+    """
+    Idempotency state of one request.
+
+    Without a key every method is a no-op, so routes call them
+    unconditionally.
+    """
+
+    def __init__(self, scope: str, key: str | None, payload: BaseModel):
+        """
+        :param scope: Route the key belongs to.
+        :param key: `Idempotency-Key` header value.
+        :param payload: Request body, a retry must send the same one.
+        """
+        self.scope = scope
+        self.key = key
+        self.fingerprint = hashlib.sha256(
+            payload.model_dump_json().encode()
+        ).hexdigest()
+
+    def _insert(self, db_session: Session) -> bool:
+        values = {
+            "scope": self.scope,
+            "key": self.key,
+            "fingerprint": self.fingerprint,
+        }
+        dialect = db_session.get_bind().dialect.name
+
+        if dialect in ("postgresql", "sqlite"):
+            module = postgresql if dialect == "postgresql" else sqlite
+            result = db_session.execute(
+                module.insert(IdempotencyKey)
+                .values(**values)
+                .on_conflict_do_nothing(index_elements=["scope", "key"])
+            )
+            db_session.commit()
+            return result.rowcount == 1
+
+        try:
+            db_session.execute(insert(IdempotencyKey).values(**values))
+            db_session.commit()
+        except IntegrityError:
+            db_session.rollback()
+            return False
+
+        return True
+
+    def claim(self, db_session: Session) -> Response | None:
+        """
+        Claim the key, or get the stored response of a previous request.
+
+        :param db_session: Database session.
+        :returns: Response to replay, None if the request must run.
+        :raises IdempotencyError: Key in use by a running request or sent
+            with a different body.
+        """
+        if self.key is None:
+            return None
+
+        for _ in range(2):
+            if self._insert(db_session):
+                return None
+
+            row = db_session.get(
+                IdempotencyKey, (self.scope, self.key), populate_existing=True
+            )
+
+            if row is None:
+                continue
+
+            ttl = (
+                conf_settings.idempotency_ttl
+                if row.status_code is not None
+                else conf_settings.idempotency_lock_timeout
+            )
+            if _expired(row, ttl):
+                db_session.delete(row)
+                db_session.commit()
+                continue
+
+            if row.fingerprint != self.fingerprint:
+                raise IdempotencyError(
+                    422, "Idempotency-Key already used for a different request"
+                )
+
+            if row.status_code is None:
+                break
+
+            return Response(
+                content=row.response,
+                status_code=row.status_code,
+                media_type="application/json",
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        raise IdempotencyError(
+            409, "A request with this Idempotency-Key is in progress"
+        )
+
+    def save(self, db_session: Session, model: BaseModel, status_code: int):
+        """
+        Store the response to replay, in the caller's transaction.
+
+        :param db_session: Database session.
+        :param model: Response model.
+        :param status_code: Response status.
+        """
+        if self.key is None:
+            return
+
+        db_session.execute(
+            update(IdempotencyKey)
+            .where(
+                IdempotencyKey.scope == self.scope, IdempotencyKey.key == self.key
+            )
+            .values(status_code=status_code, response=model.model_dump_json())
+        )
+
+    def release(self, db_session: Session):
+        """
+        Drop the claim of a failed request so it can be retried.
+
+        :param db_session: Database session.
+        """
+        if self.key is None:
+            return
+
+        db_session.rollback()
+        db_session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.scope == self.scope, IdempotencyKey.key == self.key
+            )
+        )
+        db_session.commit()
+
+    @contextlib.contextmanager
+    def releasing(self, db_session: Session):
+        """
+        Release the key if the block raises.
+
+        :param db_session: Database session.
+        """
+        try:
+            yield
+        except BaseException:
+            self.release(db_session)
+            raise
+
+    @contextlib.asynccontextmanager
+    async def releasing_async(self, db_session):
+        """
+        Release the key if the block raises, on an async session.
+
+        :param db_session: Async database session.
+        """
+        try:
+            yield
+        except BaseException:
+            await db_session.run_sync(self.release)
+            raise
+
+
+def purge_expired(db_session: Session) -> int:
+    """
+    Delete expired keys.
+
+    :param db_session: Database session.
+    :returns: Number of deleted keys.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(
+        seconds=conf_settings.idempotency_ttl
+    )
+    result = db_session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)
+    )
+    db_session.commit()
+
+    return result.rowcount
@@ -0,0 +1,292 @@
+"""
+Logging pipeline.
+
+`configure_logging` replaces the loguru handlers with the configured sinks
+(stderr and `log_file`):
+
+- with `log_mode` "queued" formatted records are put on an in-process
+  queue and written by a background thread (`QueuedSink`), a slow disk or
+  a file rotation never stalls a request;
+- with `log_json` every record is one JSON line carrying the id of the
+  request that emitted it;
+- debug records are sampled per request: `log_debug_sampling` gives the
+  share of requests of a route template whose debug records are kept, the
+  other routes use `log_debug_sample_rate`. A sampled request keeps all of
+  its debug records.
+
+Log calls pass their arguments instead of formatting the message
+(``logger.debug("Order {} created", order_id)``): loguru only formats it
+when a handler accepts the level.
+"""
+
+import contextvars
+import os
+import queue
+import random
+import sys
+import threading
+import traceback
+import uuid
+from datetime import datetime
+
+import orjson
+from loguru import logger
+
+from . import config
+
+conf_settings = config.get_settings()
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
+    "<level>{level: <8}</level> | {extra[request_id]} | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+    "<level>{message}</level>"
+)
+
+DEBUG = logger.level("DEBUG").no
+
+# Set per request by the middleware. Sync routes run in worker threads that
+# copy the context, so they see the request too.
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class RequestLog:
+    """Log context of one HTTP request."""
+
+    def __init__(self, scope, request_id: str):
+        self.scope = scope
+        self.request_id = request_id
+        self._sampled = None
+
+    def sampled(self) -> bool:
+        """
+        Whether the debug records of the request are kept.
+
+        Decided once per request, on the first debug record after routing.
+        """
+        if self._sampled is not None:
+            return self._sampled
+
+        route = getattr(self.scope.get("route"), "path", None)
+        if route is None:
+            return True
+
+        rate = conf_settings.log_debug_sampling.get(
+            route, conf_settings.log_debug_sample_rate
+        )
+        self._sampled = rate >= 1 or random.random() < rate
+
+        return self._sampled
+
+
+def sample_debug(record) -> bool:
+    """
+    Handler filter dropping the debug records of unsampled requests.
+    """
+    if record["level"].no > DEBUG:
+        return True
+
+    request = current_request.get()
+
+    return request is None or request.sampled()
+
+
+def json_format(record) -> str:
+    """
+    Format a record as one JSON line, serialized once for all the sinks.
+    """
+    if "json" in record["extra"]:
+        return "{extra[json]}\n"
+
+    document = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "request_id": "-",
+        **record["extra"],
+    }
+
+    if record["exception"]:
+        document["exception"] = "".join(
+            traceback.format_exception(*record["exception"])
+        )
+
+    record["extra"]["json"] = orjson.dumps(document, default=str).decode()
+
+    return "{extra[json]}\n"
+
+
+class RotatingFile:
+    """
+    Append-only log file, renamed aside once it reaches `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._open()
+
+    def _open(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+
+    def write(self, message: str):
+        if self.size >= self.max_bytes:
+            self.file.close()
+            os.rename(
+                self.path,
+                f"{self.path}.{datetime.now():%Y-%m-%d_%H-%M-%S_%f}",
+            )
+            self._open()
+
+        self.file.write(message)
+        self.size += len(message)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class QueuedSink:
+    """
+    loguru sink writing records from a background thread.
+
+    The logging thread only puts the formatted record on a bounded queue;
+    the writer thread writes whatever is queued and flushes once per batch.
+    Records are dropped, and counted, when the queue is full.
+    """
+
+    def __init__(self, stream, maxsize: int = 10000):
+        """
+        :param stream: Object with `write` and `flush`, closed on stop if
+            it has a `close` method.
+        :param maxsize: Records buffered before dropping.
+        """
+        self.stream = stream
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+
+            while message is not None:
+                self.stream.write(message)
+                try:
+                    message = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            self.stream.flush()
+
+            if message is None:
+                return
+
+    def stop(self):
+        """
+        Write the queued records and stop, called by `logger.remove`.
+        """
+        self.queue.put(None)
+        self._thread.join()
+
+        if self.dropped:
+            self.stream.write(f"{self.dropped} log records dropped\n")
+            self.stream.flush()
+        if callable(getattr(self.stream, "close", None)):
+            self.stream.close()
+
+
+def configure_logging() -> list:
+    """
+    Replace the loguru handlers with the configured sinks.
+
+    :returns: Handler ids, to remove them on shutdown.
+    """
+    options = {
+        "level": conf_settings.log_level,
+        "format": json_format if conf_settings.log_json else TEXT_FORMAT,
+        "filter": sample_debug,
+    }
+    max_bytes = conf_settings.log_rotation_mb * 1024 * 1024
+
+    if conf_settings.log_mode == "queued":
+        sinks = [QueuedSink(sys.stderr, conf_settings.log_queue_size)]
+        if conf_settings.log_file:
+            sinks.append(
+                QueuedSink(
+                    RotatingFile(conf_settings.log_file, max_bytes),
+                    conf_settings.log_queue_size,
+                )
+            )
+    else:
+        sinks = [sys.stderr]
+        if conf_settings.log_file:
+            sinks.append(RotatingFile(conf_settings.log_file, max_bytes))
+
+    logger.remove()
+    logger.configure(extra={"request_id": "-"})
+
+    return [logger.add(sink, **options) for sink in sinks]
+
+
+def _request_id(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"x-request-id":
+            value = value.decode("latin-1")
+            # Reuse the caller's id when it is sane, it is echoed back
+            if 0 < len(value) <= 128 and value.isascii() and value.isprintable():
+                return value
+            break
+
+    return uuid.uuid4().hex
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware giving every HTTP request an id.
+
+    The id comes from the `X-Request-ID` header or is generated, is bound
+    to the records logged while serving the request and is returned in the
+    `X-Request-ID` response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", request_id.encode()),
+                ]
+            await send(message)
+
+        token = current_request.set(RequestLog(scope, request_id))
+        try:
+            with logger.contextualize(request_id=request_id):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
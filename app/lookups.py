@@ -0,0 +1,108 @@
+import threading
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from app.models.items import ItemsCategory as ItemsCategoryModel
+from app.models.order import OrderStatus as OrderStatusModel
+
+
+class LookupTable:
+    """
+    Bidirectional id <-> description map of a static seed table.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.by_id = {}
+        self.by_description = {}
+
+    def load(self, db_session: Session):
+        """
+        Load every row of the table.
+
+        :param db_session: Database session.
+        """
+        rows = db_session.query(self.model.id, self.model.description).all()
+
+        self.by_id = {row.id: row.description for row in rows}
+        self.by_description = {row.description: row.id for row in rows}
+
+    def id_of(self, description: str) -> int:
+        """
+        Get the id of a description.
+
+        :param description: Row description (str or str Enum).
+        :raises KeyError: Unknown description.
+        """
+        return self.by_description[getattr(description, "value", description)]
+
+    def description_of(self, row_id: int) -> str:
+        """
+        Get the description of an id.
+
+        :param row_id: Row id.
+        :raises KeyError: Unknown id.
+        """
+        return self.by_id[row_id]
+
+
+class LookupRegistry:
+    """
+    In-memory copy of the `order_status` and `items_category` tables.
+
+    Both tables are seed data, so they are read once and served from memory
+    afterwards. Call `refresh` if the seed rows are changed.
+    """
+
+    def __init__(self):
+        self.order_status = LookupTable(OrderStatusModel)
+        self.items_category = LookupTable(ItemsCategoryModel)
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def load(self, db_session: Session):
+        """
+        Load all lookup tables.
+
+        :param db_session: Database session.
+        """
+        order_status = LookupTable(OrderStatusModel)
+        items_category = LookupTable(ItemsCategoryModel)
+
+        # Query outside the lock, async sessions run this on the event loop
+        # thread and a concurrent load would block it for good
+        order_status.load(db_session)
+        items_category.load(db_session)
+
+        with self._lock:
+            self.order_status = order_status
+            self.items_category = items_category
+            self.loaded = True
+
+        logger.info("Lookup tables loaded")
+
+    def ensure_loaded(self, db_session: Session) -> "LookupRegistry":
+        """
+        Load the lookup tables on first use.
+
+        :param db_session: Database session.
+        """
+        if not self.loaded:
+            self.load(db_session)
+
+        return self
+
+    def refresh(self, db_session: Session):
+        """
+        Reload all lookup tables.
+
+        :param db_session: Database session.
+        """
+        self.load(db_session)
+
+    def invalidate(self):
+        """
+        Drop the loaded tables, they are read again on next use.
+        """
+        self.loaded = False
@@ -1,47 +1,270 @@
 # import asyncio
-from functools import lru_cache
+import os
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from loguru import logger
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 
+from app import database
+from app.carts import CartArchiver, CartRepository
+from app.customers import CustomerCache
+from app.events import OrderEventFanout, OrderEventHub
+from app.idempotency import IdempotencyError, purge_expired
+from app.logs import RequestContextMiddleware, configure_logging
+from app.lookups import LookupRegistry
+from app.menu import MenuSnapshot
+from app.metrics import MetricsMiddleware, render
 from app.mongo import Mongo
-from app.pika import PikaClient
-from app.routers import customer, items, order
+from app.outbox import OutboxRelay, pending_events
+from app.payment import PaymentClient, PaymentServiceError
+from app.pricing import CartItemError
+from app.pika import PikaClient, PikaPublisher
+from app.resources import Resources
+from app.routers import bulk, customer, events, items, order
+from app.routers.aio import customer as aio_customer
+from app.routers.aio import items as aio_items
+from app.routers.aio import order as aio_order
+from app.serialization import response_class
+from app.stock import ReservationReaper, reserved_carts
 
 from . import config
 
 
-@lru_cache()
-def get_settings():
+conf_settings = config.get_settings()
+
+
+class FoodOrdersApp(FastAPI):
     """
-    Config settings function.
+    Food orders app and its per-process state.
+
+    Clients owning sockets or threads are registered on `resources` and
+    read as attributes of the app (`app.carts`, `app.pika_client`...): they
+    are opened on first use by the process using them, not when the app is
+    imported. pymongo and pika are not fork-safe, so a worker forked after
+    the app was imported drops the parent's clients and opens its own.
     """
-    return config.Settings()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.resources = Resources()
+        self.lookups = LookupRegistry()
+        self.menu = MenuSnapshot(ttl=conf_settings.menu_cache_ttl)
+        self.customers = CustomerCache(
+            maxsize=conf_settings.customer_cache_size,
+            ttl=conf_settings.customer_cache_ttl,
+            negative_ttl=conf_settings.customer_cache_negative_ttl,
+        )
+        self.order_events = OrderEventHub(buffer=conf_settings.order_events_buffer)
 
-conf_settings = get_settings()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.forget_resources)
 
+    def __getattr__(self, name):
+        # Only called for missing attributes
+        resources = self.__dict__.get("resources")
 
-class FoodOrdersApp(FastAPI):
+        if resources is None or name not in resources:
+            raise AttributeError(name)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.pika_client = PikaClient()
-        self.mongo = Mongo()
+        return resources.get(name)
+
+    def forget_resources(self):
+        """
+        Drop the resources and engine pools inherited by a forked process.
+        """
+        self.resources.forget()
+
+        for engine in database.opened_engines():
+            engine.dispose(close=False)
+
+
+def warm_database(engine):
+    """
+    Preload the static lookup tables and delete expired Idempotency-Key
+    responses.
+
+    :param engine: Sync engine.
+    """
+    with database.SessionLocal(bind=engine) as db_session:
+        app.lookups.load(db_session)
+        logger.info("{} expired idempotency keys purged", purge_expired(db_session))
+
+
+async def ping_async_database(async_engine):
+    """
+    Open the first pooled async connection.
+
+    :param async_engine: Async engine.
+    """
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def dispose_async_engine(async_engine):
+    """
+    Close pooled async connections.
+
+    :param async_engine: Async engine.
+    """
+    await async_engine.dispose()
+
+
+async def create_cart_indexes(carts: CartRepository):
+    """
+    Create the MongoDB cart indexes.
+
+    :param carts: Cart repository.
+    """
+    await carts.ensure_indexes()
+
+
+def start_outbox_relay(outbox_relay: OutboxRelay):
+    """
+    Start relaying outbox events to RabbitMQ.
+
+    :param outbox_relay: Outbox relay.
+    """
+    if conf_settings.outbox_relay_enabled:
+        outbox_relay.start()
+
+
+def start_order_events_fanout(order_events_fanout: OrderEventFanout):
+    """
+    Start sharing order events with the other workers.
+
+    :param order_events_fanout: Order events fanout.
+    """
+    if conf_settings.order_events_fanout:
+        order_events_fanout.start()
+
+
+async def start_cart_archiver(cart_archiver: CartArchiver):
+    """
+    Start archiving ordered carts, on the app's event loop.
+
+    :param cart_archiver: Cart archiver.
+    """
+    if conf_settings.cart_archive_enabled:
+        cart_archiver.start()
 
 
-app = FoodOrdersApp(debug=conf_settings.debug)
+def register_resources(app: FoodOrdersApp):
+    """
+    Register the clients of the app, in dependency order: a resource is
+    closed before the ones it was opened with.
+
+    :param app: Application.
+    """
+    app.resources.register(
+        "database",
+        database.get_engine,
+        warm=warm_database,
+        close=lambda engine: engine.dispose(),
+    )
+    if conf_settings.db_async:
+        app.resources.register(
+            "async_database",
+            database.get_async_engine,
+            warm=ping_async_database,
+            close=dispose_async_engine,
+        )
+    app.resources.register("mongo", Mongo, close=Mongo.close)
+    app.resources.register(
+        "carts",
+        lambda: CartRepository(app.mongo),
+        warm=create_cart_indexes,
+    )
+    app.resources.register(
+        "cart_archiver",
+        lambda: CartArchiver(app.carts),
+        warm=start_cart_archiver,
+        close=CartArchiver.stop,
+    )
+    app.resources.register(
+        "pika_client",
+        lambda: (
+            PikaPublisher()
+            if conf_settings.rabbit_publish_mode == "background"
+            else PikaClient()
+        ),
+        warm=lambda pika_client: pika_client.start(),
+        close=lambda pika_client: pika_client.close(),
+    )
+    app.resources.register(
+        "outbox_relay",
+        lambda: OutboxRelay(app.pika_client),
+        warm=start_outbox_relay,
+        # Unpublished events stay in the table
+        close=OutboxRelay.stop,
+    )
+    app.resources.register(
+        "order_events_fanout",
+        lambda: OrderEventFanout(app.order_events),
+        warm=start_order_events_fanout,
+        # Streams fall back to the events of their own worker
+        close=OrderEventFanout.stop,
+    )
+    app.resources.register("payment", PaymentClient, close=PaymentClient.aclose)
+    app.resources.register(
+        "stock_reaper",
+        # Released stock shows in the menu at once
+        lambda: ReservationReaper(on_release=app.menu.invalidate),
+        warm=ReservationReaper.start,
+        # Expired reservations are released by the next run
+        close=ReservationReaper.stop,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FoodOrdersApp):
+    """
+    Warm up the resources concurrently on startup, close them on shutdown.
+
+    Failing dependencies are reported by `/health/startup` and retried on
+    first use, so the app starts before the database or the broker.
+    """
+    handlers = configure_logging()
+
+    await app.resources.warm_up()
+    yield
+    await app.resources.close()
+
+    # Removing a queued handler waits for its writer to flush
+    for handler in handlers:
+        logger.remove(handler)
+
+
+app = FoodOrdersApp(
+    debug=conf_settings.debug,
+    default_response_class=response_class(),
+    lifespan=lifespan,
+)
+register_resources(app)
 
 app.add_middleware(CORSMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+# Async mode serves the same routes on an AsyncSession
+if conf_settings.db_async:
+    app.include_router(aio_customer.router, prefix="/customer")
+    app.include_router(aio_items.router, prefix="/items")
+    app.include_router(aio_order.router, prefix="/order")
+else:
+    app.include_router(customer.router, prefix="/customer")
+    app.include_router(items.router, prefix="/items")
+    app.include_router(order.router, prefix="/order")
 
-app.include_router(customer.router, prefix="/customer")
-app.include_router(items.router, prefix="/items")
-app.include_router(order.router, prefix="/order")
+# Bulk import always runs on the sync session
+app.include_router(bulk.router, prefix="/bulk")
 
-logger.add("log_api.log", rotation="100 MB")  # Automatically rotate log file
+# Order status streams need no database session
+app.include_router(events.router, prefix="/order")
 
 
 @app.exception_handler(SQLAlchemyError)
@@ -53,6 +276,31 @@ async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError):
     )
 
 
+@app.exception_handler(PaymentServiceError)
+async def payment_exception_handler(request: Request, exc: PaymentServiceError):
+    logger.error("Payment service failed: {}", exc)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Payment service unavailable"},
+    )
+
+
+@app.exception_handler(IdempotencyError)
+async def idempotency_exception_handler(request: Request, exc: IdempotencyError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+    )
+
+
+@app.exception_handler(CartItemError)
+async def cart_item_exception_handler(request: Request, exc: CartItemError):
+    return JSONResponse(
+        status_code=422,
+        content={"detail": exc.errors},
+    )
+
+
 @app.get("/health")
 def health():
     """
@@ -60,3 +308,86 @@ def health():
     """
     result = {"status": "ok"}
     return result
+
+
+@app.get("/health/pool")
+def pool_health():
+    """
+    Database connection pool statistics.
+    """
+    result = {"sync": database.get_engine().pool.stats.snapshot()}
+
+    async_engine = database.get_async_engine()
+    if async_engine is not None:
+        result["async"] = async_engine.sync_engine.pool.stats.snapshot()
+
+    return result
+
+
+@app.get("/health/cache")
+def cache_health():
+    """
+    Customer identity cache statistics.
+    """
+    return {"customers": app.customers.stats()}
+
+
+@app.get("/health/publisher")
+def publisher_health():
+    """
+    RabbitMQ publisher statistics.
+    """
+    return app.pika_client.stats()
+
+
+@app.get("/health/startup")
+def startup_health():
+    """
+    Warm-up time and outcome of each dependency at startup.
+    """
+    return app.resources.startup
+
+
+@app.get("/health/events")
+def events_health():
+    """
+    Order event hub and fanout statistics.
+    """
+    return {**app.order_events.stats(), "fanout": app.order_events_fanout.stats()}
+
+
+@app.get("/health/outbox")
+def outbox_health(db_session: Session = Depends(database.get_db)):
+    """
+    Outbox relay statistics.
+
+    :param db_session: Database session.
+    """
+    return {"pending": pending_events(db_session), **app.outbox_relay.stats()}
+
+
+@app.get("/health/carts")
+def carts_health():
+    """
+    Cart archiver statistics.
+    """
+    return app.cart_archiver.stats()
+
+
+@app.get("/health/stock")
+def stock_health(db_session: Session = Depends(database.get_db)):
+    """
+    Stock reservation statistics.
+
+    :param db_session: Database session.
+    """
+    return {"reserved": reserved_carts(db_session), **app.stock_reaper.stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Prometheus metrics.
+    """
+    payload, content_type = render()
+    return Response(payload, media_type=content_type)
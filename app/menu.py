@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import time
+from typing import Dict, List, NamedTuple
+
+from fastapi import Request, Response, status
+from pydantic import TypeAdapter
+
+from app.schemas.items import Item
+
+ITEMS_ADAPTER = TypeAdapter(List[Item])
+MENU_ADAPTER = TypeAdapter(Dict[str, List[Item]])
+
+FULL_MENU = "__menu__"
+
+
+class MenuEntry(NamedTuple):
+    body: bytes
+    etag: str
+    built_at: float
+
+
+class MenuSnapshot:
+    """
+    Pre-serialized menu responses.
+
+    Each category listing (and the full menu) is kept as JSON bytes with a
+    strong ETag until an item write invalidates the snapshot. Invalidation
+    is per process, so `ttl` bounds how stale another worker can be.
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.version = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> MenuEntry | None:
+        """
+        Get a fresh snapshot entry.
+
+        :param key: Category description or `FULL_MENU`.
+        """
+        entry = self._entries.get(key)
+
+        if entry and self.ttl and time.monotonic() - entry.built_at > self.ttl:
+            return None
+
+        return entry
+
+    def put(self, key: str, body: bytes, version: int) -> MenuEntry:
+        """
+        Store a serialized listing.
+
+        The entry is only kept if no write happened since `version` was read,
+        otherwise a stale listing could outlive the invalidation.
+
+        :param key: Category description or `FULL_MENU`.
+        :param body: Serialized JSON.
+        :param version: `version` read before querying the database.
+        """
+        entry = MenuEntry(
+            body=body,
+            etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            built_at=time.monotonic(),
+        )
+
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = entry
+
+        return entry
+
+    def invalidate(self):
+        """
+        Drop every snapshot, called after any menu item or stock write.
+        """
+        with self._lock:
+            self.version += 1
+            self._entries = {}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check the `If-None-Match` header against an ETag.
+
+    :param request: Request.
+    :param etag: Current ETag.
+    """
+    header = request.headers.get("if-none-match")
+
+    if not header:
+        return False
+
+    if header.strip() == "*":
+        return True
+
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+    return etag in tags
+
+
+def snapshot_response(entry: MenuEntry, request: Request) -> Response:
+    """
+    Build the response for a snapshot entry, 304 if the client has it.
+
+    :param entry: Menu snapshot entry.
+    :param request: Request.
+    """
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(
+        content=entry.body, media_type="application/json", headers=headers
+    )
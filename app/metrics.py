@@ -0,0 +1,217 @@
+"""
+Prometheus metrics.
+
+Series are recorded on the default `prometheus_client` registry and served
+by the `/metrics` route:
+
+- HTTP request latency per route, by `MetricsMiddleware`;
+- SQL query latency and queries per request, by engine cursor events
+  (`instrument_engine`);
+- MongoDB command latency, by a pymongo `CommandListener`;
+- RabbitMQ publish latency and failures, by `observe_publish`.
+
+Under `python -m app` with several workers each process writes its series
+to `PROMETHEUS_MULTIPROC_DIR` and `render` merges them, so a scrape served
+by any worker covers all of them.
+"""
+
+import contextvars
+import os
+import time
+from concurrent.futures import Future
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+from sqlalchemy import event
+
+# Dependency calls are much faster than whole requests
+FAST_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency.",
+    ["method", "route", "status"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "SQL query latency.",
+    ["operation"],
+    buckets=FAST_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total", "SQL queries that raised.", ["operation"]
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL queries run while serving one HTTP request.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Time spent in SQL queries while serving one HTTP request.",
+    ["route"],
+    buckets=FAST_BUCKETS,
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency.",
+    ["command", "outcome"],
+    buckets=FAST_BUCKETS,
+)
+PUBLISH_DURATION = Histogram(
+    "rabbit_publish_duration_seconds",
+    "Time from publish to broker confirm.",
+    buckets=FAST_BUCKETS,
+)
+PUBLISH_FAILURES = Counter(
+    "rabbit_publish_failures_total", "Messages the broker never confirmed."
+)
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Metrics exposition of this process, or of every worker.
+
+    :returns: Payload and its content type.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class RequestQueries:
+    """SQL queries run by the current request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# Set per request by the middleware. Sync routes run in worker threads that
+# copy the context, so the holder object is shared with them.
+current_queries = contextvars.ContextVar("current_queries", default=None)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request.
+
+    Routes are labelled with their path template, unmatched paths share a
+    single label so scanners can not blow up the series count.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_queries.reset(token)
+
+            route = scope.get("route")
+            route = getattr(route, "path", "unmatched")
+
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], route, str(status_code)
+            ).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(queries.count)
+            DB_TIME_PER_REQUEST.labels(route).observe(queries.duration)
+
+
+def _operation(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement else ""
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    elapsed = time.perf_counter() - context._metrics_start
+
+    DB_QUERY_DURATION.labels(_operation(statement)).observe(elapsed)
+
+    queries = current_queries.get()
+    if queries is not None:
+        queries.count += 1
+        queries.duration += elapsed
+
+
+def _handle_error(exception_context):
+    DB_QUERY_ERRORS.labels(_operation(exception_context.statement)).inc()
+
+
+def instrument_engine(engine):
+    """
+    Time every query run on a (sync) engine.
+
+    :param engine: SQLAlchemy engine, `AsyncEngine.sync_engine` for async.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener timing every MongoDB command."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.labels(event.command_name, "succeeded").observe(
+            event.duration_micros / 1e6
+        )
+
+    def failed(self, event):
+        MONGO_COMMAND_DURATION.labels(event.command_name, "failed").observe(
+            event.duration_micros / 1e6
+        )
+
+
+def observe_publish(future: Future, start: float):
+    """
+    Record a publish once the broker confirmed or the message was lost.
+
+    :param future: Publish future.
+    :param start: `time.perf_counter()` when the message was published.
+    """
+
+    def done(future: Future):
+        if future.exception() is not None:
+            PUBLISH_FAILURES.inc()
+        else:
+            PUBLISH_DURATION.observe(time.perf_counter() - start)
+
+    future.add_done_callback(done)
@@ -0,0 +1,17 @@
+from sqlalchemy import DateTime, Integer, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_key"
+
+    scope: Mapped[String(40)] = mapped_column(type_=String(40), primary_key=True)
+    key: Mapped[String(255)] = mapped_column(type_=String(255), primary_key=True)
+    fingerprint: Mapped[String(64)] = mapped_column(type_=String(64), nullable=False)  # noqa
+    # Both empty while the first request is running
+    status_code: Mapped[Integer] = mapped_column(type_=Integer, nullable=True)
+    response: Mapped[Text()] = mapped_column(type_=Text(), nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(
+        type_=DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Integer, Float, Text, String
+from sqlalchemy import ForeignKey, Index, Integer, Float, Text, String
 from sqlalchemy.orm import Mapped, mapped_column
 from app.database import Base
 
@@ -19,3 +19,6 @@ class Items(Base):
     category: Mapped[Integer] = mapped_column(ForeignKey("items_category.id"))
     amount: Mapped[Integer] = mapped_column(type_=Integer, nullable=False)
     price: Mapped[Float] = mapped_column(type_=Float, nullable=False)
+
+    # Category listings are ordered by id, read them straight off the index
+    __table_args__ = (Index("ix_items_category", "category", "id"),)
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy import ForeignKey, Index, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column
 from app.database import Base
 
@@ -14,7 +14,10 @@ class Order(Base):
     __tablename__ = 'order'
 
     id: Mapped[Integer] = mapped_column(type_=Integer, primary_key=True)
-    mongo_id: Mapped[String(120)] = mapped_column(type_=String(120))
+    mongo_id: Mapped[String(120)] = mapped_column(type_=String(120), index=True, unique=True)  # noqa
     customer_id: Mapped[Integer] = mapped_column(type_=Integer, nullable=True)
     status: Mapped[Integer] = mapped_column(ForeignKey("order_status.id"))
     # items: Mapped[JSONB] = mapped_column(type_=JSONB, nullable=False)
+
+    # Kitchen queue pages orders of a status by id
+    __table_args__ = (Index("ix_order_status_id", "status", "id"),)
@@ -0,0 +1,13 @@
+from sqlalchemy import DateTime, Integer, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox"
+
+    id: Mapped[Integer] = mapped_column(type_=Integer, primary_key=True)
+    payload: Mapped[Text()] = mapped_column(type_=Text(), nullable=False)
+    created_at: Mapped[DateTime] = mapped_column(
+        type_=DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
@@ -0,0 +1,17 @@
+from sqlalchemy import DateTime, Float, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+
+class SalesHourly(Base):
+    __tablename__ = "sales_hourly"
+
+    # Start of the hour (UTC) the cart was checked out
+    hour: Mapped[DateTime] = mapped_column(
+        type_=DateTime(timezone=True), primary_key=True
+    )
+    item_id: Mapped[Integer] = mapped_column(type_=Integer, primary_key=True)
+    # Category of the item when it was last sold, NULL if it was deleted
+    category: Mapped[Integer] = mapped_column(type_=Integer, nullable=True)
+    units: Mapped[Integer] = mapped_column(type_=Integer, nullable=False)
+    revenue: Mapped[Float] = mapped_column(type_=Float, nullable=False)
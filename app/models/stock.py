@@ -0,0 +1,17 @@
+from sqlalchemy import DateTime, Integer, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database import Base
+
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservation"
+
+    id: Mapped[Integer] = mapped_column(type_=Integer, primary_key=True)
+    # JSON object of reserved amounts by item id
+    items: Mapped[Text()] = mapped_column(type_=Text(), nullable=False)
+    created_at: Mapped[DateTime] = mapped_column(
+        type_=DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        index=True,
+    )
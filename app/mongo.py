@@ -1,26 +1,61 @@
-from pymongo import MongoClient
-from functools import lru_cache
-from app.main import logger
-from . import config
 
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
 
-@lru_cache()
-def get_settings():
-    """
-    Config settings function.
-    """
-    return config.Settings()
+from . import config
+from .metrics import MongoCommandMetrics
 
 
-conf_settings = get_settings()
+conf_settings = config.get_settings()
 
 MONGODB_URL = str(conf_settings.mongo_url)
 
 
+def client_options() -> dict:
+    """
+    MongoDB client pool, timeout and monitoring options from settings.
+    """
+    return {
+        "maxPoolSize": conf_settings.mongo_max_pool_size,
+        "minPoolSize": conf_settings.mongo_min_pool_size,
+        "waitQueueTimeoutMS": conf_settings.mongo_wait_queue_timeout_ms,
+        "connectTimeoutMS": conf_settings.mongo_connect_timeout_ms,
+        "serverSelectionTimeoutMS": (
+            conf_settings.mongo_server_selection_timeout_ms
+        ),
+        "socketTimeoutMS": conf_settings.mongo_socket_timeout_ms,
+        "event_listeners": [MongoCommandMetrics()],
+    }
+
+
+def write_concern() -> WriteConcern:
+    """
+    Cart write concern from settings.
+    """
+    w = conf_settings.mongo_write_concern
+
+    return WriteConcern(
+        w=int(w) if w.isdigit() else w, j=conf_settings.mongo_write_journal
+    )
+
+
 class Mongo():
+    """
+    Async MongoDB client.
 
-    def __init__(self):
-        self.client = MongoClient(MONGODB_URL)
+    Motor connects lazily on the first operation, so building the client
+    does not need the server to be up.
+    """
+
+    def __init__(self, url: str = None):
+        self.client = AsyncIOMotorClient(url or MONGODB_URL, **client_options())
         self.db = self.client[conf_settings.mongo_base]
 
         logger.info("MongoDB connection initialized")
+
+    def close(self):
+        """
+        Close pooled connections.
+        """
+        self.client.close()
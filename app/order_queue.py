@@ -0,0 +1,71 @@
+from typing import List, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.order import Order as OrderModel
+from app.schemas.order import OrderQueueEntry, OrderQueuePage, OrderStatusEnum
+
+
+class QueuePage(NamedTuple):
+    orders: List
+    next_after: int | None
+
+
+def queue_page(
+    db_session: Session, status_id: int, after: int, limit: int
+) -> QueuePage:
+    """
+    Page of the orders in a status, oldest first.
+
+    Keyset pagination over the `(status, id)` index: the page starts right
+    after the `after` id, so every page costs one short index range scan
+    however deep it is.
+
+    :param db_session: Database session.
+    :param status_id: Order status id.
+    :param after: Last order id of the previous page, 0 for the first.
+    :param limit: Page size.
+    """
+    rows = db_session.execute(
+        select(OrderModel.id, OrderModel.mongo_id, OrderModel.customer_id)
+        .where(OrderModel.status == status_id, OrderModel.id > after)
+        .order_by(OrderModel.id)
+        .limit(limit + 1)
+    ).all()
+
+    # One extra row tells whether there is a next page
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return QueuePage(rows, rows[-1].id)
+
+    return QueuePage(rows, None)
+
+
+def queue_response(
+    order_status: OrderStatusEnum, page: QueuePage, carts: dict | None
+) -> OrderQueuePage:
+    """
+    Build a queue page response.
+
+    :param order_status: Listed status.
+    :param page: Orders of the page.
+    :param carts: Carts by id when items were requested.
+    """
+    return OrderQueuePage(
+        status=order_status,
+        orders=[
+            OrderQueueEntry(
+                id=order.id,
+                external_id=order.mongo_id,
+                customer_id=order.customer_id,
+                items=(
+                    carts.get(order.mongo_id, {}).get("items")
+                    if carts is not None
+                    else None
+                ),
+            )
+            for order in page.orders
+        ],
+        next_after=page.next_after,
+    )
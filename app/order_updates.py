@@ -0,0 +1,63 @@
+from typing import Dict
+
+from sqlalchemy import Integer, String, column, text, update, values
+from sqlalchemy.orm import Session
+
+from app.models.order import Order as OrderModel
+
+
+def _changes_table(db_session: Session, changes: Dict[str, int]):
+    """
+    `(external_id, status)` rows as a derived table.
+    """
+    if db_session.get_bind().dialect.name == "postgresql":
+        return values(
+            column("external_id", String),
+            column("status", Integer),
+            name="changes",
+        ).data(list(changes.items()))
+
+    # SQLite cannot name the columns of a VALUES derived table
+    params = {}
+    rows = []
+    for index, (external_id, status) in enumerate(changes.items()):
+        rows.append(f"(:external_id_{index}, :status_{index})")
+        params[f"external_id_{index}"] = external_id
+        params[f"status_{index}"] = status
+
+    return (
+        text(
+            "SELECT column1 AS external_id, column2 AS status "
+            f"FROM (VALUES {', '.join(rows)})"
+        )
+        .bindparams(**params)
+        .columns(column("external_id", String), column("status", Integer))
+        .subquery("changes")
+    )
+
+
+def bulk_update_status(
+    db_session: Session, changes: Dict[str, int]
+) -> Dict[str, int]:
+    """
+    Set the status of many orders with one `UPDATE ... FROM (VALUES ...)`.
+
+    :param db_session: Database session.
+    :param changes: Status id by order external id.
+    :returns: Order id by external id of the updated orders.
+    """
+    if not changes:
+        return {}
+
+    changes_table = _changes_table(db_session, changes)
+
+    rows = db_session.execute(
+        update(OrderModel)
+        .where(OrderModel.mongo_id == changes_table.c.external_id)
+        .values(status=changes_table.c.status)
+        .returning(OrderModel.id, OrderModel.mongo_id),
+        execution_options={"synchronize_session": False},
+    ).all()
+    db_session.commit()
+
+    return {row.mongo_id: row.id for row in rows}
@@ -0,0 +1,214 @@
+"""
+Transactional outbox relay.
+
+Order events are inserted in the `outbox` table in the same transaction as
+the order, so an order is never committed without its event (nor an event
+published for a rolled back order). `OutboxRelay` claims batches of events
+with `SELECT ... FOR UPDATE SKIP LOCKED`, publishes them and deletes the
+rows the broker confirmed. Several relays (one per worker, or standalone
+with ``python -m app.outbox``) can run at once without publishing the same
+row twice; a crash between publish and delete republishes the batch, so
+delivery is at-least-once.
+"""
+
+import argparse
+import threading
+import time
+
+from loguru import logger
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import config, database
+from app.models.outbox import OutboxEvent
+from app.serialization import dumps
+
+
+conf_settings = config.get_settings()
+
+
+def outbox_event(message: dict) -> OutboxEvent:
+    """
+    Build the outbox row of a message.
+
+    :param message: Message payload.
+    """
+    return OutboxEvent(payload=dumps(message))
+
+
+def pending_events(db_session: Session) -> int:
+    """
+    Count events not relayed yet.
+
+    :param db_session: Database session.
+    """
+    return db_session.scalar(select(func.count()).select_from(OutboxEvent))
+
+
+class OutboxRelay:
+    """
+    Relay outbox rows to RabbitMQ.
+
+    `publisher` is a `PikaClient` or `PikaPublisher`; only its `publish`
+    method is used, which returns a future resolved on broker confirm.
+    """
+
+    def __init__(
+        self,
+        publisher,
+        session_factory=None,
+        batch_size: int = None,
+        poll_interval: float = None,
+        confirm_timeout: float = None,
+    ):
+        self.publisher = publisher
+        self.session_factory = session_factory or database.SessionLocal
+        self.batch_size = batch_size or conf_settings.outbox_batch_size
+        self.poll_interval = poll_interval or conf_settings.outbox_poll_interval
+        self.confirm_timeout = (
+            confirm_timeout or conf_settings.outbox_confirm_timeout
+        )
+
+        self.published = 0
+        self.failures = 0
+        self.batches = 0
+
+        self._thread = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+
+    def run_once(self) -> int:
+        """
+        Relay one batch of events.
+
+        :returns: Number of events published and deleted.
+        """
+        with self.session_factory() as db_session:
+            events = db_session.scalars(
+                select(OutboxEvent)
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+
+            if not events:
+                return 0
+
+            futures = []
+            for event in events:
+                future = self.publisher.publish(event.payload)
+                futures.append((event.id, future))
+
+                # A blocking publisher failing means the broker is down,
+                # keep the rest of the batch for the next round
+                if future.done() and future.exception():
+                    break
+
+            # Confirms of the whole batch are awaited together
+            deadline = time.monotonic() + self.confirm_timeout
+            published = []
+            for event_id, future in futures:
+                try:
+                    future.result(timeout=max(deadline - time.monotonic(), 0))
+                except Exception as exc:  # publish error or confirm timeout
+                    self.failures += 1
+                    logger.warning(
+                        "[Outbox] Event {} not published: {!r}", event_id, exc
+                    )
+                else:
+                    published.append(event_id)
+
+            if published:
+                db_session.execute(
+                    delete(OutboxEvent).where(OutboxEvent.id.in_(published))
+                )
+            db_session.commit()
+
+        self.published += len(published)
+        self.batches += 1
+
+        return len(published)
+
+    def notify(self):
+        """
+        Wake the relay thread up, called after an event is committed.
+        """
+        self._wakeup.set()
+
+    def start(self):
+        """
+        Start the relay thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self.run_forever, name="outbox-relay", daemon=True
+        )
+        self._thread.start()
+
+    def run_forever(self):
+        """
+        Relay events until `stop` is called.
+
+        Full batches are followed immediately by the next one, otherwise the
+        relay sleeps until notified or `poll_interval` elapses.
+        """
+        while not self._stopping.is_set():
+            try:
+                count = self.run_once()
+            except SQLAlchemyError as exc:
+                logger.warning("[Outbox] Relay failed: {}", exc)
+                count = 0
+
+            if count < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stop the relay thread after the current batch.
+
+        :param timeout: Seconds to wait for the thread.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """
+        Relay counters.
+        """
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "published": self.published,
+            "failures": self.failures,
+            "batches": self.batches,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--once", action="store_true", help="relay one batch")
+    args = parser.parse_args()
+
+    # The app builds the publisher configured by `rabbit_publish_mode`
+    from app.main import app
+
+    relay = OutboxRelay(app.pika_client, batch_size=args.batch_size)
+    app.pika_client.start()
+
+    try:
+        if args.once:
+            logger.info("[Outbox] Published {} events", relay.run_once())
+        else:
+            relay.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.pika_client.close()
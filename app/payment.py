@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+
+import httpx
+from loguru import logger
+
+from . import config
+
+
+conf_settings = config.get_settings()
+
+# Responses worth retrying, anything else is the caller's fault
+RETRY_STATUS = {502, 503, 504}
+
+
+class PaymentServiceError(Exception):
+    """Payment service could not be reached or failed."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `threshold` failed calls the circuit opens and calls fail fast
+    for `reset_timeout` seconds, then a single trial call is let through
+    (half-open). Its success closes the circuit again.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """
+        Whether a call may be attempted now.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class PaymentClient:
+    """
+    Payment service client.
+
+    Keeps one pooled `httpx.AsyncClient` (keep-alive, optional HTTP/2) for
+    the whole process, with bounded retries and a circuit breaker so a slow
+    payment service fails checkouts fast instead of piling them up.
+    """
+
+    def __init__(self, base_url: str = None, transport=None):
+        self.base_url = base_url or conf_settings.payment_service_url
+        self.transport = transport
+        self.retries = conf_settings.payment_retries
+        self.retry_backoff = conf_settings.payment_retry_backoff
+        self.breaker = CircuitBreaker(
+            threshold=conf_settings.payment_breaker_threshold,
+            reset_timeout=conf_settings.payment_breaker_reset,
+        )
+
+        self._client = None
+        self._loop = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            transport=self.transport,
+            http2=conf_settings.payment_http2,
+            timeout=httpx.Timeout(
+                conf_settings.payment_timeout,
+                connect=conf_settings.payment_connect_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=conf_settings.payment_max_connections,
+                max_keepalive_connections=conf_settings.payment_max_keepalive,
+                keepalive_expiry=conf_settings.payment_keepalive_expiry,
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Pooled HTTP client bound to the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        # Pooled connections belong to the loop that opened them
+        if self._client is None or self._loop is not loop:
+            self._client = self._build_client()
+            self._loop = loop
+
+        return self._client
+
+    async def _post(self, payload: dict) -> httpx.Response:
+        """
+        Post a QRCode request, retrying transport errors and `RETRY_STATUS`.
+
+        :raises PaymentServiceError: Every attempt failed.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.post("/qrcode", json=payload)
+            except httpx.TransportError as exc:
+                error = exc
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                error = httpx.HTTPStatusError(
+                    f"Payment service returned {response.status_code}",
+                    request=response.request,
+                    response=response,
+                )
+
+            logger.warning("Payment request {} failed: {!r}", attempt + 1, error)
+
+            if attempt < self.retries:
+                await asyncio.sleep(self.retry_backoff * 2**attempt)
+
+        raise PaymentServiceError(str(error))
+
+    async def create_qrcode(self, external_id: str, value: float) -> dict:
+        """
+        Request a payment QRCode.
+
+        :param external_id: Order cart id.
+        :param value: Order total.
+        :raises PaymentServiceError: Service unavailable or circuit open.
+        """
+        if not self.breaker.allow():
+            raise PaymentServiceError("Payment service circuit is open")
+
+        payload = {"external_id": external_id, "value": value}
+
+        try:
+            response = await self._post(payload)
+            if response.status_code >= 500:
+                raise PaymentServiceError(
+                    f"Payment service returned {response.status_code}"
+                )
+            body = None if response.is_error else response.json()
+        except BaseException:
+            # Cancelled or unreadable calls too, a half-open trial must end
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+
+        if response.is_error:
+            # A 4xx is a bad request, not an unhealthy service
+            raise PaymentServiceError(
+                f"Payment service returned {response.status_code}"
+            )
+
+        return body
+
+    async def aclose(self):
+        """
+        Close pooled connections.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -1,23 +1,38 @@
-import json
+import collections
+import functools
+import queue
+import threading
+import time
 import uuid
-from functools import lru_cache
+from concurrent.futures import Future
 
 import pika
-
-from app.main import logger
+from loguru import logger
+from pika.exceptions import AMQPError, NackError, UnroutableError
 
 from . import config
+from .metrics import observe_publish
+from .serialization import dumps
+
+
+conf_settings = config.get_settings()
 
 
-@lru_cache()
-def get_settings():
+def connection_parameters() -> pika.ConnectionParameters:
     """
-    Config settings function.
+    RabbitMQ connection parameters from settings.
     """
-    return config.Settings()
+    credentials = pika.PlainCredentials(
+        conf_settings.rabbit_user, conf_settings.rabbit_pass
+    )
 
+    return pika.ConnectionParameters(
+        host=conf_settings.rabbit_host, credentials=credentials
+    )
 
-conf_settings = get_settings()
+
+class PublishError(Exception):
+    """Message could not be handed to the broker."""
 
 
 class PikaClient:
@@ -31,27 +46,37 @@ class PikaClient:
         self.callback_queue = None
         # self.response = None
 
+        # BlockingConnection is not thread-safe, every threadpool worker
+        # publishes through the same channel
+        self._lock = threading.Lock()
+        self.published = 0
+        self.failures = 0
+        self.reconnects = 0
+
         logger.info("Pika connection initialized")
 
     def _connect(self):
-        credentials = pika.PlainCredentials(
-            conf_settings.rabbit_user, conf_settings.rabbit_pass
-        )
-
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=conf_settings.rabbit_host, credentials=credentials
-            )
-        )
+        self.connection = pika.BlockingConnection(connection_parameters())
         self.channel = self.connection.channel()
         self.publish_queue = self.channel.queue_declare(
             queue=self.publish_queue_name
         )  # noqa
         self.callback_queue = self.publish_queue.method.queue
+        # basic_publish only returns once the broker confirmed the message
+        self.channel.confirm_delivery()
 
-    def send_message(self, message: dict):
-        """Method to publish message to RabbitMQ"""
-        if not self.connection:
+    def _disconnect(self):
+        connection, self.connection = self.connection, None
+
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except (AMQPError, OSError):
+                # Already broken, its socket is released either way
+                pass
+
+    def _publish(self, body: str):
+        if not self.connection or self.connection.is_closed:
             self._connect()
 
         self.channel.basic_publish(
@@ -60,6 +85,381 @@ class PikaClient:
             properties=pika.BasicProperties(
                 reply_to=self.callback_queue, correlation_id=str(uuid.uuid4())
             ),
-            body=json.dumps(message),
+            body=body,
+        )
+
+    def start(self):
+        """
+        Nothing to start, the connection is opened on first publish.
+        """
+
+    def publish(self, body: str) -> Future:
+        """
+        Publish a serialized message and wait for the broker confirm.
+
+        :param body: JSON message.
+        :returns: Future already resolved with the publish outcome.
+        """
+        future = Future()
+        observe_publish(future, time.perf_counter())
+
+        with self._lock:
+            try:
+                try:
+                    self._publish(body)
+                except (NackError, UnroutableError):
+                    # Refused by a healthy broker, the connection is kept
+                    raise
+                except AMQPError:
+                    # Broker dropped the connection, reconnect once and retry
+                    self.failures += 1
+                    self.reconnects += 1
+                    self._disconnect()
+                    self._publish(body)
+            except AMQPError as exc:
+                self.failures += 1
+                future.set_exception(PublishError(repr(exc)))
+            else:
+                self.published += 1
+                future.set_result(True)
+
+        return future
+
+    def send_message(self, message: dict):
+        """Method to publish message to RabbitMQ"""
+        self.publish(dumps(message)).result()
+
+        logger.debug("[RMQ] Published order {}", message.get("id"))
+
+    def stats(self) -> dict:
+        """
+        Publish counters.
+        """
+        return {
+            "mode": "sync",
+            "connected": bool(self.connection and self.connection.is_open),
+            "published": self.published,
+            "failures": self.failures,
+            "reconnects": self.reconnects,
+        }
+
+    def close(self):
+        """
+        Close the broker connection.
+        """
+        with self._lock:
+            self._disconnect()
+
+
+class PikaPublisher:
+    """
+    Background RabbitMQ publisher.
+
+    `send_message` only serializes the message into a bounded in-process
+    buffer and returns. A dedicated thread owns an asynchronous
+    (`SelectConnection`) connection with a pool of channels in publisher
+    confirm mode and drains the buffer into them, keeping at most
+    `confirm_window` unconfirmed messages per channel. The broker acks those
+    in batches (`multiple=True`); nacked messages and messages still
+    unconfirmed when the connection drops are published again after the
+    automatic reconnect, so delivery is at-least-once.
+
+    When the buffer is full `send_message` waits up to `enqueue_timeout`
+    seconds and then drops the message, both are reported by `stats`.
+    `publish` returns a future resolved once the broker acks the message.
+    """
+
+    def __init__(self):
+        self.publish_queue_name = conf_settings.publish_queue
+        self.channel_count = conf_settings.rabbit_publisher_channels
+        self.confirm_window = conf_settings.rabbit_confirm_window
+        self.enqueue_timeout = conf_settings.rabbit_enqueue_timeout
+        self.reconnect_delay = conf_settings.rabbit_reconnect_delay
+
+        self.buffer = queue.Queue(maxsize=conf_settings.rabbit_publish_buffer)
+
+        self._connection = None
+        self._channels = {}
+        self._pending = {}
+        self._delivery_tags = {}
+        self._retry = collections.deque()
+        self._thread = None
+        self._stopping = False
+        self._wakeup_pending = False
+        self._lock = threading.Lock()
+
+        self.published = 0
+        self.confirmed = 0
+        self.nacked = 0
+        self.republished = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.enqueue_wait_max = 0.0
+        self.reconnects = 0
+
+        logger.info("Pika background publisher initialized")
+
+    # Producer side (request threads / event loop)
+
+    def start(self):
+        """
+        Start the publisher thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name="pika-publisher", daemon=True
+        )
+        self._thread.start()
+
+    def publish(self, body: str) -> Future:
+        """
+        Queue a serialized message to be published to RabbitMQ.
+
+        :param body: JSON message.
+        :returns: Future resolved when the broker confirms the message,
+            failed with `PublishError` if it was dropped.
+        """
+        future = Future()
+        observe_publish(future, time.perf_counter())
+        entry = (body, future)
+
+        try:
+            self.buffer.put_nowait(entry)
+        except queue.Full:
+            start = time.perf_counter()
+            try:
+                self.buffer.put(entry, timeout=self.enqueue_timeout)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+                future.set_exception(PublishError("Publish buffer full"))
+                return future
+            finally:
+                with self._lock:
+                    self.blocked += 1
+                    self.enqueue_wait_max = max(
+                        self.enqueue_wait_max, time.perf_counter() - start
+                    )
+
+        self._wakeup()
+
+        return future
+
+    def send_message(self, message: dict):
+        """
+        Queue a message to be published to RabbitMQ.
+
+        :param message: Message payload.
+        """
+        future = self.publish(dumps(message))
+
+        if future.done() and future.exception():
+            logger.error(
+                "[RMQ] Publish buffer full, dropped order {}", message.get("id")
+            )
+            return
+
+        logger.debug("[RMQ] Queued order {}", message.get("id"))
+
+    def _wakeup(self):
+        connection = self._connection
+
+        if self._wakeup_pending or not connection or not connection.is_open:
+            return
+
+        self._wakeup_pending = True
+        try:
+            connection.ioloop.add_callback_threadsafe(self._drain)
+        except AMQPError:
+            self._wakeup_pending = False
+
+    def stats(self) -> dict:
+        """
+        Publisher and backpressure counters.
+        """
+        with self._lock:
+            return {
+                "mode": "background",
+                "connected": bool(self._connection and self._connection.is_open),
+                "channels": len(self._channels),
+                "queue_depth": self.buffer.qsize() + len(self._retry),
+                "queue_capacity": self.buffer.maxsize,
+                "in_flight": sum(len(tags) for tags in self._pending.values()),
+                "published": self.published,
+                "confirmed": self.confirmed,
+                "nacked": self.nacked,
+                "republished": self.republished,
+                "blocked": self.blocked,
+                "dropped": self.dropped,
+                "enqueue_wait_max_ms": self.enqueue_wait_max * 1000,
+                "reconnects": self.reconnects,
+            }
+
+    def close(self, timeout: float = 5.0):
+        """
+        Flush queued messages (up to `timeout` seconds) and stop.
+
+        :param timeout: Seconds to wait for the buffer to drain.
+        """
+        deadline = time.monotonic() + timeout
+        while self._thread and time.monotonic() < deadline:
+            if self.stats()["queue_depth"] == 0 and not self.stats()["in_flight"]:
+                break
+            time.sleep(0.05)
+
+        self._stopping = True
+        connection = self._connection
+        if connection and connection.is_open:
+            connection.ioloop.add_callback_threadsafe(connection.close)
+
+        if self._thread:
+            self._thread.join(timeout)
+
+    # Publisher thread
+
+    def _run(self):
+        while not self._stopping:
+            self._connection = pika.SelectConnection(
+                connection_parameters(),
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_error,
+                on_close_callback=self._on_connection_closed,
+            )
+            self._connection.ioloop.start()
+
+            if not self._stopping:
+                self.reconnects += 1
+                time.sleep(self.reconnect_delay)
+
+    def _on_connection_open(self, connection):
+        logger.info("[RMQ] Publisher connected")
+
+        for _ in range(self.channel_count):
+            connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error):
+        logger.error("[RMQ] Publisher connection failed: {!r}", error)
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        for channel_number in list(self._channels):
+            self._forget_channel(channel_number)
+
+        if not self._stopping:
+            logger.warning("[RMQ] Publisher connection closed: {!r}", reason)
+
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.queue_declare(
+            queue=self.publish_queue_name,
+            callback=lambda _frame: channel.confirm_delivery(
+                functools.partial(self._on_confirm, channel.channel_number),
+                callback=lambda _frame: self._on_channel_ready(channel),
+            ),
         )
-        logger.debug(f"[RMQ] Publish: {message}")
+
+    def _on_channel_ready(self, channel):
+        with self._lock:
+            self._channels[channel.channel_number] = channel
+            self._pending[channel.channel_number] = collections.OrderedDict()
+            self._delivery_tags[channel.channel_number] = 0
+
+        self._drain()
+
+    def _on_channel_closed(self, channel, reason):
+        self._forget_channel(channel.channel_number)
+
+        connection = self._connection
+        if not self._stopping and connection and connection.is_open:
+            logger.warning("[RMQ] Publisher channel closed: {!r}", reason)
+            connection.channel(on_open_callback=self._on_channel_open)
+
+    def _forget_channel(self, channel_number: int):
+        """
+        Drop a channel, its unconfirmed messages go back to the buffer.
+        """
+        with self._lock:
+            self._channels.pop(channel_number, None)
+            pending = self._pending.pop(channel_number, {})
+            self._retry.extend(pending.values())
+            self.republished += len(pending)
+
+    def _next_message(self) -> tuple | None:
+        if self._retry:
+            return self._retry.popleft()
+        try:
+            return self.buffer.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _drain(self):
+        """
+        Publish buffered messages while channels have confirm window left.
+        """
+        self._wakeup_pending = False
+
+        for channel_number, channel in list(self._channels.items()):
+            pending = self._pending[channel_number]
+
+            while len(pending) < self.confirm_window:
+                entry = self._next_message()
+                if entry is None:
+                    return
+
+                body, _future = entry
+
+                try:
+                    channel.basic_publish(
+                        exchange="",
+                        routing_key=self.publish_queue_name,
+                        properties=pika.BasicProperties(
+                            correlation_id=str(uuid.uuid4())
+                        ),
+                        body=body,
+                    )
+                except AMQPError:
+                    self._retry.appendleft(entry)
+                    break
+
+                with self._lock:
+                    self._delivery_tags[channel_number] += 1
+                    pending[self._delivery_tags[channel_number]] = entry
+                    self.published += 1
+
+    def _on_confirm(self, channel_number: int, frame):
+        """
+        Handle a (possibly batched) broker ack or nack.
+        """
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+
+        with self._lock:
+            pending = self._pending.get(channel_number)
+            if pending is None:
+                return
+
+            if method.multiple:
+                tags = [tag for tag in pending if tag <= method.delivery_tag]
+            else:
+                tags = [method.delivery_tag]
+
+            entries = [pending.pop(tag) for tag in tags if tag in pending]
+
+            if acked:
+                self.confirmed += len(entries)
+            else:
+                self.nacked += len(entries)
+                self._retry.extend(entries)
+
+        if acked:
+            for _body, future in entries:
+                future.set_result(True)
+        else:
+            logger.warning("[RMQ] Broker nacked {} messages", len(entries))
+
+        self._drain()
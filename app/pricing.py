@@ -0,0 +1,90 @@
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.items import Items as ItemsModel
+
+
+class CartItemError(Exception):
+    """Cart references unknown or out of stock items."""
+
+    def __init__(self, errors: List[dict]):
+        super().__init__(f"{len(errors)} invalid cart items")
+        self.errors = errors
+
+
+class PricedCart(NamedTuple):
+    items: List[dict]
+    total: float
+
+
+def requested_amounts(items: List[dict]) -> Dict[int, int]:
+    """
+    Amount of each item in a cart, the same item may be listed twice.
+
+    :param items: Cart items, dicts with `id` and `amount`.
+    """
+    requested = {}
+    for item in items:
+        requested[item["id"]] = requested.get(item["id"], 0) + item["amount"]
+
+    return requested
+
+
+def resolve_cart(db_session: Session, items: List[dict]) -> PricedCart:
+    """
+    Price cart items from the menu.
+
+    Every referenced item is loaded with a single `IN` query, whatever the
+    cart size, and prices always come from the database.
+
+    :param db_session: Database session.
+    :param items: Cart items, dicts with `id` and `amount`.
+    :raises CartItemError: Unknown items or not enough stock.
+    """
+    # Same item may be listed more than once, stock is checked on the sum
+    requested = requested_amounts(items)
+
+    rows = {
+        row.id: row
+        for row in db_session.execute(
+            select(
+                ItemsModel.id, ItemsModel.title, ItemsModel.amount, ItemsModel.price
+            ).where(ItemsModel.id.in_(requested))
+        )
+    }
+
+    errors = []
+    for item_id, amount in requested.items():
+        row = rows.get(item_id)
+        if row is None:
+            errors.append({"id": item_id, "error": "unknown item"})
+        elif amount > row.amount:
+            errors.append(
+                {
+                    "id": item_id,
+                    "error": "out of stock",
+                    "requested": amount,
+                    "available": row.amount,
+                }
+            )
+
+    if errors:
+        raise CartItemError(errors)
+
+    priced = []
+    total = 0.0
+    for item in items:
+        row = rows[item["id"]]
+        priced.append(
+            {
+                "id": row.id,
+                "title": row.title,
+                "amount": item["amount"],
+                "price": row.price,
+            }
+        )
+        total += row.price * item["amount"]
+
+    return PricedCart(items=priced, total=round(total, 2))
@@ -0,0 +1,159 @@
+"""
+Process resources.
+
+Clients owning sockets, pools or threads (database engines, MongoDB,
+RabbitMQ, payment service, outbox relay) are registered on a `Resources`
+container instead of being built at import. Each one is opened on first
+use by the process using it, warmed up concurrently when the app starts
+and closed when it stops.
+"""
+
+import asyncio
+import inspect
+import threading
+import time
+
+from loguru import logger
+
+
+class Resource:
+    """
+    How to open, warm up and close one resource.
+    """
+
+    def __init__(self, name: str, open, warm=None, close=None):
+        """
+        :param name: Resource name.
+        :param open: Builds the resource, must not do network I/O.
+        :param warm: Called with the resource at startup (connect, preload).
+        :param close: Called with the resource at shutdown.
+        """
+        self.name = name
+        self.open = open
+        self.warm = warm
+        self.close = close
+
+
+async def _call(function, *args):
+    """
+    Await a coroutine function, run anything else in a worker thread so
+    blocking drivers do not hold the event loop.
+    """
+    if inspect.iscoroutinefunction(function):
+        return await function(*args)
+
+    return await asyncio.to_thread(function, *args)
+
+
+class Resources:
+    """
+    Lazily opened resources of the process.
+
+    `get` is thread-safe: threadpool routes and the event loop share the
+    same instances.
+    """
+
+    def __init__(self):
+        self._resources = {}
+        self._opened = {}
+        # Opening a resource may get the ones it depends on
+        self._lock = threading.RLock()
+
+        self.startup = {}
+
+    def register(self, name: str, open, warm=None, close=None):
+        """
+        Register a resource, see `Resource`.
+        """
+        self._resources[name] = Resource(name, open, warm, close)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._resources
+
+    def get(self, name: str):
+        """
+        The resource, opened on first call.
+
+        :param name: Resource name.
+        """
+        try:
+            return self._opened[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if name not in self._opened:
+                self._opened[name] = self._resources[name].open()
+            return self._opened[name]
+
+    def opened(self) -> list:
+        """
+        Names of the resources opened by this process, in opening order.
+        """
+        return list(self._opened)
+
+    async def _warm(self, resource: Resource):
+        start = time.perf_counter()
+        error = None
+
+        try:
+            await _call(resource.warm, self.get(resource.name))
+        except Exception as exc:
+            # Not fatal: the resource is retried on first use
+            error = repr(exc)
+            logger.warning("{} not warmed up: {}", resource.name, exc)
+
+        self.startup[resource.name] = {
+            "seconds": round(time.perf_counter() - start, 4),
+            "ok": error is None,
+            "error": error,
+        }
+
+    async def warm_up(self):
+        """
+        Open and warm up every resource, concurrently.
+        """
+        start = time.perf_counter()
+
+        await asyncio.gather(
+            *(
+                self._warm(resource)
+                for resource in self._resources.values()
+                if resource.warm
+            )
+        )
+
+        logger.info(
+            "Resources warmed up in {:.3f}s: {}",
+            time.perf_counter() - start,
+            ", ".join(
+                f"{name} {timing['seconds']:.3f}s"
+                for name, timing in self.startup.items()
+            ),
+        )
+
+    async def close(self):
+        """
+        Close the opened resources, in reverse opening order.
+        """
+        with self._lock:
+            opened = list(self._opened.items())
+            self._opened.clear()
+
+        for name, value in reversed(opened):
+            close = self._resources[name].close
+            if close is None:
+                continue
+
+            try:
+                await _call(close, value)
+            except Exception as exc:
+                logger.warning("{} not closed: {}", name, exc)
+
+    def forget(self):
+        """
+        Drop the resources inherited from the parent of a forked process,
+        without closing them: their sockets and threads belong to the parent.
+        """
+        with self._lock:
+            self._opened.clear()
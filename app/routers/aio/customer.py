@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.customers import MISSING
+from app.models.customer import Customer as CustomerModel
+from app.schemas.customer import Customer, CustomerIdentify, CustomerRegister
+from app.schemas.http import DefaultResponse
+from app.serialization import model_response
+
+from ... import database
+
+router = APIRouter()
+
+
+@router.post(
+    "/register", response_model=DefaultResponse, status_code=status.HTTP_201_CREATED
+)
+async def register_customer(
+    customer: CustomerRegister,
+    request: Request,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Regiser a new customer.
+
+    :param customer: Customer schema.
+    :param db_session: Async database session.
+    """
+    db_customer = CustomerModel(**customer.model_dump())
+    db_session.add(db_customer)
+    await db_session.commit()
+    await db_session.refresh(db_customer)
+    request.app.customers.invalidate(db_customer.cpf)
+
+    logger.debug("Customer {} registered", db_customer.cpf)
+
+    return {"detail": f"Customer {db_customer.cpf} registered"}
+
+
+@router.post("/identify", response_model=Customer)
+async def identify_customer(
+    identity: CustomerIdentify,
+    request: Request,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Get customer data by its CPF.
+
+    Served from the customer cache, unknown CPFs included.
+
+    :param identity: CustomerIdentify schema (cpf).
+    :param db_session: Async database session.
+    """
+    customer = request.app.customers.get(identity.cpf)
+
+    if customer is MISSING:
+        db_customer = await db_session.scalar(
+            select(CustomerModel).filter(CustomerModel.cpf == identity.cpf).limit(1)
+        )
+        customer = Customer.model_validate(db_customer) if db_customer else None
+        request.app.customers.put(identity.cpf, customer)
+
+    if not customer:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Customer not registered"
+        )
+
+    return model_response(customer)
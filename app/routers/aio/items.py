@@ -0,0 +1,201 @@
+from typing import Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.menu import FULL_MENU, ITEMS_ADAPTER, MENU_ADAPTER, snapshot_response
+from app.models.items import Items as ItemsModel
+from app.models.items import ItemsCategory as ItemsCategoryModel
+from app.schemas.http import DefaultResponse
+from app.schemas.items import Item, ItemCategoryEnum, ItemRegister
+from app.serialization import model_response
+
+from ... import database
+
+router = APIRouter()
+
+
+@router.post("/register", response_model=Item, status_code=status.HTTP_201_CREATED)
+async def register_item(
+    item: ItemRegister,
+    request: Request,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Register a new menu item.
+
+    :param item: Item schema.
+    :param db_session: Async database session.
+    """
+    item_raw = item.model_dump()
+
+    # Get item category id
+    lookups = await db_session.run_sync(request.app.lookups.ensure_loaded)
+    item_raw["category"] = lookups.items_category.id_of(item.category)
+
+    db_item = ItemsModel(**item_raw)
+    db_session.add(db_item)
+    await db_session.commit()
+    await db_session.refresh(db_item)
+    request.app.menu.invalidate()
+
+    logger.debug("Menu item {} registered", db_item.title)
+
+    return model_response(
+        Item(
+            id=db_item.id,
+            title=db_item.title,
+            description=db_item.description,
+            category=item.category,
+            amount=db_item.amount,
+            price=db_item.price,
+        ),
+        status.HTTP_201_CREATED,
+    )
+
+
+@router.put("/update", response_model=Item)
+async def update_item(
+    item: Item,
+    request: Request,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Update a menu item.
+
+    :param item: Item schema.
+    :param db_session: Async database session.
+    """
+    db_item = await db_session.get(ItemsModel, item.id)
+
+    if not db_item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Item not found"
+        )
+
+    lookups = await db_session.run_sync(request.app.lookups.ensure_loaded)
+
+    db_item.title = item.title
+    db_item.description = item.description
+    db_item.amount = item.amount
+    db_item.price = item.price
+    db_item.category = lookups.items_category.id_of(item.category)
+
+    db_session.add(db_item)
+    await db_session.commit()
+    await db_session.refresh(db_item)
+    request.app.menu.invalidate()
+
+    logger.debug("Menu item {} updated", db_item.title)
+
+    return model_response(
+        Item(
+            id=db_item.id,
+            title=db_item.title,
+            description=db_item.description,
+            category=item.category,
+            amount=db_item.amount,
+            price=db_item.price,
+        )
+    )
+
+
+@router.delete("/delete/{item_id}", response_model=DefaultResponse)
+async def delete_item(
+    item_id: int,
+    request: Request,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Delete a menu item.
+
+    :param item_id: Item id.
+    :param db_session: Async database session.
+    """
+    db_item = await db_session.get(ItemsModel, item_id)
+
+    if not db_item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Item not found"
+        )
+
+    await db_session.delete(db_item)
+    await db_session.commit()
+    request.app.menu.invalidate()
+
+    return {"detail": f"Item {db_item.title} deleted"}
+
+
+def _menu_query():
+    return select(
+        ItemsModel.id,
+        ItemsModel.title,
+        ItemsModel.description,
+        ItemsModel.amount,
+        ItemsModel.price,
+        ItemsCategoryModel.description.label("category"),
+    ).join(ItemsCategoryModel)
+
+
+@router.get("/list/{category}", response_model=List[Item])
+async def list_items_by_category(
+    category: ItemCategoryEnum,
+    request: Request,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    List menu items of a category.
+
+    Served from the menu snapshot, unchanged listings return 304.
+
+    :param category: Item Category.
+    :param db_session: Async database session.
+    """
+    menu = request.app.menu
+    entry = menu.get(category.value)
+
+    if entry is None:
+        version = menu.version
+        # Filter on the category id so the (category, id) index is used
+        lookups = await db_session.run_sync(request.app.lookups.ensure_loaded)
+        result = await db_session.execute(
+            _menu_query()
+            .filter(ItemsModel.category == lookups.items_category.id_of(category))
+            .order_by(ItemsModel.id)
+        )
+        body = ITEMS_ADAPTER.dump_json(
+            ITEMS_ADAPTER.validate_python(result.all(), from_attributes=True)
+        )
+        entry = menu.put(category.value, body, version)
+
+    return snapshot_response(entry, request)
+
+
+@router.get("/menu", response_model=Dict[ItemCategoryEnum, List[Item]])
+async def list_menu(
+    request: Request, db_session: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    List all menu items grouped by category.
+
+    Served from the menu snapshot, unchanged menus return 304.
+
+    :param db_session: Async database session.
+    """
+    menu = request.app.menu
+    entry = menu.get(FULL_MENU)
+
+    if entry is None:
+        version = menu.version
+        grouped = {category.value: [] for category in ItemCategoryEnum}
+        result = await db_session.execute(_menu_query().order_by(ItemsModel.id))
+        for item in result.all():
+            grouped.setdefault(item.category, []).append(item)
+        body = MENU_ADAPTER.dump_json(
+            MENU_ADAPTER.validate_python(grouped, from_attributes=True)
+        )
+        entry = menu.put(FULL_MENU, body, version)
+
+    return snapshot_response(entry, request)
@@ -0,0 +1,391 @@
+from datetime import datetime
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    status,
+)
+from loguru import logger
+from pymongo.errors import PyMongoError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.idempotency import IdempotentRequest
+from app.models.order import Order as OrderModel
+from app.order_queue import queue_page, queue_response
+from app.order_updates import bulk_update_status
+from app.outbox import outbox_event
+from app.pricing import resolve_cart
+from app.sales import record_sales, sales_stats, stats_range, stats_response
+from app.schemas.order import (
+    OrderBulkUpdate,
+    OrderBulkUpdateResponse,
+    OrderBulkUpdateResult,
+    OrderCheckout,
+    OrderCheckoutResponse,
+    OrderCreate,
+    OrderCreateResponse,
+    OrderQueuePage,
+    OrderStatusEnum,
+    OrderUpdate,
+    OrderUpdateResponse,
+    SalesGroupEnum,
+    SalesStats,
+)
+from app.serialization import model_response
+from app.stock import confirm_reservation, release_reservation, reserve_stock
+
+from ... import config, database
+
+
+conf_settings = config.get_settings()
+
+router = APIRouter()
+
+
+@router.post(
+    "/checkout",
+    response_model=OrderCheckoutResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def checkout(
+    order: OrderCheckout,
+    request: Request,
+    idempotency_key: str | None = Header(default=None, max_length=255),
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Checkout the cart with items.
+
+    :param order: Order checkout schema.
+    :param db_session: Async database session.
+    """
+    idempotent = IdempotentRequest("checkout", idempotency_key, order)
+    replay = await db_session.run_sync(idempotent.claim)
+    if replay is not None:
+        return replay
+
+    async with idempotent.releasing_async(db_session):
+        order_raw = order.model_dump()
+
+        # Price every item from the menu in a single query
+        cart = await db_session.run_sync(resolve_cart, order_raw["items"])
+        final_price = cart.total
+
+        # Take the stock of the whole cart, committed before the slow calls
+        reservation_id = await db_session.run_sync(reserve_stock, cart.items)
+        request.app.menu.invalidate()
+
+        # Give the connection back before the slow external calls
+        await db_session.close()
+
+        order_raw["items"] = cart.items
+        order_raw["total"] = final_price
+        order_raw["reservation_id"] = reservation_id
+
+        try:
+            # Create order cart on mongo db
+            order_id = await request.app.carts.create(order_raw)
+
+            # Call payment service to generate QRCode
+            payment = await request.app.payment.create_qrcode(order_id, final_price)
+        except BaseException:
+            # The cart can not be ordered, give its stock back now
+            await db_session.run_sync(release_reservation, reservation_id)
+            request.app.menu.invalidate()
+            raise
+
+        logger.debug("Checking out cart {}", order_id)
+
+        response = OrderCheckoutResponse(**payment)
+
+        await db_session.run_sync(
+            idempotent.save, response, status.HTTP_201_CREATED
+        )
+        await db_session.commit()
+
+    return model_response(response, status.HTTP_201_CREATED)
+
+
+@router.post(
+    "/create", response_model=OrderCreateResponse, status_code=status.HTTP_201_CREATED
+)
+async def register_order(
+    checkout: OrderCreate,
+    request: Request,
+    idempotency_key: str | None = Header(default=None, max_length=255),
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Create a new order.
+
+    :param order: Order schema.
+    :param db_session: Async database session.
+    """
+    idempotent = IdempotentRequest("order_create", idempotency_key, checkout)
+    replay = await db_session.run_sync(idempotent.claim)
+    if replay is not None:
+        return replay
+
+    async with idempotent.releasing_async(db_session):
+        checkout = checkout.model_dump()
+
+        # Read the fields the order needs from its cart
+        order = await request.app.carts.get_order(checkout["external_id"])
+
+        if not order:
+            logger.error("Order {} not found on MongoDB!", checkout["external_id"])
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Order not found"
+            )
+
+        # Get order status id
+        lookups = await db_session.run_sync(request.app.lookups.ensure_loaded)
+        order_status = OrderStatusEnum.received
+
+        db_order = OrderModel(
+            mongo_id=checkout["external_id"],
+            customer_id=order["customer_id"],
+            status=lookups.order_status.id_of(order_status),
+        )
+        db_session.add(db_order)
+
+        # A retry without key is stopped by the unique mongo_id
+        try:
+            await db_session.flush()
+        except IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail="Order already created"
+            ) from None
+
+        # The cart's reserved stock is sold with the order, once it is known
+        # not to be a duplicate
+        restocked = await db_session.run_sync(confirm_reservation, order)
+
+        # Order event is committed with the order and relayed to RabbitMQ
+        db_session.add(
+            outbox_event(
+                {
+                    "id": db_order.id,
+                    "external_id": db_order.mongo_id,
+                    "status": order_status.value,
+                    "items": order["items"],
+                }
+            )
+        )
+
+        response = OrderCreateResponse(
+            id=db_order.id,
+            mongo_id=db_order.mongo_id,
+            customer_id=db_order.customer_id,
+            status=order_status,
+            items=order["items"],
+            price=order["total"],
+        )
+        # Last before the commit, the hot rollup rows stay locked the least
+        await db_session.run_sync(
+            record_sales, {checkout["external_id"]: order}
+        )
+
+        # Stored in the order transaction
+        await db_session.run_sync(
+            idempotent.save, response, status.HTTP_201_CREATED
+        )
+        await db_session.commit()
+
+    if restocked:
+        request.app.menu.invalidate()
+
+    # The cart stops expiring only once its order is committed
+    try:
+        await request.app.carts.mark_ordered(checkout["external_id"])
+    except PyMongoError as exc:
+        logger.error(
+            "Cart {} of a created order not marked: {}", checkout["external_id"], exc
+        )
+
+    await db_session.refresh(db_order)
+    request.app.outbox_relay.notify()
+    request.app.order_events.publish(
+        {
+            "id": db_order.id,
+            "external_id": db_order.mongo_id,
+            "status": order_status.value,
+        }
+    )
+
+    logger.debug("Order {} created", db_order.mongo_id)
+
+    return model_response(response, status.HTTP_201_CREATED)
+
+
+@router.post("/update", response_model=OrderUpdateResponse)
+async def update_order(
+    order: OrderUpdate,
+    request: Request,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Update Order status.
+
+    :param order: Order update schema.
+    :param db_session: Async database session.
+    """
+    db_order = await db_session.scalar(
+        select(OrderModel).filter(OrderModel.mongo_id == order.external_id)
+    )
+
+    if not db_order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Order does not exist"
+        )
+
+    # Get order status id
+    lookups = await db_session.run_sync(request.app.lookups.ensure_loaded)
+
+    db_order.status = lookups.order_status.id_of(order.status)
+
+    db_session.add(db_order)
+    await db_session.commit()
+    await db_session.refresh(db_order)
+    request.app.order_events.publish(
+        {
+            "id": db_order.id,
+            "external_id": db_order.mongo_id,
+            "status": order.status.value,
+        }
+    )
+
+    return model_response(
+        OrderUpdateResponse(id=db_order.id, status=order.status)
+    )
+
+
+@router.post("/update/bulk", response_model=OrderBulkUpdateResponse)
+async def bulk_update_orders(
+    orders: OrderBulkUpdate,
+    request: Request,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Update the status of many orders in a single statement.
+
+    :param orders: Order bulk update schema.
+    :param db_session: Async database session.
+    """
+    lookups = await db_session.run_sync(request.app.lookups.ensure_loaded)
+
+    # Last transition sent for an order wins
+    requested = {order.external_id: order.status for order in orders.orders}
+
+    updated = await db_session.run_sync(
+        bulk_update_status,
+        {
+            external_id: lookups.order_status.id_of(order_status)
+            for external_id, order_status in requested.items()
+        },
+    )
+
+    for external_id, order_id in updated.items():
+        request.app.order_events.publish(
+            {
+                "id": order_id,
+                "external_id": external_id,
+                "status": requested[external_id].value,
+            }
+        )
+
+    logger.debug("{} of {} orders updated", len(updated), len(requested))
+
+    return model_response(
+        OrderBulkUpdateResponse(
+            updated=len(updated),
+            not_found=len(requested) - len(updated),
+            results=[
+                OrderBulkUpdateResult(
+                    external_id=external_id,
+                    status=order_status,
+                    id=updated.get(external_id),
+                    updated=external_id in updated,
+                )
+                for external_id, order_status in requested.items()
+            ],
+        )
+    )
+
+
+@router.get("/queue", response_model=OrderQueuePage)
+async def order_queue(
+    request: Request,
+    status: OrderStatusEnum,
+    after: int = Query(default=0, ge=0),
+    limit: int | None = Query(default=None, ge=1, le=500),
+    items: bool = False,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    List the orders in a status, oldest first (kitchen screens).
+
+    Pass the `next_after` of a page as `after` to get the next one.
+
+    :param status: Order status.
+    :param after: Last order id of the previous page.
+    :param limit: Page size.
+    :param items: Include the cart items of every order.
+    :param db_session: Async database session.
+    """
+    lookups = await db_session.run_sync(request.app.lookups.ensure_loaded)
+
+    page = await db_session.run_sync(
+        queue_page,
+        lookups.order_status.id_of(status),
+        after,
+        limit or conf_settings.order_queue_page_size,
+    )
+
+    # Give the connection back before going to MongoDB
+    await db_session.close()
+
+    carts = {}
+    if items and page.orders:
+        carts = await request.app.carts.get_many(
+            [order.mongo_id for order in page.orders]
+        )
+
+    return model_response(queue_response(status, page, carts if items else None))
+
+
+@router.get("/stats", response_model=SalesStats)
+async def order_stats(
+    request: Request,
+    start: datetime,
+    end: datetime,
+    group_by: SalesGroupEnum = SalesGroupEnum.item,
+    db_session: AsyncSession = Depends(database.get_async_db),
+):
+    """
+    Sales of a period by item, category or hour, from the hourly rollups.
+
+    The period is widened to whole UTC hours.
+
+    :param start: Period start.
+    :param end: Period end, excluded.
+    :param group_by: Grouping.
+    :param db_session: Async database session.
+    """
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="end must be after start",
+        )
+
+    start, end = stats_range(start, end)
+    lookups = await db_session.run_sync(request.app.lookups.ensure_loaded)
+    rows = await db_session.run_sync(sales_stats, start, end, group_by)
+
+    return model_response(stats_response(group_by, start, end, rows, lookups))
@@ -0,0 +1,83 @@
+import codecs
+from typing import Iterator
+
+import anyio
+from fastapi import APIRouter, Depends, Query, Request
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from app.bulk import BulkImport, iter_records
+from app.schemas.bulk import BulkFormatEnum, BulkImportReport, BulkKindEnum
+
+from .. import database
+
+router = APIRouter()
+
+
+def body_lines(request: Request) -> Iterator[str]:
+    """
+    Stream the request body line by line from a worker thread.
+
+    :param request: Request.
+    """
+    stream = request.stream()
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+
+    async def receive() -> bytes | None:
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    while (chunk := anyio.from_thread.run(receive)) is not None:
+        lines = (pending + decoder.decode(chunk)).splitlines(keepends=True)
+        # Last line may continue in the next chunk
+        pending = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        yield from lines
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+@router.post("/{kind}", response_model=BulkImportReport)
+def bulk_import(
+    kind: BulkKindEnum,
+    request: Request,
+    format: BulkFormatEnum = BulkFormatEnum.csv,
+    chunk_size: int | None = Query(default=None, ge=1, le=10000),
+    db_session: Session = Depends(database.get_db),
+):
+    """
+    Import customers or menu items from a CSV or NDJSON body.
+
+    The body is streamed and written in chunked transactions, so one bad
+    row only shows up in the report. Runs on the sync session in both
+    database modes.
+
+    :param kind: Import target.
+    :param format: Body format, CSV with a header row or NDJSON.
+    :param chunk_size: Rows per transaction.
+    :param db_session: Database session.
+    """
+    report = BulkImport(
+        db_session, kind, request.app.lookups, chunk_size=chunk_size
+    ).run(iter_records(body_lines(request), format))
+
+    if kind == BulkKindEnum.items and report["inserted"]:
+        request.app.menu.invalidate()
+
+    # Imported CPFs may be cached as unknown
+    if kind == BulkKindEnum.customers and report["inserted"]:
+        request.app.customers.clear()
+
+    logger.info(
+        "Bulk import of {}: {} inserted, {} skipped, {} failed",
+        kind.value,
+        report["inserted"],
+        report["skipped"],
+        report["failed"],
+    )
+
+    return report
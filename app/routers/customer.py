@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from loguru import logger
 from sqlalchemy.orm import Session
 
-from app.main import logger
+from app.customers import MISSING
 from app.models.customer import Customer as CustomerModel
 from app.schemas.customer import Customer, CustomerIdentify, CustomerRegister
 from app.schemas.http import DefaultResponse
+from app.serialization import model_response
 
 from .. import database
 
@@ -15,7 +17,9 @@ router = APIRouter()
     "/register", response_model=DefaultResponse, status_code=status.HTTP_201_CREATED
 )
 def register_customer(
-    customer: CustomerRegister, db_session: Session = Depends(database.get_db)
+    customer: CustomerRegister,
+    request: Request,
+    db_session: Session = Depends(database.get_db),
 ):
     """
     Regiser a new customer.
@@ -27,31 +31,41 @@ def register_customer(
     db_session.add(db_customer)
     db_session.commit()
     db_session.refresh(db_customer)
+    request.app.customers.invalidate(db_customer.cpf)
 
-    logger.debug(f"Customer {db_customer.cpf} registered")
+    logger.debug("Customer {} registered", db_customer.cpf)
 
     return {"detail": f"Customer {db_customer.cpf} registered"}
 
 
 @router.post("/identify", response_model=Customer)
 def identify_customer(
-    identity: CustomerIdentify, db_session: Session = Depends(database.get_db)
+    identity: CustomerIdentify,
+    request: Request,
+    db_session: Session = Depends(database.get_db),
 ):
     """
     Get customer data by its CPF.
 
+    Served from the customer cache, unknown CPFs included.
+
     :param identity: CustomerIdentify schema (cpf).
     :param db_session: Database session.
     """
-    customer = (
-        db_session.query(CustomerModel)
-        .filter(CustomerModel.cpf == identity.cpf)
-        .first()
-    )
+    customer = request.app.customers.get(identity.cpf)
+
+    if customer is MISSING:
+        db_customer = (
+            db_session.query(CustomerModel)
+            .filter(CustomerModel.cpf == identity.cpf)
+            .first()
+        )
+        customer = Customer.model_validate(db_customer) if db_customer else None
+        request.app.customers.put(identity.cpf, customer)
 
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Customer not registered"
         )
 
-    return customer
+    return model_response(customer)
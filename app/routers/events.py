@@ -0,0 +1,64 @@
+import asyncio
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+from app.schemas.order import OrderStatusEnum
+from app.serialization import dumps
+
+from .. import config
+
+
+conf_settings = config.get_settings()
+
+router = APIRouter()
+
+
+@router.get("/events")
+async def order_events(
+    request: Request,
+    external_id: str = None,
+    status: OrderStatusEnum = None,
+):
+    """
+    Stream order status changes as Server-Sent Events.
+
+    Every change made by order create and update, on any worker, is pushed
+    as an `order` event (only the changes of the worker serving the stream
+    while `order_events_fanout` is off or its connection is down). A client
+    too slow to keep up is disconnected and should reconnect and reload
+    the state it shows.
+
+    :param external_id: Only changes of this order (customer boards).
+    :param status: Only changes to this status (kitchen displays).
+    """
+    hub = request.app.order_events
+
+    async def stream():
+        with hub.subscribe(
+            external_id=external_id, status=status and status.value
+        ) as subscriber:
+            yield "retry: 3000\n\n"
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.get(), conf_settings.order_events_heartbeat
+                    )
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": ping\n\n"
+                    continue
+
+                if event is None:
+                    logger.warning("Slow order events client dropped")
+                    return
+
+                yield f"event: order\ndata: {dumps(event)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
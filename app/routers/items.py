@@ -1,13 +1,15 @@
-from typing import List
+from typing import Dict, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from loguru import logger
 from sqlalchemy.orm import Session
 
-from app.main import logger
+from app.menu import FULL_MENU, ITEMS_ADAPTER, MENU_ADAPTER, snapshot_response
 from app.models.items import Items as ItemsModel
 from app.models.items import ItemsCategory as ItemsCategoryModel
 from app.schemas.http import DefaultResponse
 from app.schemas.items import Item, ItemCategoryEnum, ItemRegister
+from app.serialization import model_response
 
 from .. import database
 
@@ -15,7 +17,11 @@ router = APIRouter()
 
 
 @router.post("/register", response_model=Item, status_code=status.HTTP_201_CREATED)
-def register_item(item: ItemRegister, db_session: Session = Depends(database.get_db)):
+def register_item(
+    item: ItemRegister,
+    request: Request,
+    db_session: Session = Depends(database.get_db),
+):
     """
     Register a new menu item.
 
@@ -25,33 +31,34 @@ def register_item(item: ItemRegister, db_session: Session = Depends(database.get
     item_raw = item.model_dump()
 
     # Get item category id
-    category = (
-        db_session.query(ItemsCategoryModel)
-        .filter(ItemsCategoryModel.description == item_raw["category"])
-        .one_or_none()
-    )
-
-    item_raw["category"] = category.id
+    lookups = request.app.lookups.ensure_loaded(db_session)
+    item_raw["category"] = lookups.items_category.id_of(item.category)
 
     db_item = ItemsModel(**item_raw)
     db_session.add(db_item)
     db_session.commit()
     db_session.refresh(db_item)
-
-    logger.debug(f"Menu item {db_item.title} registered")
-
-    return Item(
-        id=db_item.id,
-        title=db_item.title,
-        description=db_item.description,
-        category=category.description,
-        amount=db_item.amount,
-        price=db_item.price,
+    request.app.menu.invalidate()
+
+    logger.debug("Menu item {} registered", db_item.title)
+
+    return model_response(
+        Item(
+            id=db_item.id,
+            title=db_item.title,
+            description=db_item.description,
+            category=item.category,
+            amount=db_item.amount,
+            price=db_item.price,
+        ),
+        status.HTTP_201_CREATED,
     )
 
 
 @router.put("/update", response_model=Item)
-def update_item(item: Item, db_session: Session = Depends(database.get_db)):
+def update_item(
+    item: Item, request: Request, db_session: Session = Depends(database.get_db)
+):
     """
     Update a menu item.
 
@@ -67,36 +74,37 @@ def update_item(item: Item, db_session: Session = Depends(database.get_db)):
             status_code=status.HTTP_404_NOT_FOUND, detail="Item not found"
         )
 
-    category = (
-        db_session.query(ItemsCategoryModel)
-        .filter(ItemsCategoryModel.description == item.category)
-        .one_or_none()
-    )
+    lookups = request.app.lookups.ensure_loaded(db_session)
 
     db_item.title = item.title
     db_item.description = item.description
     db_item.amount = item.amount
     db_item.price = item.price
-    db_item.category = category.id
+    db_item.category = lookups.items_category.id_of(item.category)
 
     db_session.add(db_item)
     db_session.commit()
     db_session.refresh(db_item)
-
-    logger.debug(f"Menu item {db_item.title} updated")
-
-    return Item(
-        id=db_item.id,
-        title=db_item.title,
-        description=db_item.description,
-        category=category.description,
-        amount=db_item.amount,
-        price=db_item.price,
+    request.app.menu.invalidate()
+
+    logger.debug("Menu item {} updated", db_item.title)
+
+    return model_response(
+        Item(
+            id=db_item.id,
+            title=db_item.title,
+            description=db_item.description,
+            category=item.category,
+            amount=db_item.amount,
+            price=db_item.price,
+        )
     )
 
 
 @router.delete("/delete/{item_id}", response_model=DefaultResponse)
-def delete_item(item_id: int, db_session: Session = Depends(database.get_db)):
+def delete_item(
+    item_id: int, request: Request, db_session: Session = Depends(database.get_db)
+):
     """
     Get items data by its CPF.
 
@@ -114,21 +122,13 @@ def delete_item(item_id: int, db_session: Session = Depends(database.get_db)):
 
     db_session.delete(db_item)
     db_session.commit()
+    request.app.menu.invalidate()
 
     return {"detail": f"Item {db_item.title} deleted"}
 
 
-@router.get("/list/{category}", response_model=List[Item])
-def list_items_by_category(
-    category: ItemCategoryEnum, db_session: Session = Depends(database.get_db)
-):
-    """
-    Get items data by its CPF.
-
-    :param category: Item Category.
-    :param db_session: Database session.
-    """
-    items = (
+def _menu_query(db_session: Session):
+    return (
         db_session.query(ItemsModel)
         .with_entities(
             ItemsModel.id,
@@ -139,8 +139,64 @@ def list_items_by_category(
             ItemsCategoryModel.description.label("category"),
         )
         .join(ItemsCategoryModel)
-        .filter(ItemsCategoryModel.description == category)
-        .all()
     )
 
-    return items
+
+@router.get("/list/{category}", response_model=List[Item])
+def list_items_by_category(
+    category: ItemCategoryEnum,
+    request: Request,
+    db_session: Session = Depends(database.get_db),
+):
+    """
+    List menu items of a category.
+
+    Served from the menu snapshot, unchanged listings return 304.
+
+    :param category: Item Category.
+    :param db_session: Database session.
+    """
+    menu = request.app.menu
+    entry = menu.get(category.value)
+
+    if entry is None:
+        version = menu.version
+        # Filter on the category id so the (category, id) index is used
+        lookups = request.app.lookups.ensure_loaded(db_session)
+        items = (
+            _menu_query(db_session)
+            .filter(ItemsModel.category == lookups.items_category.id_of(category))
+            .order_by(ItemsModel.id)
+            .all()
+        )
+        body = ITEMS_ADAPTER.dump_json(
+            ITEMS_ADAPTER.validate_python(items, from_attributes=True)
+        )
+        entry = menu.put(category.value, body, version)
+
+    return snapshot_response(entry, request)
+
+
+@router.get("/menu", response_model=Dict[ItemCategoryEnum, List[Item]])
+def list_menu(request: Request, db_session: Session = Depends(database.get_db)):
+    """
+    List all menu items grouped by category.
+
+    Served from the menu snapshot, unchanged menus return 304.
+
+    :param db_session: Database session.
+    """
+    menu = request.app.menu
+    entry = menu.get(FULL_MENU)
+
+    if entry is None:
+        version = menu.version
+        grouped = {category.value: [] for category in ItemCategoryEnum}
+        for item in _menu_query(db_session).order_by(ItemsModel.id).all():
+            grouped.setdefault(item.category, []).append(item)
+        body = MENU_ADAPTER.dump_json(
+            MENU_ADAPTER.validate_python(grouped, from_attributes=True)
+        )
+        entry = menu.put(FULL_MENU, body, version)
+
+    return snapshot_response(entry, request)
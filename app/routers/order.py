@@ -1,34 +1,50 @@
-from functools import lru_cache
 
-import httpx
-from bson.objectid import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from datetime import datetime
+
+import anyio
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    status,
+)
+from loguru import logger
+from pymongo.errors import PyMongoError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.main import logger
+from app.idempotency import IdempotentRequest
 from app.models.order import Order as OrderModel
-from app.models.order import OrderStatus as OrderStatusModel
+from app.order_queue import queue_page, queue_response
+from app.order_updates import bulk_update_status
+from app.outbox import outbox_event
+from app.pricing import resolve_cart
+from app.sales import record_sales, sales_stats, stats_range, stats_response
 from app.schemas.order import (
+    OrderBulkUpdate,
+    OrderBulkUpdateResponse,
+    OrderBulkUpdateResult,
     OrderCheckout,
     OrderCheckoutResponse,
     OrderCreate,
     OrderCreateResponse,
+    OrderQueuePage,
+    OrderStatusEnum,
     OrderUpdate,
     OrderUpdateResponse,
+    SalesGroupEnum,
+    SalesStats,
 )
+from app.serialization import model_response
+from app.stock import confirm_reservation, release_reservation, reserve_stock
 
 from .. import config, database
 
 
-@lru_cache()
-def get_settings():
-    """
-    Config settings function.
-    """
-    return config.Settings()
-
-
-conf_settings = get_settings()
+conf_settings = config.get_settings()
 
 router = APIRouter()
 
@@ -41,6 +57,7 @@ router = APIRouter()
 def checkout(
     order: OrderCheckout,
     request: Request,
+    idempotency_key: str | None = Header(default=None, max_length=255),
     db_session: Session = Depends(database.get_db),
 ):
     """
@@ -49,28 +66,51 @@ def checkout(
     :param order: Order checkout schema.
     :param db_session: Database session.
     """
-    order_raw = order.model_dump()
+    idempotent = IdempotentRequest("checkout", idempotency_key, order)
+    replay = idempotent.claim(db_session)
+    if replay is not None:
+        return replay
 
-    # Get final price
-    final_price = 0.0
-    items = order_raw["items"]
-    for item in items:
-        final_price += item["price"] * item["amount"]
+    with idempotent.releasing(db_session):
+        order_raw = order.model_dump()
 
-    order_raw["total"] = final_price
+        # Price every item from the menu in a single query
+        cart = resolve_cart(db_session, order_raw["items"])
+        final_price = cart.total
 
-    # Create order cart on mongo db
-    order_id = request.app.mongo.db.orders_cart.insert_one(order_raw).inserted_id
+        # Take the stock of the whole cart, committed before the slow calls
+        reservation_id = reserve_stock(db_session, cart.items)
+        request.app.menu.invalidate()
 
-    # Call payment service to generate QRCode
-    req = httpx.post(
-        f"{conf_settings.payment_service_url}/qrcode",
-        json={"external_id": str(order_id), "value": final_price},
-    )
+        # Give the connection back before the slow external calls
+        db_session.close()
+
+        order_raw["items"] = cart.items
+        order_raw["total"] = final_price
+        order_raw["reservation_id"] = reservation_id
+
+        try:
+            # Create order cart on mongo db
+            order_id = anyio.from_thread.run(request.app.carts.create, order_raw)
+
+            # Call payment service to generate QRCode on the app's pooled client
+            payment = anyio.from_thread.run(
+                request.app.payment.create_qrcode, order_id, final_price
+            )
+        except BaseException:
+            # The cart can not be ordered, give its stock back now
+            release_reservation(db_session, reservation_id)
+            request.app.menu.invalidate()
+            raise
+
+        logger.debug("Checking out cart {}", order_id)
+
+        response = OrderCheckoutResponse(**payment)
 
-    logger.debug(f"Checking out cart {str(order_id)}")
+        idempotent.save(db_session, response, status.HTTP_201_CREATED)
+        db_session.commit()
 
-    return OrderCheckoutResponse(**req.json())
+    return model_response(response, status.HTTP_201_CREATED)
 
 
 @router.post(
@@ -79,6 +119,7 @@ def checkout(
 def register_order(
     checkout: OrderCreate,
     request: Request,
+    idempotency_key: str | None = Header(default=None, max_length=255),
     db_session: Session = Depends(database.get_db),
 ):
     """
@@ -87,59 +128,107 @@ def register_order(
     :param order: Order schema.
     :param db_session: Database session.
     """
-    checkout = checkout.model_dump()
+    idempotent = IdempotentRequest("order_create", idempotency_key, checkout)
+    replay = idempotent.claim(db_session)
+    if replay is not None:
+        return replay
 
-    # Get order cart on mongo db
-    order = request.app.mongo.db.orders_cart.find_one(
-        {"_id": ObjectId(checkout["external_id"])}
-    )
+    with idempotent.releasing(db_session):
+        checkout = checkout.model_dump()
 
-    if not order:
-        logger.error(f"Order {checkout['external_id']} not found on MongoDB!")
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Order not found"
+        # Read the fields the order needs from its cart
+        order = anyio.from_thread.run(
+            request.app.carts.get_order, checkout["external_id"]
         )
 
-    # Get item category id
-    order_status = (
-        db_session.query(OrderStatusModel)
-        .filter(OrderStatusModel.description == "Recebido")
-        .one_or_none()
-    )
+        if not order:
+            logger.error("Order {} not found on MongoDB!", checkout["external_id"])
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Order not found"
+            )
 
-    db_order = OrderModel(
-        mongo_id=checkout["external_id"],
-        customer_id=order["customer_id"],
-        status=order_status.id,
-    )
-    db_session.add(db_order)
-    db_session.commit()
-    db_session.refresh(db_order)
+        # Get order status id
+        lookups = request.app.lookups.ensure_loaded(db_session)
+        order_status = OrderStatusEnum.received
+
+        db_order = OrderModel(
+            mongo_id=checkout["external_id"],
+            customer_id=order["customer_id"],
+            status=lookups.order_status.id_of(order_status),
+        )
+        db_session.add(db_order)
+
+        # A retry without key is stopped by the unique mongo_id
+        try:
+            db_session.flush()
+        except IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail="Order already created"
+            ) from None
+
+        # The cart's reserved stock is sold with the order, once it is known
+        # not to be a duplicate
+        restocked = confirm_reservation(db_session, order)
+
+        # Order event is committed with the order and relayed to RabbitMQ
+        db_session.add(
+            outbox_event(
+                {
+                    "id": db_order.id,
+                    "external_id": db_order.mongo_id,
+                    "status": order_status.value,
+                    "items": order["items"],
+                }
+            )
+        )
 
-    # Post message on RabbitMQ
-    request.app.pika_client.send_message(
+        response = OrderCreateResponse(
+            id=db_order.id,
+            mongo_id=db_order.mongo_id,
+            customer_id=db_order.customer_id,
+            status=order_status,
+            items=order["items"],
+            price=order["total"],
+        )
+        # Last before the commit, the hot rollup rows stay locked the least
+        record_sales(db_session, {checkout["external_id"]: order})
+
+        # Stored in the order transaction
+        idempotent.save(db_session, response, status.HTTP_201_CREATED)
+        db_session.commit()
+
+    if restocked:
+        request.app.menu.invalidate()
+
+    # The cart stops expiring only once its order is committed
+    try:
+        anyio.from_thread.run(
+            request.app.carts.mark_ordered, checkout["external_id"]
+        )
+    except PyMongoError as exc:
+        logger.error(
+            "Cart {} of a created order not marked: {}", checkout["external_id"], exc
+        )
+
+    db_session.refresh(db_order)
+    request.app.outbox_relay.notify()
+    request.app.order_events.publish(
         {
             "id": db_order.id,
             "external_id": db_order.mongo_id,
-            "status": order_status.description,
-            "items": order["items"],
+            "status": order_status.value,
         }
     )
 
-    logger.debug(f"Order {db_order.mongo_id} created")
+    logger.debug("Order {} created", db_order.mongo_id)
 
-    return OrderCreateResponse(
-        id=db_order.id,
-        mongo_id=db_order.mongo_id,
-        customer_id=db_order.customer_id,
-        status=order_status.description,
-        items=order["items"],
-        price=order["total"],
-    )
+    return model_response(response, status.HTTP_201_CREATED)
 
 
 @router.post("/update", response_model=OrderUpdateResponse)
-def update_order(order: OrderUpdate, db_session: Session = Depends(database.get_db)):
+def update_order(
+    order: OrderUpdate, request: Request, db_session: Session = Depends(database.get_db)
+):
     """
     Update Order status.
 
@@ -157,17 +246,147 @@ def update_order(order: OrderUpdate, db_session: Session = Depends(database.get_
             status_code=status.HTTP_404_NOT_FOUND, detail="Order does not exist"
         )
 
-    # Get item category id
-    order_status = (
-        db_session.query(OrderStatusModel)
-        .filter(OrderStatusModel.description == order.status)
-        .one_or_none()
-    )
+    # Get order status id
+    lookups = request.app.lookups.ensure_loaded(db_session)
 
-    db_order.status = order_status.id
+    db_order.status = lookups.order_status.id_of(order.status)
 
     db_session.add(db_order)
     db_session.commit()
     db_session.refresh(db_order)
+    request.app.order_events.publish(
+        {
+            "id": db_order.id,
+            "external_id": db_order.mongo_id,
+            "status": order.status.value,
+        }
+    )
+
+    return model_response(
+        OrderUpdateResponse(id=db_order.id, status=order.status)
+    )
+
+
+@router.post("/update/bulk", response_model=OrderBulkUpdateResponse)
+def bulk_update_orders(
+    orders: OrderBulkUpdate,
+    request: Request,
+    db_session: Session = Depends(database.get_db),
+):
+    """
+    Update the status of many orders in a single statement.
+
+    :param orders: Order bulk update schema.
+    :param db_session: Database session.
+    """
+    lookups = request.app.lookups.ensure_loaded(db_session)
+
+    # Last transition sent for an order wins
+    requested = {order.external_id: order.status for order in orders.orders}
+
+    updated = bulk_update_status(
+        db_session,
+        {
+            external_id: lookups.order_status.id_of(order_status)
+            for external_id, order_status in requested.items()
+        },
+    )
+
+    for external_id, order_id in updated.items():
+        request.app.order_events.publish(
+            {
+                "id": order_id,
+                "external_id": external_id,
+                "status": requested[external_id].value,
+            }
+        )
+
+    logger.debug("{} of {} orders updated", len(updated), len(requested))
+
+    return model_response(
+        OrderBulkUpdateResponse(
+            updated=len(updated),
+            not_found=len(requested) - len(updated),
+            results=[
+                OrderBulkUpdateResult(
+                    external_id=external_id,
+                    status=order_status,
+                    id=updated.get(external_id),
+                    updated=external_id in updated,
+                )
+                for external_id, order_status in requested.items()
+            ],
+        )
+    )
+
+
+@router.get("/queue", response_model=OrderQueuePage)
+def order_queue(
+    request: Request,
+    status: OrderStatusEnum,
+    after: int = Query(default=0, ge=0),
+    limit: int | None = Query(default=None, ge=1, le=500),
+    items: bool = False,
+    db_session: Session = Depends(database.get_db),
+):
+    """
+    List the orders in a status, oldest first (kitchen screens).
+
+    Pass the `next_after` of a page as `after` to get the next one.
+
+    :param status: Order status.
+    :param after: Last order id of the previous page.
+    :param limit: Page size.
+    :param items: Include the cart items of every order.
+    :param db_session: Database session.
+    """
+    lookups = request.app.lookups.ensure_loaded(db_session)
+
+    page = queue_page(
+        db_session,
+        lookups.order_status.id_of(status),
+        after,
+        limit or conf_settings.order_queue_page_size,
+    )
+
+    # Give the connection back before going to MongoDB
+    db_session.close()
+
+    carts = {}
+    if items and page.orders:
+        carts = anyio.from_thread.run(
+            request.app.carts.get_many, [order.mongo_id for order in page.orders]
+        )
+
+    return model_response(queue_response(status, page, carts if items else None))
+
+
+@router.get("/stats", response_model=SalesStats)
+def order_stats(
+    request: Request,
+    start: datetime,
+    end: datetime,
+    group_by: SalesGroupEnum = SalesGroupEnum.item,
+    db_session: Session = Depends(database.get_db),
+):
+    """
+    Sales of a period by item, category or hour, from the hourly rollups.
+
+    The period is widened to whole UTC hours.
+
+    :param start: Period start.
+    :param end: Period end, excluded.
+    :param group_by: Grouping.
+    :param db_session: Database session.
+    """
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="end must be after start",
+        )
+
+    start, end = stats_range(start, end)
+    lookups = request.app.lookups.ensure_loaded(db_session)
+    rows = sales_stats(db_session, start, end, group_by)
 
-    return OrderUpdateResponse(id=db_order.id, status=order_status.description)
+    return model_response(stats_response(group_by, start, end, rows, lookups))
@@ -0,0 +1,378 @@
+"""
+Hourly sales rollups.
+
+Creating an order adds the units and revenue of its items to the
+`sales_hourly` rows of the hour its cart was checked out, in the order
+transaction, with one upsert per order::
+
+    INSERT INTO sales_hourly (hour, item_id, category, units, revenue)
+    VALUES ... ON CONFLICT (hour, item_id) DO UPDATE
+    SET units = sales_hourly.units + excluded.units, ...
+
+`/order/stats` then answers a range by item, category or hour from at most
+`hours x items` rows instead of scanning the carts.
+
+The checkout hour is read from the cart's ObjectId, so rebuilding the
+rollups from the ordered carts gives the same buckets::
+
+    python -m app.sales --batch-size 1000
+
+The rebuild streams the orders by id into the `sales_hourly_rebuild`
+staging table, each batch of carts fetched with one `$in` query and
+committed on its own, while stats keep being served from `sales_hourly`.
+It then locks `sales_hourly` (orders being created wait before their own
+upsert), adds the orders committed since their id range was read (ids are
+taken at INSERT, not at commit) and swaps the staging rows in, in that
+transaction: every order is counted once.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from bson.objectid import ObjectId
+from loguru import logger
+from sqlalchemy import MetaData, delete, func, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.schema import Table
+
+from app import config, database
+from app.carts import CartRepository
+from app.lookups import LookupRegistry
+from app.models.items import Items as ItemsModel
+from app.models.order import Order as OrderModel
+from app.models.sales import SalesHourly
+from app.mongo import Mongo
+from app.schemas.order import SalesGroupEnum, SalesStats, SalesStatsRow
+
+
+conf_settings = config.get_settings()
+
+GROUP_COLUMNS = {
+    SalesGroupEnum.item: SalesHourly.item_id,
+    SalesGroupEnum.category: SalesHourly.category,
+    SalesGroupEnum.hour: SalesHourly.hour,
+}
+
+# Rollups being rebuilt, swapped into `sales_hourly` at the end
+STAGING = SalesHourly.__table__.to_metadata(
+    MetaData(), name="sales_hourly_rebuild"
+)
+
+
+def _utc(moment: datetime) -> datetime:
+    # Naive moments, SQLite timestamps included, are UTC
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+
+    return moment.astimezone(timezone.utc)
+
+
+def hour_of(moment: datetime) -> datetime:
+    """
+    Start of the UTC hour of a moment.
+
+    :param moment: Date and time, naive ones are taken as UTC.
+    """
+    return _utc(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def checkout_hour(cart_id: str) -> datetime:
+    """
+    Hour a cart was checked out, from the creation time in its ObjectId.
+
+    :param cart_id: Cart id.
+    """
+    if ObjectId.is_valid(cart_id):
+        return hour_of(ObjectId(cart_id).generation_time)
+
+    return hour_of(datetime.now(timezone.utc))
+
+
+def _upsert(db_session: Session, rows: List[dict], table: Table):
+    dialect = db_session.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        module = postgresql if dialect == "postgresql" else sqlite
+        statement = module.insert(table).values(rows)
+        db_session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.hour, table.c.item_id],
+                set_={
+                    "category": statement.excluded.category,
+                    "units": table.c.units + statement.excluded.units,
+                    "revenue": table.c.revenue + statement.excluded.revenue,
+                },
+            )
+        )
+        return
+
+    for row in rows:
+        updated = db_session.execute(
+            update(table)
+            .where(table.c.hour == row["hour"], table.c.item_id == row["item_id"])
+            .values(
+                category=row["category"],
+                units=table.c.units + row["units"],
+                revenue=table.c.revenue + row["revenue"],
+            )
+        ).rowcount
+        if not updated:
+            db_session.execute(insert(table).values(**row))
+
+
+def record_sales(
+    db_session: Session, carts: Dict[str, dict], table: Table = None
+) -> int:
+    """
+    Add the items of ordered carts to the rollups, in the caller's
+    transaction.
+
+    :param db_session: Database session.
+    :param carts: Cart documents by cart id.
+    :param table: Rollups table, `sales_hourly` by default.
+    :returns: Number of rollup rows written.
+    """
+    totals = {}
+    for cart_id, cart in carts.items():
+        hour = checkout_hour(cart_id)
+        for item in cart.get("items") or ():
+            units, revenue = totals.get((hour, item["id"]), (0, 0.0))
+            totals[(hour, item["id"])] = (
+                units + item["amount"],
+                revenue + item["amount"] * item.get("price", 0.0),
+            )
+
+    if not totals:
+        return 0
+
+    categories = dict(
+        db_session.execute(
+            select(ItemsModel.id, ItemsModel.category).where(
+                ItemsModel.id.in_({item_id for _, item_id in totals})
+            )
+        ).all()
+    )
+
+    # Rows locked in key order, concurrent orders can not deadlock
+    _upsert(
+        db_session,
+        [
+            {
+                "hour": hour,
+                "item_id": item_id,
+                "category": categories.get(item_id),
+                "units": units,
+                "revenue": revenue,
+            }
+            for (hour, item_id), (units, revenue) in sorted(totals.items())
+        ],
+        SalesHourly.__table__ if table is None else table,
+    )
+
+    return len(totals)
+
+
+def stats_range(start: datetime, end: datetime) -> tuple:
+    """
+    Widen a range to whole UTC hours.
+
+    :param start: Range start, rounded down.
+    :param end: Range end (excluded), rounded up.
+    """
+    end_hour = hour_of(end)
+    if end_hour < _utc(end):
+        end_hour += timedelta(hours=1)
+
+    return hour_of(start), end_hour
+
+
+def sales_stats(
+    db_session: Session, start: datetime, end: datetime, group_by: SalesGroupEnum
+) -> list:
+    """
+    Units and revenue of the hours in `[start, end)`, by `group_by`.
+
+    :param db_session: Database session.
+    :param start: First hour.
+    :param end: Hour after the last one.
+    :param group_by: Grouping.
+    """
+    column = GROUP_COLUMNS[group_by]
+
+    return db_session.execute(
+        select(
+            column.label("key"),
+            func.sum(SalesHourly.units).label("units"),
+            func.sum(SalesHourly.revenue).label("revenue"),
+        )
+        .where(SalesHourly.hour >= start, SalesHourly.hour < end)
+        .group_by(column)
+        .order_by(column)
+    ).all()
+
+
+def _row_key(group_by: SalesGroupEnum, key, lookups: LookupRegistry) -> dict:
+    if group_by == SalesGroupEnum.item:
+        return {"item_id": key}
+    if group_by == SalesGroupEnum.category:
+        return {"category": lookups.items_category.by_id.get(key)}
+
+    return {"hour": hour_of(key)}
+
+
+def stats_response(
+    group_by: SalesGroupEnum,
+    start: datetime,
+    end: datetime,
+    rows: list,
+    lookups: LookupRegistry,
+) -> SalesStats:
+    """
+    Build a sales stats response.
+
+    :param group_by: Grouping.
+    :param start: First hour.
+    :param end: Hour after the last one.
+    :param rows: Rows from `sales_stats`.
+    :param lookups: Loaded lookup tables, for category descriptions.
+    """
+    return SalesStats(
+        start=start,
+        end=end,
+        group_by=group_by,
+        rows=[
+            SalesStatsRow(
+                **_row_key(group_by, row.key, lookups),
+                units=row.units,
+                revenue=round(row.revenue, 2),
+            )
+            for row in rows
+        ],
+    )
+
+
+def _lock_rollups(db_session: Session):
+    # SQLite has a single writer already
+    if db_session.get_bind().dialect.name == "postgresql":
+        db_session.execute(text("LOCK TABLE sales_hourly IN EXCLUSIVE MODE"))
+
+
+def _late_orders(
+    db_session: Session, scanned: set, after: int, batch_size: int
+) -> list:
+    """
+    Orders committed after the scan read their id range.
+
+    :param scanned: Ids of the orders read by the scan.
+    :param after: Last id read by the scan.
+    """
+    gaps = [
+        order_id for order_id in range(1, after + 1) if order_id not in scanned
+    ]
+    orders = db_session.execute(
+        select(OrderModel.id, OrderModel.mongo_id).where(OrderModel.id > after)
+    ).all()
+
+    for start in range(0, len(gaps), batch_size):
+        orders.extend(
+            db_session.execute(
+                select(OrderModel.id, OrderModel.mongo_id).where(
+                    OrderModel.id.in_(gaps[start:start + batch_size])
+                )
+            ).all()
+        )
+
+    return orders
+
+
+async def _stage(db_session: Session, carts: CartRepository, orders: list) -> int:
+    found = await carts.get_many([order.mongo_id for order in orders])
+    record_sales(db_session, found, STAGING)
+
+    if len(found) < len(orders):
+        logger.warning(
+            "[Sales] {} carts not found up to order {}",
+            len(orders) - len(found),
+            orders[-1].id,
+        )
+
+    return len(found)
+
+
+async def rebuild(
+    session_factory, carts: CartRepository, batch_size: int = None
+) -> int:
+    """
+    Rebuild the rollups from every ordered cart.
+
+    :param session_factory: Sync session factory.
+    :param carts: Cart repository.
+    :param batch_size: Orders per batch.
+    :returns: Number of carts added.
+    """
+    batch_size = batch_size or conf_settings.sales_rebuild_batch_size
+    scanned = set()
+    after = 0
+    added = 0
+
+    with session_factory() as db_session:
+        bind = db_session.get_bind()
+        STAGING.drop(bind, checkfirst=True)
+        STAGING.create(bind)
+
+        while True:
+            orders = db_session.execute(
+                select(OrderModel.id, OrderModel.mongo_id)
+                .where(OrderModel.id > after)
+                .order_by(OrderModel.id)
+                .limit(batch_size)
+            ).all()
+
+            if not orders:
+                break
+
+            after = orders[-1].id
+            scanned.update(order.id for order in orders)
+            # Give the connection back while reading the carts
+            db_session.close()
+
+            added += await _stage(db_session, carts, orders)
+            db_session.commit()
+
+        # Orders committed from here on wait for the swap to add their sales
+        _lock_rollups(db_session)
+        late = _late_orders(db_session, scanned, after, batch_size)
+        if late:
+            # Few carts, read with the lock held
+            added += await _stage(db_session, carts, late)
+
+        db_session.execute(delete(SalesHourly))
+        db_session.execute(
+            insert(SalesHourly).from_select(
+                [column.name for column in STAGING.columns], select(STAGING)
+            )
+        )
+        db_session.commit()
+
+        STAGING.drop(bind)
+
+    logger.info("[Sales] Rollups rebuilt from {} carts", added)
+
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    mongo = Mongo()
+    try:
+        asyncio.run(
+            rebuild(database.SessionLocal, CartRepository(mongo), args.batch_size)
+        )
+    finally:
+        mongo.close()
@@ -0,0 +1,33 @@
+from enum import Enum
+from typing import List
+
+from pydantic import BaseModel
+
+
+class BulkKindEnum(str, Enum):
+    """Bulk import target."""
+    customers = 'customers'
+    items = 'items'
+
+
+class BulkFormatEnum(str, Enum):
+    """Bulk import input format."""
+    csv = 'csv'
+    ndjson = 'ndjson'
+
+
+class BulkImportError(BaseModel):
+    line: int
+    error: str
+
+
+class BulkImportReport(BaseModel):
+    """Bulk import result."""
+
+    kind: BulkKindEnum
+    received: int
+    inserted: int
+    # Registered by someone else while importing
+    skipped: int
+    failed: int
+    errors: List[BulkImportError]
@@ -1,7 +1,8 @@
+from datetime import datetime
 from enum import Enum
 from typing import Dict, List
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class OrderStatusEnum(str, Enum):
@@ -11,9 +12,16 @@ class OrderStatusEnum(str, Enum):
     finished = "Finalizado"
 
 
+class OrderItem(BaseModel):
+    """Cart item, priced server-side."""
+
+    id: int
+    amount: int = Field(gt=0)
+
+
 class OrderCheckout(BaseModel):
     customer_id: int | None
-    items: List[Dict]
+    items: List[OrderItem] = Field(min_length=1)
 
 
 class OrderCreate(BaseModel):
@@ -43,8 +51,63 @@ class OrderUpdateResponse(BaseModel):
     status: OrderStatusEnum
 
 
+class OrderBulkUpdate(BaseModel):
+    orders: List[OrderUpdate] = Field(min_length=1, max_length=1000)
+
+
+class OrderBulkUpdateResult(BaseModel):
+    external_id: str
+    status: OrderStatusEnum
+    id: int | None
+    updated: bool
+
+
+class OrderBulkUpdateResponse(BaseModel):
+    updated: int
+    not_found: int
+    results: List[OrderBulkUpdateResult]
+
+
+class OrderQueueEntry(BaseModel):
+    id: int
+    external_id: str
+    customer_id: int | None
+    items: List[Dict] | None = None
+
+
+class OrderQueuePage(BaseModel):
+    """Kitchen queue page, `next_after` is the cursor of the next page."""
+
+    status: OrderStatusEnum
+    orders: List[OrderQueueEntry]
+    next_after: int | None
+
+
 class OrderCheckoutResponse(BaseModel):
     external_id: str
     status: str
     value: float
     qrcode: str
+
+
+class SalesGroupEnum(str, Enum):
+    item = "item"
+    category = "category"
+    hour = "hour"
+
+
+class SalesStatsRow(BaseModel):
+    item_id: int | None = None
+    category: str | None = None
+    hour: datetime | None = None
+    units: int
+    revenue: float
+
+
+class SalesStats(BaseModel):
+    """Sales of `[start, end)` from the hourly rollups, by `group_by`."""
+
+    start: datetime
+    end: datetime
+    group_by: SalesGroupEnum
+    rows: List[SalesStatsRow]
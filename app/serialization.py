@@ -0,0 +1,58 @@
+"""
+JSON serialization helpers.
+
+With `fast_json` on, responses and broker payloads are encoded with orjson
+and routes returning an already validated model skip FastAPI's
+`response_model` round trip (dump, validate again, encode).
+"""
+
+import json
+
+import orjson
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import BaseModel
+
+from . import config
+
+
+conf_settings = config.get_settings()
+
+
+def response_class() -> type[JSONResponse]:
+    """
+    Default response class of the app.
+    """
+    return ORJSONResponse if conf_settings.fast_json else JSONResponse
+
+
+def dumps(message) -> str:
+    """
+    Serialize a broker or outbox payload.
+
+    :param message: JSON compatible payload.
+    """
+    if conf_settings.fast_json:
+        return orjson.dumps(message).decode()
+
+    return json.dumps(message)
+
+
+def model_response(model: BaseModel, status_code: int = 200):
+    """
+    Respond with a model built by the route.
+
+    The model was validated when it was built, so it is encoded directly
+    instead of being validated again against the `response_model`.
+
+    :param model: Response model instance.
+    :param status_code: Response status, the route's own is not applied to
+        returned responses.
+    """
+    if not conf_settings.fast_json:
+        return model
+
+    return Response(
+        content=model.model_dump_json(),
+        status_code=status_code,
+        media_type="application/json",
+    )
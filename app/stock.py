@@ -0,0 +1,312 @@
+"""
+Stock reservation.
+
+Checkout takes the stock of the whole cart with one conditional statement::
+
+    UPDATE items SET amount = amount - CASE id WHEN :id THEN :n ... END
+    WHERE id IN (...) AND amount >= CASE id WHEN :id THEN :n ... END
+
+and commits at once, so a hot item's row is locked for a single statement,
+never across the payment call. The database re-checks `amount >= :n` on
+the latest row version, concurrent checkouts can not oversell; if fewer
+rows than items were updated one of them ran out and the transaction is
+rolled back.
+
+The reservation is recorded in `stock_reservation` and its id stored in
+the cart. Creating the order deletes it; reservations of carts never
+ordered are given back by `ReservationReaper` after `stock_reservation_ttl`
+seconds.
+
+The menu snapshot serves the stock, every committed stock change
+invalidates it: routes after their commit, the reaper through its
+`on_release` callback.
+"""
+
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from loguru import logger
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import config, database
+from app.models.items import Items as ItemsModel
+from app.models.stock import StockReservation
+from app.pricing import CartItemError, requested_amounts
+from app.serialization import dumps
+
+
+conf_settings = config.get_settings()
+
+
+def take_stock(db_session: Session, requested: Dict[int, int]):
+    """
+    Decrement the stock of every item, or of none.
+
+    Runs in the caller's transaction and rolls it back on failure.
+
+    :param db_session: Database session.
+    :param requested: Amounts by item id.
+    :raises CartItemError: Not enough stock of some item.
+    """
+    amount = case(requested, value=ItemsModel.id)
+
+    result = db_session.execute(
+        update(ItemsModel)
+        .where(ItemsModel.id.in_(requested), ItemsModel.amount >= amount)
+        .values(amount=ItemsModel.amount - amount)
+        .execution_options(synchronize_session=False)
+    )
+
+    if result.rowcount == len(requested):
+        return
+
+    db_session.rollback()
+
+    available = dict(
+        db_session.execute(
+            select(ItemsModel.id, ItemsModel.amount).where(
+                ItemsModel.id.in_(requested)
+            )
+        ).all()
+    )
+    raise CartItemError(
+        [
+            {
+                "id": item_id,
+                "error": "out of stock",
+                "requested": count,
+                "available": available.get(item_id, 0),
+            }
+            for item_id, count in requested.items()
+            if count > available.get(item_id, 0)
+        ]
+        # Restocked since the update, report every item
+        or [{"id": item_id, "error": "out of stock"} for item_id in requested]
+    )
+
+
+def give_back(db_session: Session, requested: Dict[int, int]):
+    """
+    Increment the stock of every item, in the caller's transaction.
+
+    :param db_session: Database session.
+    :param requested: Amounts by item id.
+    """
+    amount = case(requested, value=ItemsModel.id)
+
+    db_session.execute(
+        update(ItemsModel)
+        .where(ItemsModel.id.in_(requested))
+        .values(amount=ItemsModel.amount + amount)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reserve_stock(db_session: Session, items: List[dict]) -> int:
+    """
+    Reserve the stock of a cart and commit.
+
+    :param db_session: Database session.
+    :param items: Cart items, dicts with `id` and `amount`.
+    :returns: Reservation id.
+    :raises CartItemError: Not enough stock of some item.
+    """
+    requested = requested_amounts(items)
+    take_stock(db_session, requested)
+
+    reservation = StockReservation(
+        items=dumps({str(item_id): count for item_id, count in requested.items()})
+    )
+    db_session.add(reservation)
+    db_session.commit()
+
+    return reservation.id
+
+
+def release_reservation(db_session: Session, reservation_id: int):
+    """
+    Give back the stock of a reservation and commit, for a checkout that
+    failed after reserving.
+
+    :param db_session: Database session.
+    :param reservation_id: Reservation id.
+    """
+    db_session.rollback()
+
+    items = db_session.scalar(
+        delete(StockReservation)
+        .where(StockReservation.id == reservation_id)
+        .returning(StockReservation.items)
+    )
+    if items is not None:
+        give_back(db_session, _amounts(items))
+    db_session.commit()
+
+
+def confirm_reservation(db_session: Session, cart: dict) -> bool:
+    """
+    Turn the reservation of a cart into a sale, in the order transaction.
+
+    A cart whose reservation expired and was given back takes its stock
+    again. Carts checked out before stock was reserved are left alone.
+
+    :param db_session: Database session.
+    :param cart: Cart document.
+    :returns: True if the stock was taken again.
+    :raises CartItemError: Stock no longer available.
+    """
+    reservation_id = cart.get("reservation_id")
+    if reservation_id is None:
+        return False
+
+    deleted = db_session.execute(
+        delete(StockReservation).where(StockReservation.id == reservation_id)
+    ).rowcount
+
+    if deleted:
+        return False
+
+    take_stock(db_session, requested_amounts(cart["items"]))
+    return True
+
+
+def _amounts(items: str) -> Dict[int, int]:
+    return {int(item_id): count for item_id, count in json.loads(items).items()}
+
+
+def reserved_carts(db_session: Session) -> int:
+    """
+    Count reservations not turned into orders yet.
+
+    :param db_session: Database session.
+    """
+    return db_session.scalar(select(func.count()).select_from(StockReservation))
+
+
+class ReservationReaper:
+    """
+    Give back the stock of carts that were never ordered.
+
+    Batches of expired reservations are claimed with `SELECT ... FOR UPDATE
+    SKIP LOCKED`, so one reaper per worker can run at once, and their
+    amounts returned with one statement per batch.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        ttl: float = None,
+        interval: float = None,
+        batch_size: int = None,
+        on_release=None,
+    ):
+        """
+        :param on_release: Called after a batch of stock was given back.
+        """
+        self.session_factory = session_factory or database.SessionLocal
+        self.ttl = ttl or conf_settings.stock_reservation_ttl
+        self.interval = interval or conf_settings.stock_release_interval
+        self.batch_size = batch_size or conf_settings.stock_release_batch_size
+        self.on_release = on_release
+
+        self.released = 0
+        self.failures = 0
+
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def run_once(self) -> int:
+        """
+        Release one batch of expired reservations.
+
+        :returns: Number of released reservations.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+
+        with self.session_factory() as db_session:
+            reservations = db_session.scalars(
+                select(StockReservation)
+                .where(StockReservation.created_at < cutoff)
+                .order_by(StockReservation.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+
+            if not reservations:
+                return 0
+
+            requested = {}
+            for reservation in reservations:
+                for item_id, count in _amounts(reservation.items).items():
+                    requested[item_id] = requested.get(item_id, 0) + count
+
+            give_back(db_session, requested)
+            db_session.execute(
+                delete(StockReservation).where(
+                    StockReservation.id.in_(
+                        [reservation.id for reservation in reservations]
+                    )
+                )
+            )
+            db_session.commit()
+
+        if self.on_release:
+            self.on_release()
+
+        self.released += len(reservations)
+        logger.info("[Stock] Released {} abandoned carts", len(reservations))
+
+        return len(reservations)
+
+    def start(self):
+        """
+        Start the reaper thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self.run_forever, name="stock-reaper", daemon=True
+        )
+        self._thread.start()
+
+    def run_forever(self):
+        """
+        Release expired reservations until `stop` is called.
+        """
+        while not self._stopping.is_set():
+            try:
+                count = self.run_once()
+            except SQLAlchemyError as exc:
+                self.failures += 1
+                logger.warning("[Stock] Release failed: {}", exc)
+                count = 0
+
+            if count < self.batch_size:
+                self._stopping.wait(self.interval)
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stop the reaper thread after the current batch.
+
+        :param timeout: Seconds to wait for the thread.
+        """
+        self._stopping.set()
+
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """
+        Reaper counters.
+        """
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "released": self.released,
+            "failures": self.failures,
+        }
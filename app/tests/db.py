@@ -1,11 +1,23 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
+from app.metrics import instrument_engine
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument_engine(engine)
+
+# TestClient may run each request on a new event loop, so async
+# connections must not outlive a request
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine
+)
 
 
 def override_get_db():
@@ -17,3 +29,11 @@ def override_get_db():
         yield db
     finally:
         db.close()
+
+
+async def override_get_async_db():
+    """
+    Override async database with test database.
+    """
+    async with TestingAsyncSessionLocal() as db:
+        yield db
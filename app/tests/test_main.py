@@ -1,32 +1,122 @@
+import asyncio
+import json
+import re
+import time
+
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+
+import httpx
+import pika
 import pytest
-from sqlalchemy import text
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+from sqlalchemy import create_engine, event, select, text
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from unittest.mock import MagicMock, patch
-from app.database import Base, get_db
-from app.tests.db import engine, override_get_db
+from loguru import logger
+from prometheus_client import REGISTRY
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.bulk import BulkImport
+from app.carts import (
+    CART_INDEXES,
+    ORDER_FIELDS,
+    CartArchiver,
+    CartRepository,
+)
+from app.customers import MISSING, CustomerCache
+from app.database import Base, PoolStats, TimedQueuePool, get_async_db, get_db
+from app.events import OrderEventFanout, OrderEventHub
+from app.menu import MenuSnapshot
+from app.metrics import MongoCommandMetrics, observe_publish
+from app.models.items import Items as ItemsModel
+from app.models.order import Order as OrderModel
+from app.models.outbox import OutboxEvent
+from app.payment import PaymentClient, PaymentServiceError
+from app.resources import Resources
+from app.sales import rebuild
+from app.schemas.order import OrderStatusEnum, OrderUpdateResponse
+from app.stock import (
+    ReservationReaper,
+    confirm_reservation,
+    release_reservation,
+    reserve_stock,
+)
+from app import config, logs, serialization
+from app.tests.db import (
+    TestingSessionLocal,
+    async_engine,
+    engine,
+    override_get_async_db,
+    override_get_db,
+)
 
 
-with patch("pika.BlockingConnection") as mock_pika_conn, \
-     patch("pymongo.MongoClient") as mock_mongo_client:
+with patch("pika.BlockingConnection") as mock_pika_conn:
 
     # Configura os mocks
     mock_pika_instance = MagicMock()
     mock_pika_conn.return_value = mock_pika_instance
 
-    mock_mongo_instance = MagicMock()
-    mock_mongo_client.return_value = mock_mongo_instance
-
     from app import main
 
+from app.outbox import OutboxRelay  # noqa: E402
+from app.pricing import CartItemError  # noqa: E402
+from app.pika import PikaClient, PikaPublisher, PublishError  # noqa: E402 (imports app.main)
+
 
 @pytest.fixture(autouse=True)
 def mock_dependencies():
     yield {
         "pika": mock_pika_instance,
-        "mongo": mock_mongo_instance
     }
 
 
+class FakeCarts:
+    """In-memory stand-in for the cart repository."""
+
+    def __init__(self):
+        self.carts = {}
+        self.ordered = set()
+        self.get_many_calls = 0
+
+    async def create(self, cart):
+        cart_id = str(ObjectId())
+        self.carts[cart_id] = cart
+        return cart_id
+
+    async def get(self, cart_id):
+        return self.carts.get(cart_id)
+
+    async def get_order(self, cart_id):
+        cart = self.carts.get(cart_id)
+        if cart is None:
+            return None
+        return {field: cart[field] for field in ORDER_FIELDS if field in cart}
+
+    async def mark_ordered(self, cart_id):
+        self.ordered.add(cart_id)
+        return cart_id in self.carts
+
+    async def get_many(self, cart_ids):
+        self.get_many_calls += 1
+        return {
+            cart_id: self.carts[cart_id] for cart_id in cart_ids
+            if cart_id in self.carts
+        }
+
+
+@pytest.fixture()
+def carts():
+    """
+    Order carts kept in memory instead of MongoDB.
+    """
+    fake = FakeCarts()
+    with patch.object(main.app, "carts", fake):
+        yield fake
+
+
 @pytest.fixture()
 def test_db():
     """
@@ -39,16 +129,69 @@ def test_db():
             "INSERT INTO items_category (description) "
             "VALUES ('Lanche'), ('Acompanhamento'), ('Bebida'), ('Sobremesa')"
         ))
+        conn.execute(text(
+            "INSERT INTO order_status (description) "
+            "VALUES ('Recebido'), ('Em preparação'), ('Pronto'), ('Finalizado')"
+        ))
         conn.commit()
 
     yield
+    main.app.lookups.invalidate()
+    main.app.menu.invalidate()
+    main.app.customers.clear()
     Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture()
+def statements():
+    """
+    SQL statements executed on the test database.
+    """
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    for bind in (engine, async_engine.sync_engine):
+        event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    for bind in (engine, async_engine.sync_engine):
+        event.remove(bind, "before_cursor_execute", before_cursor_execute)
+
+
 main.app.dependency_overrides[get_db] = override_get_db
 
 client = TestClient(main.app)
 
+class AsyncApp(FastAPI):
+    """
+    App of the async routers, with the state and clients of `main.app`.
+    """
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, patches of `main.app` apply
+        return getattr(main.app, name)
+
+
+# Async routers mounted the way `db_async` mode mounts them
+async_app = AsyncApp()
+async_app.include_router(main.aio_customer.router, prefix="/customer")
+async_app.include_router(main.aio_items.router, prefix="/items")
+async_app.include_router(main.aio_order.router, prefix="/order")
+async_app.dependency_overrides[get_async_db] = override_get_async_db
+async_app.exception_handlers.update(main.app.exception_handlers)
+async_app.menu = MenuSnapshot()
+
+async_client = TestClient(async_app)
+
+
+@pytest.fixture(params=["sync", "async"])
+def api(request):
+    """
+    Client of the sync routers, then of the async ones.
+    """
+    return client if request.param == "sync" else async_client
+
 
 def test_health():
     """
@@ -59,6 +202,38 @@ def test_health():
     assert response.json() == {"status": "ok"}
 
 
+def test_pool_health():
+    response = client.get("/health/pool")
+
+    assert response.status_code == 200
+    assert response.json()["sync"]["pool"] == "TimedQueuePool"
+    assert response.json()["sync"]["checked_out"] == 0
+
+
+def test_pool_stats():
+    pool_engine = create_engine(
+        "sqlite:///./test.db", poolclass=TimedQueuePool, pool_size=2
+    )
+    stats = PoolStats(pool_engine)
+
+    with pool_engine.connect():
+        snapshot = stats.snapshot()
+        assert snapshot["checked_out"] == 1
+        assert snapshot["connects"] == 1
+
+    pool_engine.dispose()
+
+    with pool_engine.connect():
+        pass
+
+    snapshot = stats.snapshot()
+    assert snapshot["checked_out"] == 0
+    assert snapshot["checkouts"] == 2
+    assert snapshot["checkins"] == 2
+    assert snapshot["waits"] == 2
+    assert snapshot["wait_max_ms"] >= snapshot["wait_avg_ms"] > 0
+
+
 def test_customer(test_db):
     response = client.post(
         "/customer/register",
@@ -164,3 +339,1494 @@ def test_item(test_db):
 
     assert response.status_code == 200
     assert response.json() == {"detail": "Item X-Egg 2.0 deleted"}
+
+
+def test_async_customer(test_db):
+    response = async_client.post(
+        "/customer/register",
+        json={
+            "cpf": "10634272829",
+            "first_name": "Jorge",
+            "last_name": "Sousa",
+            "email": "jorge.sousa@outlook.com"
+        }
+    )
+
+    assert response.status_code == 201
+    assert response.json() == {"detail": "Customer 10634272829 registered"}
+
+    response = async_client.post(
+        "/customer/identify",
+        json={"cpf": "10634272829"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["id"] == 1
+
+    response = async_client.post(
+        "/customer/identify",
+        json={"cpf": "00000000000"}
+    )
+
+    assert response.status_code == 404
+
+
+def test_async_item(test_db):
+    response = async_client.post(
+        "/items/register",
+        json={
+            "title": "Coca-Cola",
+            "description": "Lata 350ml",
+            "category": "Bebida",
+            "amount": 5,
+            "price": 7.0
+        }
+    )
+
+    assert response.status_code == 201
+    assert response.json()["category"] == "Bebida"
+
+    response = async_client.get("/items/list/Bebida")
+
+    assert response.status_code == 200
+    assert [item["title"] for item in response.json()] == ["Coca-Cola"]
+
+    response = async_client.delete("/items/delete/1")
+
+    assert response.status_code == 200
+    assert response.json() == {"detail": "Item Coca-Cola deleted"}
+
+
+def test_lookups_skip_status_and_category_queries(test_db, statements, carts, api):
+    carts.carts["67b1f2a6c2a3b1d4e5f60718"] = {
+        "customer_id": 1,
+        "items": [{"id": 1, "amount": 1, "price": 32.0}],
+        "total": 32.0,
+    }
+
+    # First write loads the lookup tables
+    api.post(
+        "/items/register",
+        json={
+            "title": "X-Egg",
+            "description": "Lanche",
+            "category": "Lanche",
+            "amount": 1,
+            "price": 32.0
+        }
+    )
+    statements.clear()
+
+    response = api.post(
+        "/items/register",
+        json={
+            "title": "Batata",
+            "description": "Porção de batata frita",
+            "category": "Acompanhamento",
+            "amount": 1,
+            "price": 12.0
+        }
+    )
+
+    assert response.status_code == 201
+    assert response.json()["category"] == "Acompanhamento"
+
+    response = api.post(
+        "/order/create", json={"external_id": "67b1f2a6c2a3b1d4e5f60718"}
+    )
+
+    assert response.status_code == 201
+    assert response.json()["status"] == "Recebido"
+
+    with TestingSessionLocal() as db_session:
+        event = db_session.scalars(select(OutboxEvent)).one()
+
+    assert json.loads(event.payload)["status"] == "Recebido"
+
+    response = api.post(
+        "/order/update",
+        json={"external_id": "67b1f2a6c2a3b1d4e5f60718", "status": "Pronto"}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "Pronto"
+    assert not [
+        statement for statement in statements
+        if re.search(r"(FROM|JOIN) (order_status|items_category)", statement)
+    ]
+
+
+def test_menu_snapshot(test_db, statements):
+    item = {
+        "title": "X-Salada",
+        "description": "Lanche com alface e tomate",
+        "category": "Lanche",
+        "amount": 3,
+        "price": 28.0
+    }
+    client.post("/items/register", json=item)
+
+    response = client.get("/items/list/Lanche")
+    etag = response.headers["etag"]
+
+    assert response.status_code == 200
+    assert [item["title"] for item in response.json()] == ["X-Salada"]
+
+    statements.clear()
+    response = client.get("/items/list/Lanche", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert statements == []
+
+    response = client.get("/items/menu")
+    menu_etag = response.headers["etag"]
+
+    assert response.status_code == 200
+    assert [item["title"] for item in response.json()["Lanche"]] == ["X-Salada"]
+    assert response.json()["Bebida"] == []
+
+    # Any item write invalidates the snapshot
+    client.post("/items/register", json={**item, "title": "X-Bacon"})
+
+    response = client.get("/items/list/Lanche", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert [item["title"] for item in response.json()] == ["X-Salada", "X-Bacon"]
+
+    response = client.get("/items/menu", headers={"If-None-Match": menu_etag})
+
+    assert response.status_code == 200
+    assert len(response.json()["Lanche"]) == 2
+
+
+def test_menu_stock(test_db, carts, api):
+    api.post("/items/register", json={
+        "title": "X-Egg",
+        "description": "Lanche",
+        "category": "Lanche",
+        "amount": 2,
+        "price": 32.0,
+    })
+    payment = AsyncMock(return_value={
+        "external_id": "67b1f2a6c2a3b1d4e5f60718",
+        "status": "pending",
+        "value": 32.0,
+        "qrcode": "00020126",
+    })
+
+    def stock(etag=None):
+        response = api.get(
+            "/items/menu", headers={"If-None-Match": etag} if etag else {}
+        )
+        assert response.status_code == 200
+        return response.json()["Lanche"][0]["amount"], response.headers["etag"]
+
+    amount, etag = stock()
+    assert amount == 2
+
+    # Stock taken at checkout shows at once, the old ETag is not current
+    with patch.object(main.app.payment, "create_qrcode", payment):
+        response = api.post(
+            "/order/checkout",
+            json={"customer_id": 1, "items": [{"id": 1, "amount": 1}]},
+        )
+    assert response.status_code == 201
+
+    amount, etag = stock(etag)
+    assert amount == 1
+
+    # So does stock given back by the reaper
+    reaper = ReservationReaper(
+        TestingSessionLocal, ttl=1e-6, on_release=api.app.menu.invalidate
+    )
+    assert reaper.run_once() == 1
+
+    amount, _ = stock(etag)
+    assert amount == 2
+
+
+def test_checkout_payment_client(test_db, carts, api):
+    calls = []
+
+    def payment_service(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(
+                200,
+                json={
+                    "external_id": "67b1f2a6c2a3b1d4e5f60718",
+                    "status": "pending",
+                    "value": 64.0,
+                    "qrcode": "00020126",
+                },
+            )
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    payment = PaymentClient(transport=httpx.MockTransport(payment_service))
+    payment.retries = 1
+    payment.retry_backoff = 0
+    payment.breaker.threshold = 2
+    api.post(
+        "/items/register",
+        json={
+            "title": "X-Egg",
+            "description": "Lanche",
+            "category": "Lanche",
+            "amount": 10,
+            "price": 32.0
+        }
+    )
+    cart = {
+        "customer_id": 1,
+        "items": [{"id": 1, "amount": 2, "price": 32.0}],
+    }
+
+    with patch.object(main.app, "payment", payment):
+        response = api.post("/order/checkout", json=cart)
+
+        assert response.status_code == 201
+        assert response.json()["qrcode"] == "00020126"
+        assert json.loads(calls[0].read()) == {
+            "external_id": next(iter(carts.carts)),
+            "value": 64.0,
+        }
+
+        # Each failed checkout retries once, the second one opens the circuit
+        for _ in range(2):
+            response = api.post("/order/checkout", json=cart)
+            assert response.status_code == 503
+
+        assert len(calls) == 5
+        assert payment.breaker.state == "open"
+
+        response = api.post("/order/checkout", json=cart)
+
+        assert response.status_code == 503
+        assert len(calls) == 5
+
+
+def test_payment_breaker():
+    async def scenario():
+        payment = PaymentClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(500))
+        )
+        payment.breaker.threshold = 2
+
+        # Server errors outside the retried ones count as failures
+        for _ in range(2):
+            with pytest.raises(PaymentServiceError):
+                await payment.create_qrcode("67b1f2a6c2a3b1d4e5f60718", 32.0)
+
+        assert payment.breaker.state == "open"
+
+        # A half-open trial cancelled by its client opens the circuit again
+        hang = asyncio.Event()
+
+        async def slow(request):
+            await hang.wait()
+
+        payment = PaymentClient(transport=httpx.MockTransport(slow))
+        payment.breaker.opened_at = time.monotonic() - payment.breaker.reset_timeout
+        trial = asyncio.create_task(
+            payment.create_qrcode("67b1f2a6c2a3b1d4e5f60718", 32.0)
+        )
+        await asyncio.sleep(0.01)
+        trial.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        assert payment.breaker.state == "open"
+        assert not payment.breaker.trial_running
+
+    asyncio.run(scenario())
+
+
+def test_checkout_prices_items_in_one_query(test_db, statements, carts, api):
+    for title, price, amount in (("X-Egg", 32.0, 5), ("Batata", 12.5, 1), ("Suco", 8.0, 3)):
+        api.post(
+            "/items/register",
+            json={
+                "title": title,
+                "description": title,
+                "category": "Lanche",
+                "amount": amount,
+                "price": price
+            }
+        )
+
+    payment = AsyncMock(return_value={
+        "external_id": "67b1f2a6c2a3b1d4e5f60718",
+        "status": "pending",
+        "value": 0,
+        "qrcode": "00020126",
+    })
+
+    statements.clear()
+    with patch.object(main.app.payment, "create_qrcode", payment):
+        response = api.post(
+            "/order/checkout",
+            json={
+                "customer_id": 1,
+                # Client prices are ignored
+                "items": [
+                    {"id": 1, "amount": 2, "price": 0.01},
+                    {"id": 2, "amount": 1},
+                    {"id": 3, "amount": 3},
+                ],
+            },
+        )
+
+    assert response.status_code == 201
+    assert len([s for s in statements if "FROM items" in s]) == 1
+    # Stock of the whole cart taken by one statement
+    assert len([s for s in statements if s.startswith("UPDATE items")]) == 1
+
+    cart = next(iter(carts.carts.values()))
+
+    assert cart["total"] == 100.5
+    assert [item["price"] for item in cart["items"]] == [32.0, 12.5, 8.0]
+    assert payment.call_args.args[1] == 100.5
+
+    response = api.post(
+        "/order/checkout",
+        json={
+            "customer_id": 1,
+            "items": [{"id": 2, "amount": 1}, {"id": 2, "amount": 1}, {"id": 9, "amount": 1}],
+        },
+    )
+
+    # The first cart reserved the only one left
+    assert response.status_code == 422
+    assert response.json() == {"detail": [
+        {"id": 2, "error": "out of stock", "requested": 2, "available": 0},
+        {"id": 9, "error": "unknown item"},
+    ]}
+    assert len(carts.carts) == 1
+
+
+def test_background_publisher():
+    class FakeChannel:
+        channel_number = 1
+
+        def __init__(self):
+            self.published = []
+
+        def basic_publish(self, exchange, routing_key, body, properties=None):
+            self.published.append(body)
+
+    publisher = PikaPublisher()
+    publisher.confirm_window = 2
+
+    # Not connected yet: messages wait in the buffer, the caller returns
+    for order_id in range(5):
+        publisher.send_message({"id": order_id})
+
+    assert publisher.stats()["queue_depth"] == 5
+
+    channel = FakeChannel()
+    publisher._on_channel_ready(channel)
+
+    assert channel.published == ['{"id":0}', '{"id":1}']
+    assert publisher.stats()["in_flight"] == 2
+
+    # Batched ack frees the whole window
+    publisher._on_confirm(
+        1, SimpleNamespace(method=pika.spec.Basic.Ack(delivery_tag=2, multiple=True))
+    )
+
+    assert publisher.stats()["confirmed"] == 2
+    assert len(channel.published) == 4
+
+    # Nacked messages are published again
+    publisher._on_confirm(
+        1, SimpleNamespace(method=pika.spec.Basic.Nack(delivery_tag=3))
+    )
+
+    assert publisher.stats()["nacked"] == 1
+    assert channel.published[4] == '{"id":2}'
+
+    # Unconfirmed messages survive a dropped channel
+    publisher._forget_channel(1)
+    stats = publisher.stats()
+
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 3
+    assert stats["republished"] == 2
+
+
+def test_sync_publisher_reconnect():
+    connections = []
+
+    def connect(parameters):
+        connection = MagicMock(is_open=True, is_closed=False)
+        connections.append(connection)
+        return connection
+
+    with patch("pika.BlockingConnection", side_effect=connect):
+        pika_client = PikaClient()
+
+        # A nacked message is refused by a healthy broker: no reconnect
+        pika_client.publish("{}").result()
+        connections[0].channel.return_value.basic_publish.side_effect = (
+            pika.exceptions.NackError([])
+        )
+
+        with pytest.raises(PublishError):
+            pika_client.publish("{}").result()
+
+        assert len(connections) == 1
+
+        # A dropped connection is closed before reconnecting
+        connections[0].channel.return_value.basic_publish.side_effect = (
+            pika.exceptions.StreamLostError()
+        )
+        connections[0].close.side_effect = pika.exceptions.StreamLostError()
+
+        assert pika_client.publish("{}").result()
+        assert len(connections) == 2
+        connections[0].close.assert_called_once()
+        assert pika_client.stats()["reconnects"] == 1
+
+
+def test_publisher_health():
+    response = client.get("/health/publisher")
+
+    assert response.status_code == 200
+    assert response.json()["mode"] == "sync"
+
+
+def test_outbox_relay(test_db, carts):
+    class FakeBroker:
+        """Stand-in publisher confirming every message but the failing ones."""
+
+        def __init__(self, fail_on=()):
+            self.published = []
+            self.fail_on = fail_on
+
+        def publish(self, body):
+            future = Future()
+            if json.loads(body)["id"] in self.fail_on:
+                future.set_exception(PublishError("Broker unreachable"))
+            else:
+                self.published.append(json.loads(body))
+                future.set_result(True)
+            return future
+
+    for external_id in ("67b1f2a6c2a3b1d4e5f60718", "67b1f2a6c2a3b1d4e5f60719"):
+        carts.carts[external_id] = {
+            "customer_id": 1,
+            "items": [{"id": 1, "amount": 1, "price": 32.0}],
+            "total": 32.0,
+        }
+        response = client.post("/order/create", json={"external_id": external_id})
+        assert response.status_code == 201
+
+    # Broker down for the second order: it stays in the outbox
+    broker = FakeBroker(fail_on=(2,))
+    relay = OutboxRelay(broker, session_factory=TestingSessionLocal)
+
+    assert relay.run_once() == 1
+    assert broker.published == [
+        {
+            "id": 1,
+            "external_id": "67b1f2a6c2a3b1d4e5f60718",
+            "status": "Recebido",
+            "items": [{"id": 1, "amount": 1, "price": 32.0}],
+        }
+    ]
+
+    broker.fail_on = ()
+
+    assert relay.run_once() == 1
+    assert [message["id"] for message in broker.published] == [1, 2]
+    assert relay.run_once() == 0
+    assert relay.stats()["failures"] == 1
+
+    response = client.get("/health/outbox")
+
+    assert response.status_code == 200
+    assert response.json()["pending"] == 0
+
+
+def test_cart_repository():
+    # Invalid ids are a missing cart, not a server round trip
+    assert asyncio.run(main.app.carts.get("not-an-object-id")) is None
+
+    assert main.app.carts.collection.write_concern.document == {"w": 1, "j": False}
+    assert [index.document["name"] for index in CART_INDEXES] == [
+        "customer_id",
+        "created_at",
+        "expires_at",
+        "ordered_at",
+    ]
+
+
+def test_cart_lifecycle():
+    class Cursor(list):
+        def limit(self, count):
+            return Cursor(self[:count])
+
+        async def __aiter__(self):
+            for document in self:
+                yield document
+
+    collections = {"orders_cart": MagicMock(), "orders_cart_archive": MagicMock()}
+    mongo = SimpleNamespace(db=MagicMock())
+    mongo.db.get_collection.side_effect = lambda name, **kwargs: collections[name]
+    hot, archive = collections.values()
+
+    repository = CartRepository(mongo)
+
+    hot.insert_one = AsyncMock(return_value=SimpleNamespace(inserted_id=ObjectId()))
+    asyncio.run(repository.create({"customer_id": 1, "items": []}))
+
+    # Unpaid carts expire
+    document = hot.insert_one.call_args.args[0]
+    assert document["expires_at"] - document["created_at"] == timedelta(
+        seconds=main.conf_settings.cart_ttl
+    )
+
+    # Ordering reads the order fields only, archived carts included
+    cart_id = ObjectId()
+    hot.find_one = AsyncMock(return_value=None)
+    archive.find_one = AsyncMock(return_value={"customer_id": 1})
+
+    assert asyncio.run(repository.get_order(str(cart_id))) == {"customer_id": 1}
+    assert hot.find_one.call_args.kwargs["projection"] == ORDER_FIELDS
+    assert archive.find_one.call_args.args[0] == {"_id": cart_id}
+
+    # Then, once the order is committed, stops the expiry
+    hot.update_one = AsyncMock(return_value=SimpleNamespace(matched_count=1))
+
+    assert asyncio.run(repository.mark_ordered(str(cart_id)))
+
+    update = hot.update_one.call_args
+    assert update.args[0] == {"_id": cart_id}
+    assert update.args[1]["$unset"] == {"expires_at": ""}
+    assert "ordered_at" in update.args[1]["$set"]
+
+    ordered = [{"_id": ObjectId(), "items": []} for _ in range(3)]
+
+    # Archived carts are still found by id
+    hot.find = MagicMock(return_value=Cursor(ordered[:1]))
+    archive.find = MagicMock(return_value=Cursor(ordered[1:]))
+    carts = asyncio.run(repository.get_many([str(cart["_id"]) for cart in ordered]))
+    assert list(carts) == [str(cart["_id"]) for cart in ordered]
+
+    # A batch copied before a crash is copied again, then deleted
+    hot.find = MagicMock(return_value=Cursor(ordered))
+    hot.delete_many = AsyncMock()
+    archive.insert_many = AsyncMock(side_effect=BulkWriteError(
+        {"writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}]}
+    ))
+    archiver = CartArchiver(repository, after=3600, batch_size=2)
+
+    assert asyncio.run(archiver.run_once()) == 2
+    assert hot.find.call_args.args[0]["ordered_at"]["$lt"] < datetime.now(
+        timezone.utc
+    ) - timedelta(seconds=3599)
+    assert hot.delete_many.call_args.args[0] == {
+        "_id": {"$in": [cart["_id"] for cart in ordered[:2]]}
+    }
+    assert archiver.stats() == {"running": False, "archived": 2, "failures": 0}
+
+
+def test_resources():
+    resources = Resources()
+    closed = []
+
+    async def slow_warm(value):
+        await asyncio.sleep(0.2)
+
+    def blocking_warm(value):
+        time.sleep(0.2)
+
+    def failing_warm(value):
+        raise ConnectionError("Connection refused")
+
+    resources.register("mongo", lambda: "mongo", warm=slow_warm,
+                       close=closed.append)
+    resources.register("database", lambda: "database", warm=blocking_warm,
+                       close=closed.append)
+    resources.register("broker", lambda: "broker", warm=failing_warm)
+    resources.register("payment", lambda: "payment", close=closed.append)
+
+    start = time.perf_counter()
+    asyncio.run(resources.warm_up())
+
+    # Dependencies warm up concurrently, failures do not stop the others
+    assert time.perf_counter() - start < 0.35
+    assert resources.startup["mongo"]["ok"]
+    assert resources.startup["database"]["seconds"] >= 0.2
+    assert resources.startup["broker"] == {
+        "seconds": resources.startup["broker"]["seconds"],
+        "ok": False,
+        "error": "ConnectionError('Connection refused')",
+    }
+    assert "payment" not in resources.startup
+
+    assert resources.get("payment") == "payment"
+    asyncio.run(resources.close())
+
+    assert closed == ["payment", "database", "mongo"]
+    assert resources.opened() == []
+
+
+def test_warm_database(test_db):
+    main.warm_database(engine)
+
+    # Loaded from the engine it was given
+    assert main.app.lookups.order_status.id_of(OrderStatusEnum.done) == 3
+
+
+def test_worker_clients():
+    from app import __main__ as server
+
+    app = main.FoodOrdersApp()
+    main.register_resources(app)
+
+    # Nothing is opened at import, the first use opens the client
+    assert app.resources.opened() == []
+    assert app.carts.collection.database is app.mongo.db
+    assert app.resources.opened() == ["mongo", "carts"]
+
+    # A forked worker drops the parent's clients and opens its own
+    mongo = app.mongo
+    app.forget_resources()
+    assert app.resources.opened() == []
+    assert app.mongo is not mongo
+
+    # Unregistered names are not resources
+    missing = "not_a_client"
+    with pytest.raises(AttributeError):
+        getattr(app, missing)
+
+    # More workers are opt-in, each opens its own connections
+    assert config.Settings.model_fields["workers_count"].default == 1
+    with patch.object(server.conf_settings, "workers_count", 0):
+        assert server.worker_count() == server.available_cpus()
+    with patch.object(server.conf_settings, "workers_count", 3):
+        assert server.server_options(server.worker_count())["workers"] == 3
+    with patch.object(server.conf_settings, "reload", True):
+        assert server.worker_count() == 1
+
+    mongo.close()
+    asyncio.run(app.resources.close())
+
+
+def test_bulk_import(test_db):
+    client.post(
+        "/customer/register",
+        json={
+            "cpf": "10634272829",
+            "first_name": "Jorge",
+            "last_name": "Sousa",
+            "email": "jorge.sousa@outlook.com"
+        }
+    )
+    customers = (
+        "cpf,first_name,last_name,email\n"
+        "11111111111,Ana,Lima,ana@example.com\n"
+        "10634272829,Jorge,Sousa,jorge.sousa@outlook.com\n"
+        "22222222222,Bruno\n"
+        "33333333333,Carla,Dias,carla@example.com\n"
+        "11111111111,Ana,Lima,ana@example.com\n"
+    )
+
+    response = client.post(
+        "/bulk/customers",
+        params={"chunk_size": 2},
+        content=customers.encode(),
+        headers={"Content-Type": "text/csv"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "kind": "customers",
+        "received": 5,
+        "inserted": 2,
+        "skipped": 0,
+        "failed": 3,
+        "errors": [
+            {"line": 3, "error": "cpf 10634272829 already registered"},
+            {"line": 4, "error": "last_name: Field required; email: Field required"},
+            {"line": 6, "error": "cpf 11111111111 already registered"},
+        ],
+    }
+
+    response = client.post("/customer/identify", json={"cpf": "33333333333"})
+
+    assert response.status_code == 200
+
+    items = "\n".join([
+        json.dumps({"title": "X-Egg", "description": "Lanche", "category": "Lanche",
+                    "amount": 5, "price": 32.0}),
+        json.dumps({"title": "Pudim", "description": "Doce", "category": "Doce",
+                    "amount": 1, "price": 9.0}),
+        "{not json",
+        json.dumps({"title": "Suco", "description": "Laranja", "category": "Bebida",
+                    "amount": 3, "price": 8.0}),
+    ])
+
+    response = client.post(
+        "/bulk/items", params={"format": "ndjson"}, content=items.encode()
+    )
+
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 2
+    assert [error["line"] for error in response.json()["errors"]] == [2, 3]
+
+    response = client.get("/items/menu")
+
+    assert [item["title"] for item in response.json()["Lanche"]] == ["X-Egg"]
+    assert [item["title"] for item in response.json()["Bebida"]] == ["Suco"]
+
+
+def test_bulk_import_skipped(test_db):
+    customers = (
+        "cpf,first_name,last_name,email\n"
+        "44444444444,Davi,Reis,davi@example.com\n"
+        "55555555555,Elis,Melo,elis@example.com\n"
+    )
+
+    # Rows registered by someone else between the duplicate check and the
+    # INSERT are skipped by ON CONFLICT DO NOTHING, not counted as inserted
+    client.post("/bulk/customers", content=customers.encode())
+    with patch.object(BulkImport, "_skip_duplicates", lambda self, chunk: chunk):
+        response = client.post("/bulk/customers", content=customers.encode())
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "kind": "customers",
+        "received": 2,
+        "inserted": 0,
+        "skipped": 2,
+        "failed": 0,
+        "errors": [
+            {"line": 2, "error": "cpf 44444444444 registered concurrently"},
+            {"line": 3, "error": "cpf 55555555555 registered concurrently"},
+        ],
+    }
+
+
+def test_bulk_update_orders(test_db, statements, carts, api):
+    external_ids = [str(ObjectId()) for _ in range(3)]
+    for external_id in external_ids:
+        carts.carts[external_id] = {
+            "customer_id": 1,
+            "items": [{"id": 1, "amount": 1, "price": 32.0}],
+            "total": 32.0,
+        }
+        api.post("/order/create", json={"external_id": external_id})
+
+    missing_id = str(ObjectId())
+    statements.clear()
+
+    response = api.post(
+        "/order/update/bulk",
+        json={"orders": [
+            {"external_id": external_ids[0], "status": "Em preparação"},
+            {"external_id": external_ids[1], "status": "Pronto"},
+            {"external_id": missing_id, "status": "Pronto"},
+            {"external_id": external_ids[0], "status": "Pronto"},
+        ]},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "updated": 2,
+        "not_found": 1,
+        "results": [
+            {"external_id": external_ids[0], "status": "Pronto", "id": 1, "updated": True},
+            {"external_id": external_ids[1], "status": "Pronto", "id": 2, "updated": True},
+            {"external_id": missing_id, "status": "Pronto", "id": None, "updated": False},
+        ],
+    }
+    # One round trip whatever the batch size
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE")
+
+    with TestingSessionLocal() as db_session:
+        assert db_session.scalars(
+            select(OrderModel.status).order_by(OrderModel.id)
+        ).all() == [3, 3, 1]
+
+
+@patch.object(main.app, "customers", CustomerCache())
+def test_customer_cache(test_db, statements):
+    customer = {
+        "cpf": "10634272829",
+        "first_name": "Jorge",
+        "last_name": "Sousa",
+        "email": "jorge.sousa@outlook.com"
+    }
+
+    # Unknown CPF is cached as a negative entry
+    for _ in range(2):
+        response = client.post("/customer/identify", json={"cpf": customer["cpf"]})
+        assert response.status_code == 404
+
+    assert len([s for s in statements if "FROM customer" in s]) == 1
+
+    # Registering drops the negative entry
+    client.post("/customer/register", json=customer)
+    statements.clear()
+
+    for _ in range(3):
+        response = client.post("/customer/identify", json={"cpf": customer["cpf"]})
+        assert response.status_code == 200
+        assert response.json()["first_name"] == "Jorge"
+
+    assert len([s for s in statements if "FROM customer" in s]) == 1
+
+    response = client.get("/health/cache")
+
+    assert response.json()["customers"] == {
+        "size": 1,
+        "maxsize": 10000,
+        "hits": 2,
+        "negative_hits": 1,
+        "misses": 2,
+        "hit_ratio": 0.6,
+        "evictions": 0,
+        "invalidations": 1,
+    }
+
+
+def test_customer_cache_bounds():
+    cache = CustomerCache(maxsize=2, ttl=60, negative_ttl=0)
+    cache.put("1", None)
+    cache.put("2", "customer 2")
+    cache.put("3", "customer 3")
+
+    # Negative entry expired, the oldest was evicted anyway
+    assert cache.get("1") is MISSING
+    assert cache.get("2") == "customer 2"
+
+    cache.put("4", "customer 4")
+
+    assert cache.get("3") is MISSING
+    assert cache.get("2") == "customer 2"
+    assert cache.stats()["evictions"] == 2
+
+
+def test_request_logging(test_db):
+    records = []
+    handler = logger.add(
+        lambda line: records.append(json.loads(line)),
+        format=logs.json_format,
+        filter=logs.sample_debug,
+        level="DEBUG",
+    )
+    customer_json = {
+        "cpf": "10634272829",
+        "first_name": "Jorge",
+        "last_name": "Sousa",
+        "email": "jorge.sousa@outlook.com",
+    }
+
+    try:
+        # Debug records of unsampled routes are dropped, warnings are kept
+        with patch.object(logs.conf_settings, "log_debug_sampling",
+                          {"/customer/register": 0.0}):
+            response = client.post("/customer/register", json=customer_json)
+            logger.warning("Outside of a request")
+
+        assert response.status_code == 201
+        assert [record["message"] for record in records] == [
+            "Outside of a request"
+        ]
+        assert records[0]["request_id"] == "-"
+
+        records.clear()
+        with patch.object(logs.conf_settings, "log_debug_sample_rate", 1.0):
+            response = client.post(
+                "/customer/register",
+                json={**customer_json, "cpf": "52998224725"},
+                headers={"X-Request-ID": "checkout-42"},
+            )
+    finally:
+        logger.remove(handler)
+
+    assert response.headers["x-request-id"] == "checkout-42"
+    assert records[0]["message"] == "Customer 52998224725 registered"
+    assert records[0]["level"] == "DEBUG"
+    assert records[0]["request_id"] == "checkout-42"
+
+    # Generated when missing
+    assert len(client.get("/health").headers["x-request-id"]) == 32
+
+
+def test_queued_log_sink(tmp_path):
+    path = str(tmp_path / "api.log")
+    handler = logger.add(
+        logs.QueuedSink(logs.RotatingFile(path, max_bytes=200)),
+        format=logs.json_format,
+    )
+
+    for index in range(10):
+        logger.info("Order {} created", index)
+
+    # Removing the handler waits for the writer thread
+    logger.remove(handler)
+
+    files = sorted(tmp_path.iterdir())
+    assert len(files) > 1
+    lines = [
+        json.loads(line)
+        for file in files
+        for line in file.read_text().splitlines()
+    ]
+    assert sorted(line["message"] for line in lines) == [
+        f"Order {index} created" for index in range(10)
+    ]
+
+
+def test_metrics(test_db):
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    route = {"route": "/customer/identify"}
+    requests = sample("http_request_duration_seconds_count", method="POST",
+                      status="404", **route)
+    queries = sample("db_queries_per_request_sum", **route)
+
+    response = client.post("/customer/identify", json={"cpf": "10634272829"})
+    assert response.status_code == 404
+
+    assert sample("http_request_duration_seconds_count", method="POST",
+                  status="404", **route) == requests + 1
+    assert sample("db_queries_per_request_sum", **route) == queries + 1
+
+    # Unknown paths share one label
+    client.get("/does-not-exist")
+    assert sample("http_request_duration_seconds_count", method="GET",
+                  route="unmatched", status="404") >= 1
+
+    MongoCommandMetrics().succeeded(
+        SimpleNamespace(command_name="insert", duration_micros=1500)
+    )
+
+    failures = sample("rabbit_publish_failures_total")
+    future = Future()
+    observe_publish(future, 0)
+    future.set_exception(PublishError("Broker unreachable"))
+    assert sample("rabbit_publish_failures_total") == failures + 1
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for series in (
+        "http_request_duration_seconds_bucket",
+        "db_query_duration_seconds_bucket",
+        'mongo_command_duration_seconds_count{command="insert"',
+        "rabbit_publish_failures_total",
+    ):
+        assert series in response.text
+
+
+def test_model_response():
+    order = OrderUpdateResponse(id=1, status="Pronto")
+    response = serialization.model_response(order, 201)
+
+    # Encoded as is, FastAPI does not validate it again
+    assert response.status_code == 201
+    assert json.loads(response.body) == {"id": 1, "status": "Pronto"}
+
+    with patch.object(serialization.conf_settings, "fast_json", False):
+        assert serialization.model_response(order) is order
+
+
+def test_order_queue(test_db, carts, api):
+    with TestingSessionLocal() as db_session:
+        for index in range(5):
+            external_id = str(ObjectId())
+            carts.carts[external_id] = {"items": [{"id": index, "amount": 1}]}
+            db_session.add(OrderModel(
+                mongo_id=external_id, customer_id=index, status=2 if index else 1
+            ))
+        db_session.commit()
+
+    response = api.get("/order/queue?status=Em preparação&limit=3")
+    page = response.json()
+
+    assert response.status_code == 200
+    assert [order["id"] for order in page["orders"]] == [2, 3, 4]
+    assert page["orders"][0]["items"] is None
+    assert page["next_after"] == 4
+
+    response = api.get(
+        f"/order/queue?status=Em preparação&limit=3&after={page['next_after']}"
+        "&items=true"
+    )
+    page = response.json()
+
+    assert [order["id"] for order in page["orders"]] == [5]
+    assert page["orders"][0]["items"] == [{"id": 4, "amount": 1}]
+    assert page["next_after"] is None
+    # One cart query per page
+    assert carts.get_many_calls == 1
+
+
+def test_order_event_hub():
+    async def scenario():
+        hub = OrderEventHub(buffer=2)
+        event = {"id": 1, "external_id": "a", "status": "Pronto"}
+
+        with hub.subscribe(status="Pronto") as kitchen, \
+             hub.subscribe(external_id="b") as board:
+            hub.publish(event)
+            hub.publish({**event, "status": "Finalizado"})
+
+            assert await kitchen.get() == event
+            assert board.queue.empty()
+
+            # A subscriber that stops reading is dropped, not waited on
+            for _ in range(3):
+                hub.publish(event)
+
+            assert await kitchen.get() is None
+            assert hub.stats() == {
+                "subscribers": 1,
+                "published": 5,
+                "delivered": 3,
+                "dropped": 1,
+            }
+
+        assert hub.stats()["subscribers"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_order_event_fanout():
+    async def scenario():
+        hub = OrderEventHub()
+        fanout = OrderEventFanout(hub, dsn="postgresql://unused")
+        hub.fanout = fanout
+        event = {"id": 1, "external_id": "a", "status": "Pronto"}
+
+        with hub.subscribe() as subscriber:
+            # Sent to every worker, delivered when the notification comes back
+            fanout.connected = True
+            hub.publish(event)
+
+            assert subscriber.queue.empty()
+
+            fanout._receive(SimpleNamespace(
+                poll=lambda: None,
+                notifies=[SimpleNamespace(payload=json.dumps(event))],
+            ))
+
+            assert await subscriber.get() == event
+
+            # Without its connection the worker's own streams still get it
+            fanout.connected = False
+            fanout._pending()
+            hub.publish({**event, "status": "Finalizado"})
+
+            assert (await subscriber.get())["status"] == "Finalizado"
+
+        assert fanout.stats()["received"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_order_events_stream(test_db, carts):
+    external_id = "67b1f2a6c2a3b1d4e5f60718"
+    carts.carts[external_id] = {"customer_id": 1, "items": [], "total": 0.0}
+    client.post("/order/create", json={"external_id": external_id})
+
+    async def scenario():
+        disconnect = asyncio.Event()
+        chunks = []
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                chunks.append(message.get("body", b"").decode())
+                if "event: order" in chunks[-1]:
+                    disconnect.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/order/events",
+            "raw_path": b"/order/events",
+            "root_path": "",
+            "query_string": b"status=Pronto",
+            "headers": [],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80),
+            "app": main.app,
+        }
+        stream = asyncio.create_task(main.app(scope, receive, send))
+
+        while not main.app.order_events.stats()["subscribers"]:
+            await asyncio.sleep(0.01)
+
+        # Updated by a threadpool route on the TestClient's own loop
+        response = await asyncio.to_thread(
+            client.post,
+            "/order/update",
+            json={"external_id": external_id, "status": "Pronto"},
+        )
+        assert response.status_code == 200
+
+        await asyncio.wait_for(stream, 5)
+
+        return "".join(chunks)
+
+    body = asyncio.run(scenario())
+
+    assert body.startswith("retry: 3000")
+    assert (
+        f'event: order\ndata: {{"id":1,"external_id":"{external_id}",'
+        '"status":"Pronto"}' in body
+    )
+    assert main.app.order_events.stats()["subscribers"] == 0
+
+
+def test_idempotent_checkout(test_db, carts, api):
+    payment = AsyncMock(return_value={
+        "external_id": "67b1f2a6c2a3b1d4e5f60718",
+        "status": "pending",
+        "value": 32.0,
+        "qrcode": "00020126",
+    })
+    api.post("/items/register", json={
+        "title": "X-Egg",
+        "description": "Lanche",
+        "category": "Lanche",
+        "amount": 10,
+        "price": 32.0,
+    })
+    cart = {"customer_id": 1, "items": [{"id": 1, "amount": 1}]}
+    headers = {"Idempotency-Key": "kiosk-7-0001"}
+
+    with patch.object(main.app.payment, "create_qrcode", payment):
+        first = api.post("/order/checkout", json=cart, headers=headers)
+        retry = api.post("/order/checkout", json=cart, headers=headers)
+
+        # Same key, different cart
+        other = api.post(
+            "/order/checkout",
+            json={**cart, "items": [{"id": 1, "amount": 2}]},
+            headers=headers,
+        )
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert payment.await_count == 1
+    assert len(carts.carts) == 1
+    assert other.status_code == 422
+
+
+def test_idempotent_order_create(test_db, carts, api):
+    external_id = "67b1f2a6c2a3b1d4e5f60718"
+    headers = {"Idempotency-Key": "kiosk-7-0002"}
+    body = {"external_id": external_id}
+
+    # Failed requests free the key
+    response = api.post("/order/create", json=body, headers=headers)
+    assert response.status_code == 404
+
+    carts.carts[external_id] = {
+        "customer_id": 1,
+        "items": [{"id": 1, "amount": 1, "price": 32.0}],
+        "total": 32.0,
+    }
+
+    first = api.post("/order/create", json=body, headers=headers)
+    retry = api.post("/order/create", json=body, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    # Without a key the unique cart id stops the duplicate
+    response = api.post("/order/create", json=body)
+    assert response.status_code == 409
+
+    with TestingSessionLocal() as db_session:
+        assert len(db_session.scalars(select(OrderModel)).all()) == 1
+        assert len(db_session.scalars(select(OutboxEvent)).all()) == 1
+
+
+def test_stock_reservation(test_db, carts):
+    client.post("/items/register", json={
+        "title": "X-Egg",
+        "description": "Lanche",
+        "category": "Lanche",
+        "amount": 5,
+        "price": 32.0,
+    })
+
+    def reserve(_):
+        with TestingSessionLocal() as db_session:
+            try:
+                return reserve_stock(db_session, [{"id": 1, "amount": 1}])
+            except CartItemError:
+                return None
+
+    # Twenty concurrent checkouts of the last five
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        reservations = [
+            reservation_id
+            for reservation_id in executor.map(reserve, range(20))
+            if reservation_id is not None
+        ]
+
+    def amount():
+        with TestingSessionLocal() as db_session:
+            return db_session.get(ItemsModel, 1).amount
+
+    assert len(reservations) == 5
+    assert amount() == 0
+
+    with TestingSessionLocal() as db_session:
+        release_reservation(db_session, reservations[0])
+        # Released twice, given back once
+        release_reservation(db_session, reservations[0])
+
+        confirm_reservation(db_session, {
+            "reservation_id": reservations[1],
+            "items": [{"id": 1, "amount": 1}],
+        })
+        db_session.commit()
+
+    assert amount() == 1
+
+    # The other three carts are abandoned
+    reaper = ReservationReaper(TestingSessionLocal, ttl=1e-6, batch_size=2)
+
+    assert reaper.run_once() == 2
+    assert reaper.run_once() == 1
+    assert reaper.run_once() == 0
+    assert amount() == 4
+
+    # Ordering an expired cart takes the stock again
+    with TestingSessionLocal() as db_session:
+        confirm_reservation(db_session, {
+            "reservation_id": reservations[2],
+            "items": [{"id": 1, "amount": 4}],
+        })
+        db_session.commit()
+
+    assert amount() == 0
+
+    response = client.get("/health/stock")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "reserved": 0, "running": False, "released": 0, "failures": 0
+    }
+
+
+def test_order_retry_after_sell_out(test_db, carts, api):
+    api.post("/items/register", json={
+        "title": "X-Egg",
+        "description": "Lanche",
+        "category": "Lanche",
+        "amount": 1,
+        "price": 32.0,
+    })
+    payment = AsyncMock(return_value={
+        "external_id": "67b1f2a6c2a3b1d4e5f60718",
+        "status": "pending",
+        "value": 32.0,
+        "qrcode": "00020126",
+    })
+
+    with patch.object(main.app.payment, "create_qrcode", payment):
+        response = api.post(
+            "/order/checkout",
+            json={"customer_id": 1, "items": [{"id": 1, "amount": 1}]},
+        )
+    assert response.status_code == 201
+
+    body = {"external_id": next(iter(carts.carts))}
+
+    assert api.post("/order/create", json=body).status_code == 201
+
+    # The item sold out with the order, a retry is still a duplicate
+    response = api.post("/order/create", json=body)
+
+    assert response.status_code == 409
+    assert response.json() == {"detail": "Order already created"}
+
+
+def test_failed_order_keeps_cart_expiring(test_db, carts, api):
+    api.post("/items/register", json={
+        "title": "X-Egg",
+        "description": "Lanche",
+        "category": "Lanche",
+        "amount": 1,
+        "price": 32.0,
+    })
+    payment = AsyncMock(return_value={
+        "external_id": "67b1f2a6c2a3b1d4e5f60718",
+        "status": "pending",
+        "value": 32.0,
+        "qrcode": "00020126",
+    })
+
+    with patch.object(main.app.payment, "create_qrcode", payment):
+        api.post(
+            "/order/checkout",
+            json={"customer_id": 1, "items": [{"id": 1, "amount": 1}]},
+        )
+
+    cart_id, cart = next(iter(carts.carts.items()))
+    reservation_id = cart["reservation_id"]
+    body = {"external_id": cart_id}
+
+    # Its reservation was given back and the last one sold meanwhile
+    cart["reservation_id"] = reservation_id + 1
+    response = api.post("/order/create", json=body)
+
+    assert response.status_code == 422
+    assert carts.ordered == set()
+
+    cart["reservation_id"] = reservation_id
+    response = api.post("/order/create", json=body)
+
+    assert response.status_code == 201
+    assert carts.ordered == {cart_id}
+
+    # A duplicate does not touch the cart either
+    carts.ordered.clear()
+    response = api.post("/order/create", json=body)
+
+    assert response.status_code == 409
+    assert carts.ordered == set()
+
+
+def test_sales_rollups(test_db, statements, carts, api):
+    for title, category, price in (("X-Egg", "Lanche", 32.0), ("Suco", "Bebida", 8.0)):
+        api.post("/items/register", json={
+            "title": title,
+            "description": title,
+            "category": category,
+            "amount": 10,
+            "price": price,
+        })
+
+    # Carts checked out at 12:05, 12:40 and 13:10 UTC
+    for minute, items in (
+        (5, [{"id": 1, "amount": 2, "price": 32.0}, {"id": 2, "amount": 1, "price": 8.0}]),
+        (40, [{"id": 1, "amount": 1, "price": 32.0}]),
+        (70, [{"id": 2, "amount": 3, "price": 8.0}]),
+    ):
+        cart_id = str(ObjectId.from_datetime(
+            datetime(2026, 10, 18, 12, tzinfo=timezone.utc) + timedelta(minutes=minute)
+        ))
+        carts.carts[cart_id] = {"customer_id": 1, "items": items, "total": 0}
+        response = api.post("/order/create", json={"external_id": cart_id})
+        assert response.status_code == 201
+
+    def stats(group_by, start="2026-10-18T12:00:00Z", end="2026-10-18T14:00:00Z"):
+        response = api.get(
+            "/order/stats",
+            params={"start": start, "end": end, "group_by": group_by},
+        )
+        assert response.status_code == 200
+        return response.json()["rows"]
+
+    statements.clear()
+    by_item = stats("item")
+
+    # Answered from the rollups alone
+    queries = [s for s in statements if "FROM" in s]
+    assert len(queries) == 1 and "FROM sales_hourly" in queries[0]
+    assert by_item == [
+        {"item_id": 1, "category": None, "hour": None, "units": 3, "revenue": 96.0},
+        {"item_id": 2, "category": None, "hour": None, "units": 4, "revenue": 32.0},
+    ]
+    assert [(row["category"], row["units"]) for row in stats("category")] == [
+        ("Lanche", 3), ("Bebida", 4),
+    ]
+    assert [(row["hour"], row["revenue"]) for row in stats("hour")] == [
+        ("2026-10-18T12:00:00Z", 104.0), ("2026-10-18T13:00:00Z", 24.0),
+    ]
+
+    # Widened to whole hours
+    response = api.get("/order/stats", params={
+        "start": "2026-10-18T12:30:00Z", "end": "2026-10-18T12:45:00Z",
+    })
+    assert response.json()["start"] == "2026-10-18T12:00:00Z"
+    assert response.json()["end"] == "2026-10-18T13:00:00Z"
+    assert [row["units"] for row in response.json()["rows"]] == [3, 1]
+
+    response = api.get("/order/stats", params={
+        "start": "2026-10-18T14:00:00Z", "end": "2026-10-18T12:00:00Z",
+    })
+    assert response.status_code == 422
+
+    # Rebuilt from the carts in batches, same buckets
+    assert asyncio.run(rebuild(TestingSessionLocal, carts, batch_size=2)) == 3
+    assert carts.get_many_calls == 2
+    assert stats("item") == by_item
+
+    # An order created while rebuilding is counted once
+    late_id = str(ObjectId.from_datetime(
+        datetime(2026, 10, 18, 13, 30, tzinfo=timezone.utc)
+    ))
+    carts.carts[late_id] = {
+        "customer_id": 1,
+        "items": [{"id": 2, "amount": 5, "price": 8.0}],
+        "total": 40.0,
+    }
+    get_many = carts.get_many
+
+    async def create_order_first(cart_ids):
+        if carts.get_many_calls == 2:
+            response = api.post("/order/create", json={"external_id": late_id})
+            assert response.status_code == 201
+        return await get_many(cart_ids)
+
+    with patch.object(carts, "get_many", create_order_first):
+        assert asyncio.run(rebuild(TestingSessionLocal, carts, batch_size=2)) == 4
+
+    by_item = stats("item")
+    assert [(row["item_id"], row["units"]) for row in by_item] == [
+        (1, 3), (2, 9),
+    ]
+
+    # Ids are taken at INSERT: order 2 commits after its range was read
+    with TestingSessionLocal() as db_session:
+        order = db_session.get(OrderModel, 2)
+        row = {
+            "id": 2,
+            "mongo_id": order.mongo_id,
+            "customer_id": order.customer_id,
+            "status": order.status,
+        }
+        db_session.delete(order)
+        db_session.commit()
+
+    async def commit_order_first(cart_ids):
+        if not committed:
+            # Stats are served whole while rebuilding
+            assert stats("item") == by_item
+            with TestingSessionLocal() as db_session:
+                db_session.add(OrderModel(**row))
+                db_session.commit()
+            committed.append(row["id"])
+        return await get_many(cart_ids)
+
+    committed = []
+    with patch.object(carts, "get_many", commit_order_first):
+        assert asyncio.run(rebuild(TestingSessionLocal, carts, batch_size=2)) == 4
+
+    assert stats("item") == by_item
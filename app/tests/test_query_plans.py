@@ -0,0 +1,245 @@
+"""
+Query plan regression suite.
+
+Hot router endpoints are called against a seeded database while their SQL
+is recorded, then every recorded query is run again under EXPLAIN. A full
+table scan of one of the growing tables fails the test.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson.objectid import ObjectId
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert, text
+from unittest.mock import AsyncMock, patch
+
+from app import main
+from app.database import Base, get_db
+from app.models.customer import Customer as CustomerModel
+from app.models.items import Items as ItemsModel
+from app.models.order import Order as OrderModel
+from app.models.sales import SalesHourly
+from app.tests.db import engine, override_get_db
+
+# Seed tables (order_status, items_category) are tiny and may be scanned
+HOT_TABLES = {"customer", "items", "order", "outbox", "sales_hourly"}
+
+ROWS = 5000
+
+SALES_START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+main.app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(main.app)
+
+
+def seq_scans(connection, statement: str, parameters) -> list:
+    """
+    Tables fully scanned by a statement.
+
+    :param connection: Database connection.
+    :param statement: SQL statement, as sent to the driver.
+    :param parameters: Driver parameters.
+    """
+    if connection.dialect.name == "postgresql":
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters
+        ).scalar()
+        nodes = [plan[0]["Plan"]]
+        scans = []
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan":
+                scans.append(node["Relation Name"])
+            nodes.extend(node.get("Plans", []))
+        return scans
+
+    rows = connection.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {statement}", parameters
+    ).all()
+
+    return [
+        match.group(1)
+        for *_, detail in rows
+        if (match := re.match(r"SCAN (?:TABLE )?(\w+)", detail))
+    ]
+
+
+@pytest.fixture(scope="module")
+def seeded_db():
+    """
+    Database with enough rows for the planner to prefer indexes.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO items_category (description) "
+            "VALUES ('Lanche'), ('Acompanhamento'), ('Bebida'), ('Sobremesa')"
+        ))
+        conn.execute(text(
+            "INSERT INTO order_status (description) "
+            "VALUES ('Recebido'), ('Em preparação'), ('Pronto'), ('Finalizado')"
+        ))
+        conn.execute(insert(CustomerModel), [
+            {
+                "cpf": f"{index:011d}",
+                "first_name": "Cliente",
+                "last_name": str(index),
+                "email": f"cliente{index}@example.com",
+            }
+            for index in range(ROWS)
+        ])
+        conn.execute(insert(ItemsModel), [
+            {
+                "title": f"Item {index}",
+                "description": "Item",
+                "category": index % 4 + 1,
+                "amount": 1000,
+                "price": 10.0,
+            }
+            for index in range(ROWS)
+        ])
+        conn.execute(insert(OrderModel), [
+            {"mongo_id": str(ObjectId()), "customer_id": index, "status": 1}
+            for index in range(ROWS)
+        ])
+        conn.execute(insert(SalesHourly), [
+            {
+                "hour": SALES_START + timedelta(hours=index // 10),
+                "item_id": index % 10 + 1,
+                "category": index % 4 + 1,
+                "units": 1,
+                "revenue": 10.0,
+            }
+            for index in range(ROWS)
+        ])
+        conn.execute(text("ANALYZE"))
+
+    with engine.connect() as conn:
+        mongo_ids = conn.execute(
+            text('SELECT mongo_id FROM "order" ORDER BY id LIMIT 3')
+        ).scalars().all()
+
+    yield mongo_ids
+
+    main.app.lookups.invalidate()
+    main.app.menu.invalidate()
+    main.app.customers.clear()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture()
+def recorded():
+    """
+    (statement, parameters) pairs sent to the test database.
+    """
+    executed = []
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if not executemany:
+            executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def assert_no_seq_scans(recorded: list):
+    queries = [
+        (statement, parameters)
+        for statement, parameters in recorded
+        if re.match(r"\s*(SELECT|UPDATE|DELETE)", statement, re.IGNORECASE)
+    ]
+    assert queries
+
+    with engine.connect() as conn:
+        for statement, parameters in queries:
+            scanned = HOT_TABLES.intersection(
+                seq_scans(conn, statement, parameters)
+            )
+            assert not scanned, f"{sorted(scanned)} scanned by: {statement}"
+
+
+def test_identify_customer_plan(seeded_db, recorded):
+    main.app.customers.clear()
+    response = client.post("/customer/identify", json={"cpf": f"{42:011d}"})
+
+    assert response.status_code == 200
+    assert_no_seq_scans(recorded)
+
+
+def test_update_order_plan(seeded_db, recorded):
+    response = client.post(
+        "/order/update", json={"external_id": seeded_db[0], "status": "Pronto"}
+    )
+
+    assert response.status_code == 200
+    assert_no_seq_scans(recorded)
+
+
+def test_bulk_update_orders_plan(seeded_db, recorded):
+    response = client.post(
+        "/order/update/bulk",
+        json={"orders": [
+            {"external_id": mongo_id, "status": "Em preparação"}
+            for mongo_id in seeded_db
+        ]},
+    )
+
+    assert response.json()["updated"] == 3
+    assert_no_seq_scans(recorded)
+
+
+def test_order_queue_plan(seeded_db, recorded):
+    response = client.get("/order/queue?status=Recebido&after=2500&limit=20")
+
+    assert len(response.json()["orders"]) == 20
+    assert_no_seq_scans(recorded)
+
+
+def test_list_items_by_category_plan(seeded_db, recorded):
+    main.app.menu.invalidate()
+    response = client.get("/items/list/Bebida")
+
+    assert response.status_code == 200
+    assert_no_seq_scans(recorded)
+
+
+def test_checkout_pricing_plan(seeded_db, recorded):
+    carts = AsyncMock()
+    carts.create.return_value = str(ObjectId())
+    payment = AsyncMock(return_value={
+        "external_id": carts.create.return_value,
+        "status": "pending",
+        "value": 30.0,
+        "qrcode": "00020126",
+    })
+
+    with patch.object(main.app, "carts", carts), \
+         patch.object(main.app.payment, "create_qrcode", payment):
+        response = client.post(
+            "/order/checkout",
+            json={"customer_id": 1, "items": [
+                {"id": 1, "amount": 1}, {"id": 2, "amount": 2},
+            ]},
+        )
+
+    assert response.status_code == 201
+    assert response.json()["qrcode"] == "00020126"
+    assert_no_seq_scans(recorded)
+
+
+def test_sales_stats_plan(seeded_db, recorded):
+    response = client.get("/order/stats", params={
+        "start": (SALES_START + timedelta(hours=100)).isoformat(),
+        "end": (SALES_START + timedelta(hours=124)).isoformat(),
+        "group_by": "category",
+    })
+
+    assert sum(row["units"] for row in response.json()["rows"]) == 240
+    assert_no_seq_scans(recorded)
@@ -0,0 +1,159 @@
+"""
+Benchmark order cart lookups as orders_cart grows.
+
+Each of ``--rounds`` rounds checks out ``--carts`` carts of ``--items``
+items, orders ``--ordered`` of them and times the cart read of order
+creation, with ``--concurrency`` reads in flight, in two databases:
+
+- ``before``: the whole cart read with ``find_one`` and every cart kept
+  forever (the previous behaviour);
+- ``after``: ``CartRepository.get_order`` reading the order fields
+  only, ``mark_ordered`` once the order would be committed, then the
+  lifecycle: unpaid carts expire (deleted the way the TTL monitor does, it
+  only runs once a minute) and ordered carts are archived.
+
+Every round reports the carts left in ``orders_cart``, its data and index
+size (the working set), read latency and bytes returned per read. It
+needs a running MongoDB (``docker compose up mongodb``); both databases
+are dropped at the end.
+
+Usage::
+
+    python -m benchmarks.bench_cart_lifecycle --rounds 5 --carts 20000
+"""
+
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import bson
+
+from app.carts import CART_INDEXES
+from app.mongo import MONGODB_URL
+from benchmarks.bench_cart_store import MotorCarts, measure
+
+# Cart expiry in the round, the TTL monitor must not delete carts while
+# they are being read, the lifecycle step expires them ahead of time
+EXPIRY = timedelta(minutes=10)
+
+
+def make_cart(items: int, expires_at: datetime | None) -> dict:
+    cart = {
+        "customer_id": random.randrange(500),
+        "items": [
+            {
+                "id": index,
+                "title": f"Item {index}",
+                "amount": 1,
+                "price": 9.5,
+                "notes": "sem cebola",
+            }
+            for index in range(items)
+        ],
+        "total": 9.5 * items,
+        "reservation_id": random.randrange(1 << 30),
+        "created_at": datetime.now(timezone.utc),
+    }
+    if expires_at:
+        cart["expires_at"] = expires_at
+
+    return cart
+
+
+async def checkout(store: MotorCarts, expires: bool, args) -> list:
+    """
+    Insert a round of carts, with `expires` expiring within `EXPIRY`.
+
+    :returns: Ids of the carts to order.
+    """
+    expires_at = datetime.now(timezone.utc) + EXPIRY if expires else None
+    cart_ids = []
+
+    for start in range(0, args.carts, 1000):
+        result = await store.collection.insert_many(
+            [
+                make_cart(args.items, expires_at)
+                for _ in range(min(1000, args.carts - start))
+            ]
+        )
+        cart_ids.extend(str(cart_id) for cart_id in result.inserted_ids)
+
+    return random.sample(cart_ids, args.ordered)
+
+
+async def lifecycle(store: MotorCarts):
+    """
+    Expire the unpaid carts of the round and archive ordered ones.
+    """
+    now = datetime.now(timezone.utc)
+    await store.collection.delete_many({"expires_at": {"$lte": now + EXPIRY}})
+
+    before = now + timedelta(seconds=1)
+    while await store.archive_ordered(before, 5000):
+        pass
+
+
+async def size(store: MotorCarts) -> tuple:
+    stats = await store.collection.database.command(
+        "collStats", store.collection.name
+    )
+
+    return stats["count"], stats["size"] + stats["totalIndexSize"]
+
+
+async def run(args):
+    stores = {
+        mode: MotorCarts(args.url, f"{args.database}_{mode}")
+        for mode in ("before", "after")
+    }
+
+    for mode, store in stores.items():
+        await store.collection.drop()
+        await store.archive.drop()
+        # Before: the customer_id and created_at indexes, no TTL
+        await store.collection.create_indexes(
+            CART_INDEXES[:2] if mode == "before" else CART_INDEXES
+        )
+
+    for round_number in range(1, args.rounds + 1):
+        for mode, store in stores.items():
+            cart_ids = await checkout(store, mode == "after", args)
+            read = store.get if mode == "before" else store.get_order
+
+            # The lifecycle runs between rounds, the reads see the carts of
+            # this round plus whatever the previous ones left
+            documents, working_set = await size(store)
+            result = await measure(read, cart_ids, args.concurrency)
+            returned = sum(
+                len(bson.encode(cart)) for cart in result["results"]
+            ) / len(cart_ids)
+
+            if mode == "after":
+                await measure(store.mark_ordered, cart_ids, args.concurrency)
+                await lifecycle(store)
+
+            print(
+                f"round {round_number} {mode:>6}: {documents:8d} carts  "
+                f"{working_set / 2**20:8.1f} MiB  "
+                f"p50 {result['p50']:6.2f} ms  p99 {result['p99']:6.2f} ms  "
+                f"{returned:6.0f} B/read"
+            )
+
+    for store in stores.values():
+        await store.mongo.client.drop_database(store.collection.database.name)
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--carts", type=int, default=20000)
+    parser.add_argument("--ordered", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--url", default=MONGODB_URL)
+    parser.add_argument("--database", default="food_orders_bench")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
@@ -0,0 +1,179 @@
+"""
+Benchmark cart insert and lookup latency under concurrency.
+
+Compares the two ways the order routers have reached MongoDB:
+
+- ``threadpool``: blocking ``pymongo`` calls on worker threads (the
+  previous behaviour);
+- ``motor``: the async ``CartRepository``, with the pool and write concern
+  configured in ``Settings``.
+
+Each mode inserts ``--requests`` carts, reads them back by id and lists
+carts by ``customer_id``, with ``--concurrency`` operations in flight. It
+needs a running MongoDB (``docker compose up mongodb``); the carts are
+written to a throwaway database which is dropped at the end.
+
+Usage::
+
+    python -m benchmarks.bench_cart_store --requests 5000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import anyio
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from app.carts import CartRepository
+from app.mongo import MONGODB_URL, Mongo, client_options, write_concern
+
+CUSTOMERS = 500
+
+
+def make_cart(customer_id: int) -> dict:
+    return {
+        "customer_id": customer_id,
+        "items": [
+            {"id": 1, "amount": 2, "price": 32.0},
+            {"id": 7, "amount": 1, "price": 9.5},
+        ],
+        "total": 73.5,
+    }
+
+
+class ThreadpoolCarts:
+    """Blocking pymongo collection driven from worker threads."""
+
+    def __init__(self, url: str, database: str):
+        self.client = MongoClient(url, **client_options())
+        self.collection = self.client[database].get_collection(
+            "orders_cart", write_concern=write_concern()
+        )
+
+    async def create(self, cart: dict) -> str:
+        result = await anyio.to_thread.run_sync(self.collection.insert_one, cart)
+        return str(result.inserted_id)
+
+    async def get(self, cart_id: str) -> dict | None:
+        return await anyio.to_thread.run_sync(
+            self.collection.find_one, {"_id": ObjectId(cart_id)}
+        )
+
+    async def by_customer(self, customer_id: int) -> list:
+        return await anyio.to_thread.run_sync(
+            lambda: list(self.collection.find({"customer_id": customer_id}))
+        )
+
+    def close(self):
+        self.client.close()
+
+
+class MotorCarts(CartRepository):
+    """The app's cart repository on a benchmark database."""
+
+    def __init__(self, url: str, database: str):
+        self.mongo = Mongo(url)
+        self.mongo.db = self.mongo.client[database]
+        super().__init__(self.mongo)
+
+    async def by_customer(self, customer_id: int) -> list:
+        return await self.collection.find({"customer_id": customer_id}).to_list(
+            None
+        )
+
+    def close(self):
+        self.mongo.close()
+
+
+async def measure(operation, args_list: list, concurrency: int) -> dict:
+    """
+    Run `operation` once per argument with `concurrency` calls in flight.
+
+    :return: latency percentiles (ms), operations per second and results.
+    """
+    latencies = []
+    results = []
+    counter = iter(args_list)
+
+    async def worker():
+        for arg in counter:
+            start = time.perf_counter()
+            results.append(await operation(arg))
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+
+    return {
+        "ops": len(args_list) / elapsed,
+        "p50": quantiles[49] * 1000,
+        "p95": quantiles[94] * 1000,
+        "p99": quantiles[98] * 1000,
+        "results": results,
+    }
+
+
+def report(mode: str, operation: str, result: dict):
+    print(
+        f"{mode:>10} {operation:<11}: {result['ops']:8.1f} ops/s  "
+        f"p50 {result['p50']:7.2f} ms  "
+        f"p95 {result['p95']:7.2f} ms  "
+        f"p99 {result['p99']:7.2f} ms"
+    )
+
+
+async def run(args):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+    admin = MotorCarts(args.url, args.database)
+
+    for mode, store_class in (
+        ("threadpool", ThreadpoolCarts),
+        ("motor", MotorCarts),
+    ):
+        # Every mode starts from an empty, indexed collection
+        await admin.collection.drop()
+        await admin.ensure_indexes()
+
+        store = store_class(args.url, args.database)
+        customers = [random.randrange(CUSTOMERS) for _ in range(args.requests)]
+
+        result = await measure(
+            lambda customer_id, store=store: store.create(make_cart(customer_id)),
+            customers,
+            args.concurrency,
+        )
+        report(mode, "insert", result)
+
+        cart_ids = result["results"]
+        random.shuffle(cart_ids)
+
+        report(mode, "get", await measure(store.get, cart_ids, args.concurrency))
+        report(
+            mode,
+            "by_customer",
+            await measure(store.by_customer, customers, args.concurrency),
+        )
+
+        store.close()
+
+    await admin.mongo.client.drop_database(args.database)
+    admin.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=40)
+    parser.add_argument("--url", default=MONGODB_URL)
+    parser.add_argument("--database", default="food_orders_bench")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
@@ -0,0 +1,164 @@
+"""
+Benchmark checkout throughput against a local fake payment service.
+
+Drives ``POST /order/checkout`` on the real app in-process. The Mongo cart
+insert is replaced by an in-memory stand-in and items are priced from a
+SQLite database (``--db-url``) so only the payment call differs between
+the two modes:
+
+- ``legacy``: a blocking ``httpx.post`` per checkout on a worker thread,
+  with a fresh TCP connection each time (the previous behaviour);
+- ``pooled``: the app's ``PaymentClient`` (keep-alive pool).
+
+Usage::
+
+    python -m benchmarks.bench_checkout --requests 1000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import anyio
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import database, main
+from app.models.items import Items as ItemsModel
+from app.models.items import ItemsCategory as ItemsCategoryModel
+from app.payment import PaymentClient
+from benchmarks.fake_payment import FakePaymentServer
+from benchmarks.fakes import InMemoryCarts
+
+
+def use_database(url: str):
+    """
+    Serve the app from `url`, with the benchmark item in stock.
+
+    :param url: Sync database URL.
+    """
+    engine = create_engine(url)
+    database.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+
+    with session_factory() as db_session:
+        if not db_session.get(ItemsModel, 1):
+            db_session.add(ItemsCategoryModel(id=1, description="Lanche"))
+            db_session.add(
+                ItemsModel(
+                    id=1,
+                    title="X-Egg",
+                    description="X-Egg",
+                    category=1,
+                    amount=10**9,
+                    price=32.0,
+                )
+            )
+            db_session.commit()
+
+    def get_db():
+        db_session = session_factory()
+        try:
+            yield db_session
+        finally:
+            db_session.close()
+
+    main.app.dependency_overrides[database.get_db] = get_db
+
+
+class LegacyPayment:
+    """Unpooled blocking client, as checkout used to call the service."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    async def create_qrcode(self, external_id: str, value: float) -> dict:
+        response = await anyio.to_thread.run_sync(
+            lambda: httpx.post(
+                f"{self.base_url}/qrcode",
+                json={"external_id": external_id, "value": value},
+            )
+        )
+        return response.json()
+
+    async def aclose(self):
+        pass
+
+
+async def drive(requests: int, concurrency: int) -> dict:
+    """
+    Fire `requests` checkouts with `concurrency` in flight.
+
+    :return: latency percentiles (ms) and requests per second.
+    """
+    latencies = []
+    counter = iter(range(requests))
+    cart = {
+        "customer_id": 1,
+        "items": [{"id": 1, "amount": 2, "price": 32.0}],
+    }
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def worker():
+            for _ in counter:
+                start = time.perf_counter()
+                response = await client.post("/order/checkout", json=cart)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+
+    return {
+        "rps": requests / elapsed,
+        "p50": quantiles[49] * 1000,
+        "p95": quantiles[94] * 1000,
+        "p99": quantiles[98] * 1000,
+    }
+
+
+async def run(args, url: str):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+    main.app.carts = InMemoryCarts()
+    use_database(args.db_url)
+
+    for mode, payment in (
+        ("legacy", LegacyPayment(url)),
+        ("pooled", PaymentClient(base_url=url)),
+    ):
+        main.app.payment = payment
+        await drive(min(args.requests, 100), args.concurrency)  # warm up
+        result = await drive(args.requests, args.concurrency)
+        await payment.aclose()
+
+        print(
+            f"{mode:>6}: {result['rps']:8.1f} req/s  "
+            f"p50 {result['p50']:7.2f} ms  "
+            f"p95 {result['p95']:7.2f} ms  "
+            f"p99 {result['p99']:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=40)
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--db-url", default="sqlite:///./bench_checkout.db")
+    parser.add_argument(
+        "--delay", type=float, default=0.01, help="fake service latency (s)"
+    )
+    args = parser.parse_args()
+
+    with FakePaymentServer(port=args.port, delay=args.delay) as server:
+        asyncio.run(run(args, server.url))
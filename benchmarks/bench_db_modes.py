@@ -0,0 +1,237 @@
+r"""
+Benchmark the sync (threadpool) and async (AsyncSession) database modes.
+
+Both apps are driven in-process through ``httpx.ASGITransport`` with the
+same number of concurrent clients, so the only difference between the runs
+is how the routers reach the database.
+
+Usage::
+
+    python -m benchmarks.bench_db_modes --requests 2000 --concurrency 100
+
+By default the database configured in ``Settings`` is used. To run it
+offline against SQLite::
+
+    python -m benchmarks.bench_db_modes \
+        --sync-url sqlite:///./bench.db \
+        --async-url sqlite+aiosqlite:///./bench.db
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import anyio
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.customers import CustomerCache
+from app.lookups import LookupRegistry
+from app.menu import MenuSnapshot
+from app.models.customer import Customer as CustomerModel
+from app.models.items import Items as ItemsModel
+from app.models.items import ItemsCategory as ItemsCategoryModel
+from app.routers import customer, items
+from app.routers.aio import customer as aio_customer
+from app.routers.aio import items as aio_items
+
+BENCH_CPF = "00000000191"
+CATEGORIES = ["Lanche", "Acompanhamento", "Bebida", "Sobremesa"]
+
+
+def seed(sync_url: str):
+    """
+    Make sure the rows read by the benchmark exist.
+
+    :param sync_url: Sync database URL.
+    """
+    engine = create_engine(sync_url)
+    database.Base.metadata.create_all(bind=engine)
+
+    with sessionmaker(bind=engine)() as db_session:
+        if not db_session.scalar(select(ItemsCategoryModel).limit(1)):
+            db_session.add_all(
+                [ItemsCategoryModel(description=desc) for desc in CATEGORIES]
+            )
+            db_session.flush()
+
+        lanche = db_session.scalar(
+            select(ItemsCategoryModel).filter(
+                ItemsCategoryModel.description == "Lanche"
+            )
+        )
+
+        if not db_session.scalar(
+            select(CustomerModel).filter(CustomerModel.cpf == BENCH_CPF)
+        ):
+            db_session.add(
+                CustomerModel(
+                    cpf=BENCH_CPF,
+                    first_name="Bench",
+                    last_name="Mark",
+                    email="bench@example.com",
+                )
+            )
+
+        if not db_session.scalar(
+            select(ItemsModel).filter(ItemsModel.category == lanche.id).limit(1)
+        ):
+            db_session.add_all(
+                [
+                    ItemsModel(
+                        title=f"Lanche {i}",
+                        description="Benchmark item",
+                        category=lanche.id,
+                        amount=100,
+                        price=10.0 + i,
+                    )
+                    for i in range(20)
+                ]
+            )
+
+        db_session.commit()
+
+    engine.dispose()
+
+
+def build_sync_app(sync_url: str) -> tuple[FastAPI, object]:
+    """
+    Build an app with the sync routers bound to `sync_url`.
+    """
+    engine = create_engine(sync_url)
+    session_local = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_db():
+        db_session = session_local()
+        try:
+            yield db_session
+        finally:
+            db_session.close()
+
+    app = bench_app()
+    app.include_router(customer.router, prefix="/customer")
+    app.include_router(items.router, prefix="/items")
+    app.dependency_overrides[database.get_db] = get_db
+
+    return app, engine.dispose
+
+
+def bench_app() -> FastAPI:
+    """
+    App with the shared state the routers read, customer cache disabled so
+    every identify reaches the database.
+    """
+    app = FastAPI()
+    app.lookups = LookupRegistry()
+    app.menu = MenuSnapshot()
+    app.customers = CustomerCache(maxsize=0)
+
+    return app
+
+
+def build_async_app(async_url: str) -> tuple[FastAPI, object]:
+    """
+    Build an app with the async routers bound to `async_url`.
+    """
+    engine = create_async_engine(async_url)
+    session_local = async_sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+    )
+
+    async def get_async_db():
+        async with session_local() as db_session:
+            yield db_session
+
+    app = bench_app()
+    app.include_router(aio_customer.router, prefix="/customer")
+    app.include_router(aio_items.router, prefix="/items")
+    app.dependency_overrides[database.get_async_db] = get_async_db
+
+    return app, engine.dispose
+
+
+async def drive(app: FastAPI, requests: int, concurrency: int) -> dict:
+    """
+    Fire `requests` requests at `app` with `concurrency` clients in flight.
+
+    :return: latency percentiles (ms) and requests per second.
+    """
+    latencies = []
+    counter = iter(range(requests))
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                if i % 2:
+                    response = await client.post(
+                        "/customer/identify", json={"cpf": BENCH_CPF}
+                    )
+                else:
+                    response = await client.get("/items/list/Lanche")
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+
+    return {
+        "rps": requests / elapsed,
+        "p50": quantiles[49] * 1000,
+        "p95": quantiles[94] * 1000,
+        "p99": quantiles[98] * 1000,
+    }
+
+
+async def run(args):
+    # Starlette runs sync routes on anyio's default thread limiter
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+
+    seed(args.sync_url)
+
+    for mode, build, url in (
+        ("sync", build_sync_app, args.sync_url),
+        ("async", build_async_app, args.async_url),
+    ):
+        app, dispose = build(url)
+        await drive(app, min(args.requests, 100), args.concurrency)  # warm up
+        result = await drive(app, args.requests, args.concurrency)
+
+        disposed = dispose()
+        if asyncio.iscoroutine(disposed):
+            await disposed
+
+        print(
+            f"{mode:>5}: {result['rps']:8.1f} req/s  "
+            f"p50 {result['p50']:7.2f} ms  "
+            f"p95 {result['p95']:7.2f} ms  "
+            f"p99 {result['p99']:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument(
+        "--threads", type=int, default=40, help="threadpool size for sync routes"
+    )
+    parser.add_argument("--sync-url", default=database.SQLALCHEMY_DATABASE_URL)
+    parser.add_argument(
+        "--async-url", default=database.SQLALCHEMY_ASYNC_DATABASE_URL
+    )
+
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,287 @@
+"""
+Load test the full order flow offline.
+
+Every virtual user repeats the kiosk flow on the real ASGI app, driven
+in-process through ``httpx.ASGITransport``:
+
+    identify -> menu -> checkout -> create -> update
+
+MongoDB carts, the RabbitMQ broker (behind the outbox relay) and the
+payment service are in-process fakes, and the database is SQLite unless
+``--db-url`` points elsewhere. Latency percentiles and throughput are
+reported per endpoint.
+
+Usage::
+
+    python -m benchmarks.bench_load --flows 500 --concurrency 50
+
+``--json`` writes the results to a file and ``--max-p99`` exits with
+status 1 when an endpoint's p99 (ms) goes over the limit, so the run can
+gate a deploy.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import statistics
+import sys
+import time
+
+import anyio
+import httpx
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import database, main
+from app.models.customer import Customer as CustomerModel
+from app.models.items import Items as ItemsModel
+from app.models.items import ItemsCategory as ItemsCategoryModel
+from app.models.order import OrderStatus as OrderStatusModel
+from app.outbox import OutboxRelay
+from app.payment import PaymentClient
+from benchmarks.fake_payment import in_process_transport
+from benchmarks.fakes import FakeBroker, InMemoryCarts
+
+CATEGORIES = ["Lanche", "Acompanhamento", "Bebida", "Sobremesa"]
+STATUSES = ["Recebido", "Em preparação", "Pronto", "Finalizado"]
+CUSTOMERS = 200
+ITEMS = 40
+
+ENDPOINTS = ["identify", "menu", "checkout", "create", "update"]
+
+
+def seed(session_factory):
+    """
+    Create the tables and the rows the flow reads.
+
+    :param session_factory: Sync session factory.
+    """
+    with session_factory() as db_session:
+        database.Base.metadata.create_all(bind=db_session.get_bind())
+
+        if db_session.scalar(select(func.count()).select_from(ItemsModel)):
+            return
+
+        db_session.add_all(
+            [ItemsCategoryModel(description=desc) for desc in CATEGORIES]
+            + [OrderStatusModel(description=desc) for desc in STATUSES]
+        )
+        db_session.add_all(
+            CustomerModel(
+                cpf=f"{index:011d}",
+                first_name="Cliente",
+                last_name=str(index),
+                email=f"cliente{index}@example.com",
+            )
+            for index in range(CUSTOMERS)
+        )
+        db_session.add_all(
+            ItemsModel(
+                title=f"Item {index}",
+                description="Benchmark item",
+                category=index % len(CATEGORIES) + 1,
+                amount=10**9,
+                price=5.0 + index,
+            )
+            for index in range(ITEMS)
+        )
+        db_session.commit()
+
+
+def use_database(db_url: str, async_db_url: str):
+    """
+    Point the app's session dependencies at the benchmark database.
+
+    :return: Sync session factory and the async engine.
+    """
+    engine = create_engine(db_url)
+    async_engine = create_async_engine(async_db_url)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async_session_factory = async_sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine
+    )
+
+    def get_db():
+        db_session = session_factory()
+        try:
+            yield db_session
+        finally:
+            db_session.close()
+
+    async def get_async_db():
+        async with async_session_factory() as db_session:
+            yield db_session
+
+    main.app.dependency_overrides[database.get_db] = get_db
+    main.app.dependency_overrides[database.get_async_db] = get_async_db
+
+    return session_factory, async_engine
+
+
+async def run_flows(flows: int, concurrency: int) -> tuple[dict, float]:
+    """
+    Run `flows` kiosk flows with `concurrency` virtual users.
+
+    :return: latencies (s) and error count per endpoint, elapsed seconds.
+    """
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    counter = iter(range(flows))
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def call(endpoint: str, method: str, url: str, **kwargs):
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies[endpoint].append(time.perf_counter() - start)
+            if response.is_error:
+                errors[endpoint] += 1
+                return None
+            return response
+
+        async def user():
+            for _ in counter:
+                cpf = f"{random.randrange(CUSTOMERS):011d}"
+                await call("identify", "POST", "/customer/identify", json={"cpf": cpf})
+                await call("menu", "GET", "/items/menu")
+
+                response = await call(
+                    "checkout",
+                    "POST",
+                    "/order/checkout",
+                    json={
+                        "customer_id": int(cpf),
+                        "items": [
+                            {"id": item_id, "amount": random.randint(1, 3)}
+                            for item_id in random.sample(range(1, ITEMS + 1), 3)
+                        ],
+                    },
+                )
+                if response is None:
+                    continue
+
+                external_id = response.json()["external_id"]
+                response = await call(
+                    "create", "POST", "/order/create", json={"external_id": external_id}
+                )
+                if response is None:
+                    continue
+
+                await call(
+                    "update",
+                    "POST",
+                    "/order/update",
+                    json={"external_id": external_id, "status": "Em preparação"},
+                )
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"latencies": latencies, "errors": errors}, elapsed
+
+
+def summarize(results: dict, elapsed: float) -> dict:
+    """
+    Percentiles (ms) and throughput per endpoint.
+    """
+    summary = {}
+
+    for endpoint in ENDPOINTS:
+        latencies = results["latencies"][endpoint]
+        if len(latencies) < 2:
+            continue
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        summary[endpoint] = {
+            "requests": len(latencies),
+            "errors": results["errors"][endpoint],
+            "rps": len(latencies) / elapsed,
+            "p50": quantiles[49] * 1000,
+            "p95": quantiles[94] * 1000,
+            "p99": quantiles[98] * 1000,
+        }
+
+    return summary
+
+
+async def run(args) -> dict:
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+
+    session_factory, async_engine = use_database(args.db_url, args.async_db_url)
+    seed(session_factory)
+
+    main.app.carts = InMemoryCarts()
+    main.app.payment = PaymentClient(
+        transport=in_process_transport(args.payment_delay)
+    )
+    broker = FakeBroker()
+    relay = OutboxRelay(broker, session_factory=session_factory)
+    relay.start()
+
+    await run_flows(min(args.flows, 50), args.concurrency)  # warm up
+    results, elapsed = await run_flows(args.flows, args.concurrency)
+
+    relay.stop()
+    await main.app.payment.aclose()
+    await async_engine.dispose()
+
+    summary = summarize(results, elapsed)
+
+    for endpoint, stats in summary.items():
+        print(
+            f"{endpoint:>8}: {stats['rps']:8.1f} req/s  "
+            f"p50 {stats['p50']:7.2f} ms  "
+            f"p95 {stats['p95']:7.2f} ms  "
+            f"p99 {stats['p99']:7.2f} ms  "
+            f"errors {stats['errors']}"
+        )
+
+    print(
+        f"   flows: {args.flows / elapsed:8.1f} flows/s  "
+        f"events relayed {broker.published}"
+    )
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--flows", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--threads", type=int, default=40, help="threadpool size for sync routes"
+    )
+    parser.add_argument("--db-url", default="sqlite:///./bench_load.db")
+    parser.add_argument(
+        "--async-db-url", default="sqlite+aiosqlite:///./bench_load.db"
+    )
+    parser.add_argument(
+        "--payment-delay", type=float, default=0.0, help="fake service latency (s)"
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument(
+        "--max-p99", type=float, help="fail if any endpoint p99 (ms) is higher"
+    )
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summary, output, indent=2)
+
+    slow = [
+        endpoint
+        for endpoint, stats in summary.items()
+        if args.max_p99 is not None and stats["p99"] > args.max_p99
+    ]
+    if slow or any(stats["errors"] for stats in summary.values()):
+        print(f"Failed: slow {slow}, or requests errored", file=sys.stderr)
+        sys.exit(1)
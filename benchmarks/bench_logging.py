@@ -0,0 +1,126 @@
+"""
+Benchmark per-request logging overhead.
+
+A throwaway app logs what order creation logs (the created order and the
+published message) from a threadpool route, called straight through ASGI.
+Each mode is timed against the same app logging nowhere:
+
+- ``before``: synchronous file sink, messages built with f-strings and the
+  whole order payload logged on publish (the previous behaviour);
+- ``after``: queued JSON sink with request ids (``RequestContextMiddleware``),
+  lazily formatted messages, the order id only on publish and debug records
+  kept for ``--sample-rate`` of the requests (``log_debug_sample_rate``
+  by default).
+
+Usage::
+
+    python -m benchmarks.bench_logging --requests 2000 --cart-items 50
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from fastapi import FastAPI
+from loguru import logger
+
+from app import logs
+from benchmarks.bench_serialization import call
+
+
+def make_payload(items: int) -> dict:
+    return {
+        "id": 1,
+        "external_id": "67b1f2a6c2a3b1d4e5f60718",
+        "status": "Recebido",
+        "items": [
+            {"id": index, "title": f"Item {index}", "amount": 2, "price": 9.5}
+            for index in range(items)
+        ],
+    }
+
+
+def build_app(mode: str, payload: dict) -> FastAPI:
+    app = FastAPI()
+
+    if mode == "after":
+        app.add_middleware(logs.RequestContextMiddleware)
+
+    @app.get("/order/{order_id}")
+    def create_order(order_id: int):
+        if mode == "before":
+            logger.debug(f"Order {order_id} created")
+            logger.debug(f"[RMQ] Publish: {payload}")
+        else:
+            logger.debug("Order {} created", order_id)
+            logger.debug("[RMQ] Published order {}", payload["id"])
+
+        return {"id": order_id}
+
+    return app
+
+
+def add_sink(mode: str, path: str):
+    if mode == "before":
+        return logger.add(path, rotation="100 MB")
+
+    return logger.add(
+        logs.QueuedSink(logs.RotatingFile(path, 100 * 1024 * 1024)),
+        format=logs.json_format,
+        filter=logs.sample_debug,
+    )
+
+
+async def measure(app: FastAPI, requests: int) -> float:
+    """
+    Mean microseconds per request.
+    """
+    await call(app, "/order/0")  # warm up
+
+    start = time.perf_counter()
+    for order_id in range(requests):
+        await call(app, f"/order/{order_id}")
+
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def run(args):
+    payload = make_payload(args.cart_items)
+    if args.sample_rate is not None:
+        logs.conf_settings.log_debug_sample_rate = args.sample_rate
+    logger.remove()
+
+    baseline = {
+        mode: await measure(build_app(mode, payload), args.requests)
+        for mode in ("before", "after")
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("before", "after"):
+            path = os.path.join(directory, f"{mode}.log")
+            handler = add_sink(mode, path)
+
+            elapsed = await measure(build_app(mode, payload), args.requests)
+
+            start = time.perf_counter()
+            logger.remove(handler)  # waits for a queued writer
+            flush = (time.perf_counter() - start) * 1000
+
+            print(
+                f"{mode:>6}: {elapsed:8.1f} us/request  "
+                f"overhead {elapsed - baseline[mode]:8.1f} us  "
+                f"log {os.path.getsize(path) / 1024:8.0f} KiB  "
+                f"flush {flush:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--cart-items", type=int, default=50)
+    parser.add_argument("--sample-rate", type=float, default=None)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
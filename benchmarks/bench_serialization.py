@@ -0,0 +1,174 @@
+"""
+Benchmark per-request serialization cost of large carts and menus.
+
+Each case is served by two throwaway apps, called straight through ASGI so
+no HTTP client or socket is measured:
+
+- ``validated``: the route returns a model and FastAPI validates it again
+  against ``response_model`` before encoding it with the stdlib ``json``
+  (the previous behaviour);
+- ``fast``: ``model_response`` encodes the model as is on an app whose
+  default response class is ``ORJSONResponse``.
+
+Broker payloads of the same carts are timed with ``json`` and ``orjson``.
+
+Usage::
+
+    python -m benchmarks.bench_serialization --cart-items 200 --menu-items 500
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.schemas.items import Item
+from app.schemas.order import OrderCreateResponse
+from app.serialization import model_response
+
+CATEGORIES = ["Lanche", "Acompanhamento", "Bebida", "Sobremesa"]
+
+
+def make_order(items: int) -> OrderCreateResponse:
+    return OrderCreateResponse(
+        id=1,
+        mongo_id="67b1f2a6c2a3b1d4e5f60718",
+        customer_id=42,
+        status="Recebido",
+        items=[
+            {"id": index, "title": f"Item {index}", "amount": 2, "price": 9.5}
+            for index in range(items)
+        ],
+        price=19.0 * items,
+    )
+
+
+def make_menu(items: int) -> List[Item]:
+    return [
+        Item(
+            id=index,
+            title=f"Item {index}",
+            description="Pão, carne, queijo e molho da casa",
+            category=CATEGORIES[index % len(CATEGORIES)],
+            amount=100,
+            price=9.5 + index,
+        )
+        for index in range(items)
+    ]
+
+
+def build_apps(order: OrderCreateResponse, menu: List[Item]) -> dict:
+    validated = FastAPI(default_response_class=JSONResponse)
+    fast = FastAPI(default_response_class=ORJSONResponse)
+
+    @validated.get("/order", response_model=OrderCreateResponse)
+    def validated_order():
+        return order
+
+    @validated.get("/menu", response_model=List[Item])
+    def validated_menu():
+        return menu
+
+    @fast.get("/order", response_model=OrderCreateResponse)
+    def fast_order():
+        return model_response(order)
+
+    @fast.get("/menu", response_model=List[Item])
+    def fast_menu():
+        # Lists have no model of their own, ORJSONResponse still beats
+        # the stdlib encoder after validation
+        return menu
+
+    return {"validated": validated, "fast": fast}
+
+
+async def call(app: FastAPI, path: str) -> bytes:
+    """
+    Run one GET request through the app's ASGI interface.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+
+    return b"".join(body)
+
+
+async def measure(app: FastAPI, path: str, requests: int) -> float:
+    """
+    Mean microseconds per request.
+    """
+    await call(app, path)  # warm up
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, path)
+
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def measure_dumps(dumps, payload, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        dumps(payload)
+
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+async def run(args):
+    order = make_order(args.cart_items)
+    apps = build_apps(order, make_menu(args.menu_items))
+
+    for path in ("/order", "/menu"):
+        results = {
+            mode: await measure(app, path, args.requests)
+            for mode, app in apps.items()
+        }
+        print(
+            f"{path:>8}: validated {results['validated']:8.1f} us  "
+            f"fast {results['fast']:8.1f} us  "
+            f"({results['validated'] / results['fast']:.1f}x)"
+        )
+
+    payload = order.model_dump(mode="json")
+    stdlib = measure_dumps(json.dumps, payload, args.requests)
+    fast = measure_dumps(orjson.dumps, payload, args.requests)
+    print(
+        f" payload: json      {stdlib:8.1f} us  orjson {fast:8.1f} us  "
+        f"({stdlib / fast:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--cart-items", type=int, default=200)
+    parser.add_argument("--menu-items", type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
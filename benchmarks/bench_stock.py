@@ -0,0 +1,133 @@
+"""
+Benchmark stock reservation on one hot item.
+
+``--writers`` threads check out one unit of the same item ``--attempts``
+times each, with less stock than attempts. Each mode starts from
+``--stock`` units:
+
+- ``naive``: the amount is read, checked and written back as a new value
+  in separate statements (read-modify-write), concurrent checkouts both
+  see the same amount, the later write loses the earlier one and more
+  units are sold than there were;
+- ``reserve``: ``app.stock.reserve_stock``, the conditional
+  ``UPDATE ... WHERE amount >= :n`` plus the reservation row, committed at
+  once.
+
+Usage::
+
+    python -m benchmarks.bench_stock --writers 16 --stock 500
+
+The database is SQLite unless ``--db-url`` points elsewhere.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.models.items import Items as ItemsModel
+from app.models.items import ItemsCategory as ItemsCategoryModel
+from app.models.stock import StockReservation
+from app.pricing import CartItemError
+from app.stock import reserve_stock
+
+
+def seed(session_factory, stock: int) -> int:
+    """
+    Create the tables and the hot item.
+
+    :returns: Item id.
+    """
+    with session_factory() as db_session:
+        database.Base.metadata.create_all(bind=db_session.get_bind())
+        db_session.execute(StockReservation.__table__.delete())
+
+        category = ItemsCategoryModel(description="Lanche")
+        db_session.add(category)
+        db_session.flush()
+
+        item = ItemsModel(
+            title="X-Egg",
+            description="Lanche",
+            category=category.id,
+            amount=stock,
+            price=32.0,
+        )
+        db_session.add(item)
+        db_session.commit()
+
+        return item.id
+
+
+def naive(session_factory, item_id: int) -> bool:
+    with session_factory() as db_session:
+        amount = db_session.scalar(
+            select(ItemsModel.amount).where(ItemsModel.id == item_id)
+        )
+
+    if amount < 1:
+        return False
+
+    with session_factory() as db_session:
+        db_session.execute(
+            update(ItemsModel)
+            .where(ItemsModel.id == item_id)
+            .values(amount=amount - 1)
+        )
+        db_session.commit()
+
+    return True
+
+
+def reserve(session_factory, item_id: int) -> bool:
+    with session_factory() as db_session:
+        try:
+            reserve_stock(db_session, [{"id": item_id, "amount": 1}])
+        except CartItemError:
+            return False
+
+    return True
+
+
+def run(mode: str, session_factory, args):
+    item_id = seed(session_factory, args.stock)
+    checkout = naive if mode == "naive" else reserve
+
+    def writer(_):
+        return sum(
+            checkout(session_factory, item_id) for _ in range(args.attempts)
+        )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.writers) as executor:
+        sold = sum(executor.map(writer, range(args.writers)))
+    elapsed = time.perf_counter() - start
+
+    with session_factory() as db_session:
+        left = db_session.get(ItemsModel, item_id).amount
+
+    attempts = args.writers * args.attempts
+    print(
+        f"{mode:>8}: {attempts / elapsed:8.0f} checkouts/s  "
+        f"sold {sold:5d}  left {left:5d}  "
+        f"oversold {max(sold - args.stock, 0):5d}  "
+        f"lost updates {sold - (args.stock - left):5d}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--attempts", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--db-url", default="sqlite:///./bench_stock.db")
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url, pool_size=args.writers)
+    session_factory = sessionmaker(autoflush=False, bind=engine)
+
+    for mode in ("naive", "reserve"):
+        run(mode, session_factory, args)
@@ -0,0 +1,97 @@
+"""
+Local stand-in for the payment service.
+
+Answers ``POST /qrcode`` like the real service, after an optional delay, so
+checkout can be exercised and benchmarked offline, either on a local port
+or in-process through ``in_process_transport``.
+
+Usage::
+
+    python -m benchmarks.fake_payment --port 8001 --delay 0.02
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+import uuid
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+
+class QRCodeRequest(BaseModel):
+    external_id: str
+    value: float
+
+
+def build_app(delay: float = 0.0) -> FastAPI:
+    """
+    Build the fake payment service.
+
+    :param delay: Seconds to wait before answering, simulates service latency.
+    """
+    app = FastAPI()
+
+    @app.post("/qrcode")
+    async def qrcode(payload: QRCodeRequest):
+        if delay:
+            await asyncio.sleep(delay)
+
+        return {
+            "external_id": payload.external_id,
+            "status": "pending",
+            "value": payload.value,
+            "qrcode": uuid.uuid4().hex,
+        }
+
+    return app
+
+
+def in_process_transport(delay: float = 0.0) -> httpx.ASGITransport:
+    """
+    Transport calling the fake service in-process, no socket involved.
+
+    :param delay: Seconds to wait before answering.
+    """
+    return httpx.ASGITransport(app=build_app(delay))
+
+
+class FakePaymentServer:
+    """
+    Fake payment service served by uvicorn on a background thread.
+    """
+
+    def __init__(self, port: int = 8001, delay: float = 0.0):
+        self.url = f"http://127.0.0.1:{port}"
+        self.server = uvicorn.Server(
+            uvicorn.Config(
+                build_app(delay),
+                host="127.0.0.1",
+                port=port,
+                log_level="warning",
+                backlog=4096,
+            )
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    uvicorn.run(build_app(args.delay), host="127.0.0.1", port=args.port)
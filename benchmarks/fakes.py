@@ -0,0 +1,59 @@
+"""
+In-process stand-ins for the services around the app.
+
+They implement just the interface the app calls, so benchmarks can run
+the real routers offline.
+"""
+
+import threading
+from concurrent.futures import Future
+
+from bson.objectid import ObjectId
+
+from app.carts import ORDER_FIELDS
+
+
+class InMemoryCarts:
+    """Stand-in for the MongoDB cart repository."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def create(self, cart: dict) -> str:
+        cart_id = str(ObjectId())
+        self.docs[cart_id] = cart
+        return cart_id
+
+    async def get(self, cart_id: str) -> dict | None:
+        return self.docs.get(cart_id)
+
+    async def get_order(self, cart_id: str) -> dict | None:
+        cart = self.docs.get(cart_id)
+        if cart is None:
+            return None
+        return {field: cart[field] for field in ORDER_FIELDS if field in cart}
+
+    async def mark_ordered(self, cart_id: str) -> bool:
+        return cart_id in self.docs
+
+    async def get_many(self, cart_ids: list) -> dict:
+        return {
+            cart_id: self.docs[cart_id] for cart_id in cart_ids
+            if cart_id in self.docs
+        }
+
+
+class FakeBroker:
+    """Stand-in for the RabbitMQ publisher, confirms every message."""
+
+    def __init__(self):
+        self.published = 0
+        self._lock = threading.Lock()
+
+    def publish(self, body: str) -> Future:
+        with self._lock:
+            self.published += 1
+
+        future = Future()
+        future.set_result(True)
+        return future
@@ -4,4 +4,4 @@
 uv run alembic upgrade head
 
 # Start the application
-uv run uvicorn app.main:app --host 0.0.0.0
+uv run python -m app